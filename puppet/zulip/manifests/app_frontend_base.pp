@@ -163,6 +163,7 @@ class zulip::app_frontend_base {
     'missedmessage_emails',
     'missedmessage_mobile_notifications',
     'outgoing_webhooks',
+    'search_index',
     'thumbnail',
     'user_activity',
     'user_activity_interval',
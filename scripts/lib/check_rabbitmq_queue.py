@@ -23,6 +23,7 @@ normal_queues = [
     "missedmessage_emails",
     "missedmessage_mobile_notifications",
     "outgoing_webhooks",
+    "search_index",
     "thumbnail",
     "user_activity",
     "user_activity_interval",
@@ -68,8 +68,18 @@ app.use(async (ctx, next) => {
     httpRequestDurationSeconds.labels({method, path, status: String(status)}).observe(endTimer());
 });
 
+const render = (content: string, is_display: boolean): string => {
+    httpRequestSizeBytes.labels(String(is_display)).observe(Buffer.byteLength(content, "utf8"));
+    const output = katex.renderToString(content, {displayMode: is_display});
+    httpResponseSizeBytes.labels(String(is_display)).observe(Buffer.byteLength(output, "utf8"));
+    return output;
+};
+
 app.use((ctx, _next) => {
-    if (ctx.request.method !== "POST" || ctx.request.path !== "/") {
+    if (
+        ctx.request.method !== "POST" ||
+        (ctx.request.path !== "/" && ctx.request.path !== "/batch")
+    ) {
         ctx.status = 404;
         return;
     }
@@ -91,6 +101,44 @@ app.use((ctx, _next) => {
         return;
     }
 
+    if (ctx.request.path === "/batch") {
+        // Renders a JSON list of {content, is_display} expressions in
+        // one request, responding with a list of the rendered HTML,
+        // with null for expressions that failed to parse.
+        if (!("expressions" in body) || !Array.isArray(body.expressions)) {
+            ctx.status = 400;
+            ctx.type = "text/plain";
+            ctx.body = "Invalid 'expressions' argument";
+            return;
+        }
+        const expressions: unknown[] = body.expressions;
+        const results: (string | null)[] = [];
+        for (const expression of expressions) {
+            if (
+                typeof expression !== "object" ||
+                expression === null ||
+                !("content" in expression) ||
+                typeof expression.content !== "string"
+            ) {
+                ctx.status = 400;
+                ctx.type = "text/plain";
+                ctx.body = "Invalid 'expressions' argument";
+                return;
+            }
+            const is_display = "is_display" in expression && expression.is_display === true;
+            try {
+                results.push(render(expression.content, is_display));
+            } catch (error) {
+                if (!(error instanceof katex.ParseError)) {
+                    console.error(error);
+                }
+                results.push(null);
+            }
+        }
+        ctx.body = results;
+        return;
+    }
+
     const is_display = "is_display" in body && body.is_display === "true";
 
     if (!("content" in body) || typeof body.content !== "string") {
@@ -101,11 +149,8 @@ app.use((ctx, _next) => {
     }
     const content = body.content;
 
-    httpRequestSizeBytes.labels(String(is_display)).observe(Buffer.byteLength(content, "utf8"));
     try {
-        const output = katex.renderToString(content, {displayMode: is_display});
-        ctx.body = output;
-        httpResponseSizeBytes.labels(String(is_display)).observe(Buffer.byteLength(output, "utf8"));
+        ctx.body = render(content, is_display);
     } catch (error) {
         if (error instanceof katex.ParseError) {
             ctx.status = 400;
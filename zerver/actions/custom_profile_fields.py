@@ -4,6 +4,7 @@ import orjson
 from django.db import transaction
 from django.utils.translation import gettext as _
 
+from zerver.lib.cache import flush_realm_users_snapshot
 from zerver.lib.exceptions import JsonableError
 from zerver.lib.external_accounts import DEFAULT_EXTERNAL_ACCOUNTS
 from zerver.lib.streams import render_stream_description
@@ -19,6 +20,7 @@ def notify_realm_custom_profile_fields(realm: Realm) -> None:
     fields = custom_profile_fields_for_realm(realm.id)
     event = dict(type="custom_profile_fields", fields=[f.as_dict() for f in fields])
     send_event_on_commit(realm, event, active_user_ids(realm.id))
+    flush_realm_users_snapshot(realm.id)
 
 
 @transaction.atomic(durable=True)
@@ -167,6 +169,7 @@ def notify_user_update_custom_profile_data(
     payload = dict(user_id=user_profile.id, custom_profile_field=data)
     event = dict(type="realm_user", op="update", person=payload)
     send_event_on_commit(user_profile.realm, event, get_user_ids_who_can_access_user(user_profile))
+    flush_realm_users_snapshot(user_profile.realm_id)
 
 
 @transaction.atomic(savepoint=False)
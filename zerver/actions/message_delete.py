@@ -5,6 +5,7 @@ from typing import TypedDict
 from zerver.lib import retention
 from zerver.lib.message import event_recipient_ids_for_action_on_messages
 from zerver.lib.retention import move_messages_to_archive
+from zerver.lib.search_index import queue_search_index_update
 from zerver.models import Message, Realm, Stream, UserProfile
 from zerver.tornado.django_api import send_event_on_commit
 
@@ -89,6 +90,7 @@ def _process_grouped_messages_deletion(
         users_to_notify.add(acting_user.id)
 
     move_messages_to_archive(message_ids, realm=realm, chunk_size=archiving_chunk_size)
+    queue_search_index_update(message_ids)
     if stream is not None:
         check_update_first_message_id(realm, stream, message_ids, users_to_notify)
 
@@ -26,6 +26,7 @@ from zerver.actions.message_send import (
 from zerver.actions.uploads import AttachmentChangeResult, check_attachment_reference_change
 from zerver.actions.user_topics import bulk_do_set_user_topic_visibility_policy
 from zerver.lib import utils
+from zerver.lib.cache import flush_web_public_narrow_results
 from zerver.lib.exceptions import (
     JsonableError,
     MessageMoveError,
@@ -50,8 +51,9 @@ from zerver.lib.message import (
 )
 from zerver.lib.message_cache import update_message_cache
 from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.search_index import queue_search_index_update
 from zerver.lib.stream_subscription import get_active_subscriptions_for_stream_id
-from zerver.lib.stream_topic import StreamTopicTarget
+from zerver.lib.stream_topic import StreamTopicTarget, refresh_stream_topics
 from zerver.lib.streams import (
     access_stream_by_id,
     access_stream_by_id_for_message,
@@ -81,9 +83,11 @@ from zerver.lib.topic import (
 )
 from zerver.lib.topic_link_util import get_stream_topic_link_syntax
 from zerver.lib.types import DirectMessageEditRequest, EditHistoryEvent, StreamMessageEditRequest
+from zerver.lib.unread_watermarks import lower_unread_watermarks_for_users
 from zerver.lib.url_encoding import stream_message_url
 from zerver.lib.user_message import bulk_insert_all_ums
 from zerver.lib.user_topics import get_users_with_user_topic_visibility_policy
+from zerver.lib.utils import assert_is_not_none
 from zerver.lib.widget import is_widget_message
 from zerver.models import (
     ArchivedAttachment,
@@ -460,6 +464,7 @@ def do_update_embedded_data(
     message.save(update_fields=update_fields)
 
     update_message_cache([message])
+    queue_search_index_update([message.id])
     event: dict[str, Any] = {
         "type": "update_message",
         "user_id": None,
@@ -682,6 +687,14 @@ def do_update_message(
     realm = user_profile.realm
     attachment_reference_change = AttachmentChangeResult(False, [])
 
+    if isinstance(message_edit_request, StreamMessageEditRequest) and (
+        message_edit_request.orig_stream.is_web_public
+        or message_edit_request.target_stream.is_web_public
+    ):
+        # Edits can change which narrows a message matches, and moves
+        # can take it into or out of a web-public channel.
+        flush_web_public_narrow_results(realm.id)
+
     ums = UserMessage.objects.filter(message=target_message.id)
 
     def user_info(um: UserMessage) -> dict[str, Any]:
@@ -732,6 +745,7 @@ def do_update_message(
             save_message_for_edit_use_case(message=target_message)
 
             event["message_ids"] = sorted(update_message_cache([target_message]))
+            queue_search_index_update(event["message_ids"])
             users_to_be_notified = list(map(user_info, ums))
             send_event_on_commit(user_profile.realm, event, users_to_be_notified)
 
@@ -896,6 +910,16 @@ def do_update_message(
             user_ids_gaining_usermessages, changed_message_ids, UserMessage.flags.read
         )
 
+        # Users' unread messages in the old channel may be older than
+        # their first unread message in the new channel.
+        lower_unread_watermarks_for_users(
+            UserMessage.objects.filter(message_id__in=changed_message_ids)
+            .extra(where=[UserMessage.where_unread()])  # noqa: S610
+            .values_list("user_profile_id", flat=True)
+            .distinct(),
+            min(changed_message_ids),
+        )
+
         # Delete UserMessage objects for users who will no
         # longer have access to these messages.  Note: This could be
         # very expensive, since it's N guest users x M messages.
@@ -940,8 +964,17 @@ def do_update_message(
     # freshly-fetched-from-the-database changed messages.
     changed_messages = save_changes_for_propagation_mode()
 
+    if message_edit_request.is_message_moved:
+        refresh_stream_topics(
+            [
+                (realm.id, assert_is_not_none(stream_being_edited.recipient_id), orig_topic_name),
+                (realm.id, assert_is_not_none(target_stream.recipient_id), target_topic_name),
+            ]
+        )
+
     realm_id = target_message.realm_id
     event["message_ids"] = sorted(update_message_cache(changed_messages, realm_id))
+    queue_search_index_update(event["message_ids"])
 
     # The following blocks arranges that users who are subscribed to a
     # stream and can see history from before they subscribed get
@@ -18,6 +18,7 @@ from zerver.lib.message import (
 from zerver.lib.queue import queue_event_on_commit
 from zerver.lib.stream_subscription import get_subscribed_stream_recipient_ids_for_user
 from zerver.lib.topic import filter_by_topic_name_via_message
+from zerver.lib.unread_watermarks import lower_unread_watermarks_for_users
 from zerver.lib.user_message import DEFAULT_HISTORICAL_FLAGS, create_historical_user_messages
 from zerver.models import Message, Recipient, UserMessage, UserProfile
 from zerver.tornado.django_api import send_event_on_commit, send_event_rollback_unsafe
@@ -384,6 +385,8 @@ def do_update_message_flags(
             # details on the messages required to update the client's
             # `unread_msgs` data structure.
             raw_unread_data = get_raw_unread_data(user_profile, messages)
+            if messages:
+                lower_unread_watermarks_for_users([user_profile.id], min(messages))
             event["message_details"] = format_unread_message_details(
                 user_profile.id, raw_unread_data
             )
@@ -24,7 +24,11 @@ from zerver.actions.user_topics import (
 )
 from zerver.lib.addressee import Addressee
 from zerver.lib.alert_words import get_alert_word_automaton
-from zerver.lib.cache import cache_with_key, user_profile_delivery_email_cache_key
+from zerver.lib.cache import (
+    cache_with_key,
+    flush_web_public_narrow_results,
+    user_profile_delivery_email_cache_key,
+)
 from zerver.lib.create_user import create_user
 from zerver.lib.exceptions import (
     DirectMessageInitiationError,
@@ -62,11 +66,12 @@ from zerver.lib.notification_data import (
 from zerver.lib.query_helpers import query_for_ids
 from zerver.lib.queue import queue_event_on_commit
 from zerver.lib.recipient_users import recipient_for_user_profiles
+from zerver.lib.search_index import queue_search_index_update
 from zerver.lib.stream_subscription import (
     get_subscriptions_for_send_message,
     num_subscribers_for_stream_id,
 )
-from zerver.lib.stream_topic import StreamTopicTarget
+from zerver.lib.stream_topic import StreamTopicTarget, add_messages_to_stream_topics
 from zerver.lib.streams import (
     access_stream_for_send_message,
     ensure_stream,
@@ -79,6 +84,7 @@ from zerver.lib.thumbnail import get_user_upload_previews, rewrite_thumbnailed_i
 from zerver.lib.timestamp import timestamp_to_datetime
 from zerver.lib.topic import get_topic_display_name, participants_for_topic
 from zerver.lib.topic_link_util import get_stream_link_syntax
+from zerver.lib.unread_watermarks import lower_unread_watermarks_for_recipients
 from zerver.lib.url_preview.types import UrlEmbedData
 from zerver.lib.user_groups import (
     check_any_user_has_permission_by_role,
@@ -880,6 +886,19 @@ def do_send_messages(
     user_message_flags: dict[int, dict[int, list[str]]] = defaultdict(dict)
 
     Message.objects.bulk_create(send_request.message for send_request in send_message_requests)
+    channel_message_ids = [
+        send_request.message.id
+        for send_request in send_message_requests
+        if send_request.message.is_channel_message
+    ]
+    transaction.on_commit(lambda: add_messages_to_stream_topics(channel_message_ids))
+    first_channel_message_ids: dict[int, int] = {}
+    for send_request in send_message_requests:
+        if send_request.message.is_channel_message:
+            first_channel_message_ids.setdefault(
+                send_request.message.recipient_id, send_request.message.id
+            )
+    lower_unread_watermarks_for_recipients(first_channel_message_ids)
 
     # Claim attachments in message
     for send_request in send_message_requests:
@@ -1187,6 +1206,8 @@ def do_send_messages(
                 event["stream_name"] = send_request.stream.name
             if send_request.stream.invite_only:
                 event["invite_only"] = True
+            if send_request.stream.is_web_public:
+                flush_web_public_narrow_results(send_request.stream.realm_id)
             if send_request.stream.first_message_id is None:
                 send_request.stream.first_message_id = send_request.message.id
                 stream_update_fields.append("first_message_id")
@@ -1259,6 +1280,8 @@ def do_send_messages(
                     },
                 )
 
+    queue_search_index_update(send_request.message.id for send_request in send_message_requests)
+
     sent_message_results = [
         SentMessageResult(
             message_id=send_request.message.id,
@@ -14,12 +14,8 @@ from zerver.actions.default_streams import (
     do_remove_streams_from_default_stream_group,
 )
 from zerver.actions.message_send import internal_send_stream_message
-from zerver.lib.cache import (
-    cache_delete_many,
-    cache_set,
-    display_recipient_cache_key,
-    to_dict_cache_key_id,
-)
+from zerver.lib.cache import cache_delete_many, to_dict_cache_key_id
+from zerver.lib.display_recipient import set_stream_display_recipient
 from zerver.lib.exceptions import JsonableError
 from zerver.lib.mention import silent_mention_syntax_for_user, silent_mention_syntax_for_user_group
 from zerver.lib.message import get_last_message_id
@@ -35,6 +31,7 @@ from zerver.lib.stream_subscription import (
     get_user_ids_for_streams,
     get_users_for_streams,
 )
+from zerver.lib.stream_topic import rebuild_stream_topics
 from zerver.lib.stream_traffic import get_streams_traffic
 from zerver.lib.streams import (
     can_access_stream_metadata_user_ids,
@@ -261,7 +258,7 @@ def do_unarchive_stream(stream: Stream, new_name: str, *, acting_user: UserProfi
     ChannelEmailAddress.objects.filter(realm=realm, channel=stream).update(deactivated=False)
 
     # Update caches
-    cache_set(display_recipient_cache_key(stream.recipient_id), new_name, pickled_tupled=False)
+    set_stream_display_recipient(stream.recipient_id, new_name)
     messages = Message.objects.filter(
         # Uses index: zerver_message_realm_recipient_id
         realm_id=realm.id,
@@ -382,6 +379,7 @@ def merge_streams(
         recipient=recipient_to_destroy,
     ).update(recipient=recipient_to_keep)
     bulk_delete_cache_keys(message_ids_to_clear)
+    rebuild_stream_topics(realm.id, [recipient_to_keep.id, recipient_to_destroy.id])
 
     # Remove subscriptions to the old stream.
     if len(subs_to_deactivate) > 0:
@@ -1516,7 +1514,7 @@ def do_rename_stream(stream: Stream, new_name: str, user_profile: UserProfile) -
         recipient_id=recipient_id,
     ).only("id")
 
-    cache_set(display_recipient_cache_key(recipient_id), stream.name, pickled_tupled=False)
+    set_stream_display_recipient(recipient_id, stream.name)
 
     # Delete cache entries for everything else, which is cheaper and
     # clearer than trying to set them. display_recipient is the out of
@@ -2,24 +2,31 @@
 import hashlib
 import logging
 import os
+import pickle
 import re
 import secrets
 import sys
 import time
 import traceback
+from collections import OrderedDict
 from collections.abc import Callable, Iterable, Iterator, Sequence
 from functools import _lru_cache_wrapper, lru_cache, wraps
 from itertools import islice, product
+from threading import Lock
 from typing import TYPE_CHECKING, Any, Generic, TypeVar
 
+import bmemcached
+import redis
 from bmemcached.exceptions import MemcachedException
 from django.conf import settings
 from django.core.cache import caches
 from django.core.cache.backends.base import BaseCache
+from django.db import transaction
 from django.db.models import Q, QuerySet
 from typing_extensions import ParamSpec
 
 from scripts.lib.zulip_tools import DEPLOYMENTS_DIR, get_recent_deployments
+from zerver.lib.cache_stats import record_cache_stat, record_cache_time, record_value_sizes
 
 if TYPE_CHECKING:
     # These modules have to be imported for type annotations but
@@ -51,10 +58,12 @@ def remote_cache_stats_start() -> None:
     remote_cache_time_start = time.time()
 
 
-def remote_cache_stats_finish() -> None:
+def remote_cache_stats_finish(keys: Sequence[str] = ()) -> None:
     global remote_cache_total_time, remote_cache_total_requests
     remote_cache_total_requests += 1
-    remote_cache_total_time += time.time() - remote_cache_time_start
+    elapsed = time.time() - remote_cache_time_start
+    remote_cache_total_time += elapsed
+    record_cache_time(list(keys), elapsed)
 
 
 def update_cached_cache_key_prefixes() -> list[str]:
@@ -144,18 +153,282 @@ def get_cache_backend(cache_name: str | None) -> BaseCache:
     return caches[cache_name]
 
 
+# The errors from the remote cache that we log and continue past when
+# setting values; see settings.REMOTE_CACHE_BACKEND.
+REMOTE_CACHE_ERRORS = (MemcachedException, redis.exceptions.RedisError)
+
+
+def disconnect_remote_cache() -> None:
+    """Closes the remote cache's connections before forking worker
+    processes, so that they don't share the parent's.  redis-py
+    notices that it has been forked and reconnects by itself."""
+    _cache = get_cache_backend(None)._cache  # type: ignore[attr-defined] # not in stubs
+    if isinstance(_cache, bmemcached.Client):
+        _cache.disconnect_all()
+
+
+# Limits for the per-process LocalCache below.
+LOCAL_CACHE_MAX_ENTRIES = 10000
+LOCAL_CACHE_CHECK_INTERVAL = 1.0
+# How many invalidations of a family a process can fall behind before
+# it drops all of its entries for that family, rather than reading
+# the invalidation log.
+LOCAL_CACHE_MAX_LOG_ENTRIES = 100
+
+
+def local_cache_version_cache_key(family: str) -> str:
+    return f"local_cache_version:{family}"
+
+
+def local_cache_invalidation_cache_key(family: str, version: int) -> str:
+    return f"local_cache_invalidation:{family}:{version}"
+
+
+class LocalCache:
+    """A per-process LRU cache in front of the remote cache, for the key
+    families (the part of a cache key before its first ":") listed in
+    settings.LOCAL_CACHE_TTLS, which maps each family to how many
+    seconds its entries may be reused for.
+
+    Values are stored pickled, so that each caller gets its own copy,
+    just as they would from memcached.  Deleting a key (e.g. from one
+    of the flush_* signal handlers) evicts it from this process
+    immediately, and records it in an invalidation log for its family
+    in the remote cache, under a version number which it increments.
+    Every process checks those versions at most every
+    LOCAL_CACHE_CHECK_INTERVAL seconds, and evicts just the keys logged
+    since the version it last saw; if it can't tell what changed, it
+    drops all of its entries for that family.
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        # Maps a prefixed key to its family, expiry time and pickled value.
+        self.entries: OrderedDict[str, tuple[str, float, bytes]] = OrderedDict()
+        # Maps a prefixed version key to the last version we saw.
+        self.versions: dict[str, int | None] = {}
+        self.next_check = 0.0
+
+    def get_ttl(self, key: str) -> int | None:
+        return settings.LOCAL_CACHE_TTLS.get(key.split(":", 1)[0])
+
+    def check_versions(self) -> None:
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + LOCAL_CACHE_CHECK_INTERVAL
+
+        cache_backend = get_cache_backend(None)
+        version_keys = {
+            family: KEY_PREFIX + local_cache_version_cache_key(family)
+            for family in settings.LOCAL_CACHE_TTLS
+        }
+        remote_cache_stats_start()
+        versions = cache_backend.get_many(list(version_keys.values()))
+        remote_cache_stats_finish()
+
+        changed_families = set()
+        log_keys: dict[str, list[str]] = {}
+        for family, version_key in version_keys.items():
+            version = versions.get(version_key)
+            last_version = self.versions.get(version_key)
+            if version == last_version:
+                continue
+            if (
+                version is None
+                or last_version is None
+                or not 0 < version - last_version <= LOCAL_CACHE_MAX_LOG_ENTRIES
+            ):
+                changed_families.add(family)
+            else:
+                log_keys[family] = [
+                    KEY_PREFIX + local_cache_invalidation_cache_key(family, logged_version)
+                    for logged_version in range(last_version + 1, version + 1)
+                ]
+            self.versions[version_key] = version
+
+        invalidated_keys = set()
+        if log_keys:
+            remote_cache_stats_start()
+            log = cache_backend.get_many([key for keys in log_keys.values() for key in keys])
+            remote_cache_stats_finish()
+            for family, keys in log_keys.items():
+                if not all(key in log for key in keys):
+                    # Either those entries expired, or they are still
+                    # being written.
+                    changed_families.add(family)
+                    continue
+                for key in keys:
+                    invalidated_keys.update(KEY_PREFIX + logged_key for logged_key in log[key])
+
+        if changed_families or invalidated_keys:
+            with self.lock:
+                for key in invalidated_keys:
+                    self.entries.pop(key, None)
+                for key, (family, expires, value) in list(self.entries.items()):
+                    if family in changed_families:
+                        del self.entries[key]
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        if not settings.LOCAL_CACHE_TTLS:
+            return {}
+        self.check_versions()
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(KEY_PREFIX + key)
+                if entry is None:
+                    continue
+                family, expires, value = entry
+                if expires < now:
+                    del self.entries[KEY_PREFIX + key]
+                    continue
+                self.entries.move_to_end(KEY_PREFIX + key)
+                found[key] = value
+        # These were pickled by set_many in this process.
+        return {key: pickle.loads(value) for key, value in found.items()}  # noqa: S301
+
+    def set_many(self, items: dict[str, Any]) -> None:
+        if not settings.LOCAL_CACHE_TTLS:
+            return
+        now = time.monotonic()
+        for key, val in items.items():
+            ttl = self.get_ttl(key)
+            if ttl is None or val is None:
+                continue
+            value = pickle.dumps(val, protocol=5)
+            with self.lock:
+                self.entries[KEY_PREFIX + key] = (key.split(":", 1)[0], now + ttl, value)
+                self.entries.move_to_end(KEY_PREFIX + key)
+                while len(self.entries) > LOCAL_CACHE_MAX_ENTRIES:
+                    self.entries.popitem(last=False)
+
+    def delete_many(self, keys: list[str]) -> None:
+        if not settings.LOCAL_CACHE_TTLS:
+            return
+        keys_by_family: dict[str, list[str]] = {}
+        with self.lock:
+            for key in keys:
+                if self.get_ttl(key) is not None:
+                    keys_by_family.setdefault(key.split(":", 1)[0], []).append(key)
+                    self.entries.pop(KEY_PREFIX + key, None)
+
+        # Log the keys for the other processes, including those of
+        # other deployments.
+        cache_backend = get_cache_backend(None)
+        for prefix, (family, family_keys) in product(
+            get_all_cache_key_prefixes(), keys_by_family.items()
+        ):
+            version_key = prefix + local_cache_version_cache_key(family)
+            try:
+                cache_backend.add(version_key, 0, timeout=None)
+                version = cache_backend.incr(version_key)
+                cache_backend.set(
+                    prefix + local_cache_invalidation_cache_key(family, version),
+                    family_keys,
+                    timeout=settings.LOCAL_CACHE_TTLS[family],
+                )
+            except (*REMOTE_CACHE_ERRORS, ValueError) as e:
+                # Other processes will drop the family's entries once
+                # its version, or its log entry, is missing.
+                logger.exception(e)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache()
+
+
+# With coalesce=True, cache_with_key lets only one process at a time
+# compute a missing value; the process holding the lease has up to
+# CACHE_LEASE_TIMEOUT seconds to do so, and the others wait up to
+# CACHE_LEASE_WAIT seconds for its result before giving up and
+# computing it themselves.
+CACHE_LEASE_TIMEOUT = 10
+CACHE_LEASE_WAIT = 2.0
+CACHE_LEASE_POLL_INTERVAL = 0.05
+
+
+def cache_lease_key(key: str) -> str:
+    return f"cache_lease:{hashlib.sha1(key.encode()).hexdigest()}"
+
+
+def acquire_cache_lease(key: str, cache_name: str | None = None) -> str | None:
+    """Returns a token identifying the lease, or None if another
+    process holds it."""
+    final_key = KEY_PREFIX + cache_lease_key(key)
+    token = secrets.token_hex(16)
+    remote_cache_stats_start()
+    try:
+        acquired = get_cache_backend(cache_name).add(final_key, token, timeout=CACHE_LEASE_TIMEOUT)
+    except REMOTE_CACHE_ERRORS as e:
+        # Without the remote cache, there's nothing to wait for.
+        logger.exception(e)
+        acquired = True
+    remote_cache_stats_finish()
+    return token if acquired else None
+
+
+def release_cache_lease(key: str, token: str, cache_name: str | None = None) -> None:
+    final_key = KEY_PREFIX + cache_lease_key(key)
+    cache_backend = get_cache_backend(cache_name)
+    remote_cache_stats_start()
+    try:
+        # If we took longer than CACHE_LEASE_TIMEOUT, the lease may
+        # have expired and been taken by another process, whose lease
+        # we mustn't release.  There's a small window between the get
+        # and the delete, but it's only the lease that's at stake.
+        if cache_backend.get(final_key) == token:
+            cache_backend.delete(final_key)
+    except REMOTE_CACHE_ERRORS as e:
+        # The lease will expire on its own.
+        logger.exception(e)
+    remote_cache_stats_finish()
+
+
+def wait_for_cache_value(key: str, cache_name: str | None = None) -> Any:
+    # We poll the backend directly, rather than with cache_get, so
+    # that the polls aren't recorded as cache misses.
+    final_key = KEY_PREFIX + key
+    cache_backend = get_cache_backend(cache_name)
+    deadline = time.monotonic() + CACHE_LEASE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_LEASE_POLL_INTERVAL)
+        remote_cache_stats_start()
+        try:
+            val = cache_backend.get(final_key)
+        except REMOTE_CACHE_ERRORS as e:
+            logger.exception(e)
+            return None
+        finally:
+            remote_cache_stats_finish()
+        if val is not None:
+            return val
+    return None
+
+
 def cache_with_key(
     keyfunc: Callable[ParamT, str],
     cache_name: str | None = None,
     timeout: int | None = None,
     pickled_tupled: bool = True,
+    coalesce: bool = False,
 ) -> Callable[[Callable[ParamT, ReturnT]], Callable[ParamT, ReturnT]]:
     """Decorator which applies Django caching to a function.
 
     Decorator argument is a function which computes a cache key
     from the original function's arguments.  You are responsible
     for avoiding collisions with other uses of this decorator or
-    other uses of caching."""
+    other uses of caching.
+
+    Set coalesce for expensive functions of popular keys, so that
+    when the key is missing, processes wait for one of them to
+    compute it rather than all running the same queries at once."""
+
+    assert pickled_tupled or not coalesce
 
     def decorator(func: Callable[ParamT, ReturnT]) -> Callable[ParamT, ReturnT]:
         @wraps(func)
@@ -177,16 +450,32 @@ def cache_with_key(
             if val is not None and pickled_tupled:
                 return val[0]
 
-            val = func(*args, **kwargs)
-            if isinstance(val, QuerySet):
-                logging.error(
-                    "cache_with_key attempted to store a full QuerySet object -- declining to cache",
-                    stack_info=True,
-                )
-            else:
-                cache_set(
-                    key, val, cache_name=cache_name, timeout=timeout, pickled_tupled=pickled_tupled
-                )
+            lease_token = None
+            if coalesce:
+                lease_token = acquire_cache_lease(key, cache_name=cache_name)
+                if lease_token is None:
+                    val = wait_for_cache_value(key, cache_name=cache_name)
+                    if val is not None:
+                        return val[0]
+
+            try:
+                val = func(*args, **kwargs)
+                if isinstance(val, QuerySet):
+                    logging.error(
+                        "cache_with_key attempted to store a full QuerySet object -- declining to cache",
+                        stack_info=True,
+                    )
+                else:
+                    cache_set(
+                        key,
+                        val,
+                        cache_name=cache_name,
+                        timeout=timeout,
+                        pickled_tupled=pickled_tupled,
+                    )
+            finally:
+                if lease_token is not None:
+                    release_cache_lease(key, lease_token, cache_name=cache_name)
 
             return val
 
@@ -241,30 +530,50 @@ def cache_set(
         val = (val,)
     try:
         cache_backend.set(final_key, val, timeout=timeout)
-    except MemcachedException as e:
+    except REMOTE_CACHE_ERRORS as e:
         logger.exception(e)
-    remote_cache_stats_finish()
+    remote_cache_stats_finish([key])
+    record_cache_stat([key], "sets")
+    record_value_sizes({key: val})
+    if cache_name is None:
+        local_cache.set_many({key: val})
 
 
 def cache_get(key: str, cache_name: str | None = None) -> Any:
     final_key = KEY_PREFIX + key
     validate_cache_key(final_key)
 
+    if cache_name is None and (local_ret := local_cache.get_many([key])):
+        record_cache_stat([key], "local_hits")
+        return local_ret[key]
+
     remote_cache_stats_start()
     cache_backend = get_cache_backend(cache_name)
     ret = cache_backend.get(final_key)
-    remote_cache_stats_finish()
+    remote_cache_stats_finish([key])
+    record_cache_stat([key], "hits" if ret is not None else "misses")
+    if cache_name is None:
+        local_cache.set_many({key: ret})
     return ret
 
 
 def cache_get_many(keys: list[str], cache_name: str | None = None) -> dict[str, Any]:
-    keys = [KEY_PREFIX + key for key in keys]
     for key in keys:
-        validate_cache_key(key)
+        validate_cache_key(KEY_PREFIX + key)
+    local_ret = local_cache.get_many(keys) if cache_name is None else {}
+    record_cache_stat(local_ret, "local_hits")
+    remote_keys = [key for key in keys if key not in local_ret]
+    if not remote_keys:
+        return local_ret
     remote_cache_stats_start()
-    ret = get_cache_backend(cache_name).get_many(keys)
-    remote_cache_stats_finish()
-    return {key.removeprefix(KEY_PREFIX): value for key, value in ret.items()}
+    ret = get_cache_backend(cache_name).get_many([KEY_PREFIX + key for key in remote_keys])
+    remote_cache_stats_finish(remote_keys)
+    remote_ret = {key.removeprefix(KEY_PREFIX): value for key, value in ret.items()}
+    record_cache_stat(remote_ret, "hits")
+    record_cache_stat((key for key in remote_keys if key not in remote_ret), "misses")
+    if cache_name is None:
+        local_cache.set_many(remote_ret)
+    return {**remote_ret, **local_ret}
 
 
 def safe_cache_get_many(keys: list[str], cache_name: str | None = None) -> dict[str, Any]:
@@ -292,13 +601,16 @@ def cache_set_many(
         new_key = KEY_PREFIX + key
         validate_cache_key(new_key)
         new_items[new_key] = item
-    items = new_items
     remote_cache_stats_start()
     try:
-        get_cache_backend(cache_name).set_many(items, timeout=timeout)
-    except MemcachedException as e:
+        get_cache_backend(cache_name).set_many(new_items, timeout=timeout)
+    except REMOTE_CACHE_ERRORS as e:
         logger.exception(e)
-    remote_cache_stats_finish()
+    remote_cache_stats_finish(list(items))
+    record_cache_stat(items, "sets")
+    record_value_sizes(items)
+    if cache_name is None:
+        local_cache.set_many(items)
 
 
 def safe_cache_set_many(
@@ -327,6 +639,7 @@ def cache_delete(key: str, cache_name: str | None = None) -> None:
 
 
 def cache_delete_many(items: Iterable[str], cache_name: str | None = None) -> None:
+    items = list(items)
     remote_cache_stats_start()
     keys = iter(e[0] + e[1] for e in product(get_all_cache_key_prefixes(), items))
     while True:
@@ -336,7 +649,12 @@ def cache_delete_many(items: Iterable[str], cache_name: str | None = None) -> No
         for key in batch:
             validate_cache_key(key, auto_prepend_prefix=False)
         get_cache_backend(cache_name).delete_many(batch)
-    remote_cache_stats_finish()
+    remote_cache_stats_finish(items)
+    record_cache_stat(items, "deletes")
+    if cache_name is None:
+        # Only once the keys are gone from the remote cache, so that
+        # other processes don't refill their copies with old values.
+        local_cache.delete_many(items)
 
 
 def filter_good_and_bad_keys(keys: list[str]) -> tuple[list[str], list[str]]:
@@ -377,7 +695,8 @@ CompressedItemT = TypeVar("CompressedItemT")
 # * setter: Function to call before storing items to cache (e.g. compression)
 # * extractor: Function to call on items returned from cache
 #   (e.g. decompression).  Should be the inverse of the setter
-#   function.
+#   function; it can return None for values it can't decode, which
+#   are then fetched from the database as if they were missing.
 # * id_fetcher: Function mapping an object from database => object_id
 #   (in case we're using a key more complex than obj.id)
 # * cache_transformer: Function mapping an object from database =>
@@ -388,7 +707,7 @@ def generic_bulk_cached_fetch(
     query_function: Callable[[list[ObjKT]], Iterable[ItemT]],
     object_ids: Sequence[ObjKT],
     *,
-    extractor: Callable[[CompressedItemT], CacheItemT],
+    extractor: Callable[[CompressedItemT], CacheItemT | None],
     setter: Callable[[CacheItemT], CompressedItemT],
     id_fetcher: Callable[[ItemT], ObjKT],
     cache_transformer: Callable[[ItemT], CacheItemT],
@@ -418,7 +737,10 @@ def generic_bulk_cached_fetch(
         [cache_keys[object_id] for object_id in object_ids],
     )
 
-    cached_objects = {key: extractor(val) for key, val in cached_objects_compressed.items()}
+    cached_objects: dict[str, CacheItemT] = {}
+    for key, val in cached_objects_compressed.items():
+        if (item := extractor(val)) is not None:
+            cached_objects[key] = item
     needed_ids = [
         object_id for object_id in object_ids if cache_keys[object_id] not in cached_objects
     ]
@@ -532,6 +854,34 @@ def realm_user_dicts_cache_key(realm_id: int) -> str:
     return f"realm_user_dicts:{realm_id}"
 
 
+def realm_users_snapshot_version_cache_key(realm_id: int) -> str:
+    return f"realm_users_snapshot_version:{realm_id}"
+
+
+def realm_users_snapshot_cache_key(
+    realm_id: int,
+    version: str,
+    role: int,
+    client_gravatar: bool,
+    user_avatar_url_field_optional: bool,
+) -> str:
+    return (
+        f"realm_users_snapshot:{realm_id}:{version}:{role}"
+        f":{int(client_gravatar)}:{int(user_avatar_url_field_optional)}"
+    )
+
+
+def flush_realm_users_snapshot(realm_id: int) -> None:
+    # The snapshots are keyed by this version, so deleting it makes the
+    # next /register build a new snapshot; the old ones just expire.
+    # We delete it again once the change is committed, since a
+    # concurrent /register could otherwise cache a snapshot from
+    # before it.
+    key = realm_users_snapshot_version_cache_key(realm_id)
+    cache_delete(key)
+    transaction.on_commit(lambda: cache_delete(key))
+
+
 def get_muting_users_cache_key(muted_user_id: int) -> str:
     return f"muting_users_list:{muted_user_id}"
 
@@ -631,6 +981,7 @@ def flush_user_profile(
     # the fields in the dict or become (in)active
     if changed(update_fields, realm_user_dict_fields):
         cache_delete(realm_user_dicts_cache_key(user_profile.realm_id))
+        flush_realm_users_snapshot(user_profile.realm_id)
 
     if changed(update_fields, ["is_active"]):
         cache_delete(active_user_ids_cache_key(user_profile.realm_id))
@@ -721,6 +1072,11 @@ def flush_stream(
     ):
         cache_delete(bot_dicts_in_realm_cache_key(stream.realm_id))
 
+    if changed(update_fields, ["is_web_public"]) or (
+        stream.is_web_public and changed(update_fields, ["name", "deactivated", "invite_only"])
+    ):
+        flush_web_public_narrow_results(stream.realm_id)
+
 
 def flush_used_upload_space_cache(
     *,
@@ -746,6 +1102,40 @@ def open_graph_description_cache_key(content: bytes, request_url: str) -> str:
     return f"open_graph_description_path:{hashlib.sha1(request_url.encode()).hexdigest()}"
 
 
+def katex_rendered_tex_cache_key(tex: str, is_inline: bool) -> str:
+    mode = "inline" if is_inline else "display"
+    return f"katex_rendered_tex:{mode}:{hashlib.sha256(tex.encode()).hexdigest()}"
+
+
+def web_public_narrow_results_generation_cache_key(realm_id: int) -> str:
+    return f"web_public_narrow_results_generation:{realm_id}"
+
+
+def web_public_narrow_results_cache_key(realm_id: int, generation: str, narrow_hash: str) -> str:
+    return f"web_public_narrow_results:{realm_id}:{generation}:{narrow_hash}"
+
+
+def flush_web_public_narrow_results(realm_id: int) -> None:
+    # Deleting the generation orphans all of the realm's cached
+    # results.  We do so only once the change is committed, since a
+    # concurrent request could otherwise cache results from before it.
+    transaction.on_commit(
+        lambda: cache_delete(web_public_narrow_results_generation_cache_key(realm_id))
+    )
+
+
+def unread_watermark_cache_key(user_profile_id: int, recipient_id: int) -> str:
+    return f"unread_watermark:{user_profile_id}:{recipient_id}"
+
+
+def unread_watermark_user_floor_cache_key(user_profile_id: int, bucket: int) -> str:
+    return f"unread_watermark_user_floor:{user_profile_id}:{bucket}"
+
+
+def unread_watermark_recipient_floor_cache_key(recipient_id: int, bucket: int) -> str:
+    return f"unread_watermark_recipient_floor:{recipient_id}:{bucket}"
+
+
 def zoom_server_access_token_cache_key(account_id: str) -> str:
     return f"zoom_server_to_server_access_token:{account_id}"
 
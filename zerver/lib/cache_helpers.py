@@ -1,7 +1,8 @@
 # See https://zulip.readthedocs.io/en/latest/subsystems/caching.html for docs
 import logging
+import time
 from collections.abc import Callable, Iterable
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Any
 
 from django.conf import settings
@@ -15,16 +16,28 @@ from django.utils.timezone import now as timezone_now
 # loop
 from analytics.models import RealmCount
 from zerver.lib.cache import (
+    bulk_cached_fetch,
     cache_set_many,
+    generic_bulk_cached_fetch,
     get_remote_cache_requests,
     get_remote_cache_time,
+    to_dict_cache_key_id,
+    user_profile_by_api_key_cache_key,
+    user_profile_by_id_cache_key,
     user_profile_narrow_by_id_cache_key,
 )
 from zerver.lib.safe_session_cached_db import SessionStore
 from zerver.lib.sessions import session_engine
-from zerver.models import Client, UserProfile
+from zerver.models import Client, Message, Realm, UserActivityInterval, UserPresence, UserProfile
 from zerver.models.clients import get_client_cache_key
-from zerver.models.users import base_get_user_narrow_queryset
+from zerver.models.users import (
+    active_non_guest_user_ids,
+    active_user_ids,
+    base_get_user_narrow_queryset,
+    base_get_user_queryset,
+    get_bot_dicts_in_realm,
+    get_realm_user_dicts,
+)
 
 
 def get_narrow_users() -> QuerySet[UserProfile]:
@@ -137,3 +150,134 @@ def fill_remote_cache(cache: str) -> None:
         get_remote_cache_requests() - remote_cache_requests_start,
         get_remote_cache_time() - remote_cache_time_start,
     )
+
+
+# The caches above are filled in full on every restart, but most
+# caches are only filled on demand.  After memcached restarts (or a
+# deploy changes the cache key prefix), the first requests from each
+# active user pay for refilling them.  warm_caches fills them ahead of
+# those requests, starting with the most recently active users and
+# their realms, and then those realms' recent messages.  It only
+# queries the database for values which are missing from the cache,
+# and pauses between batches so that it doesn't compete with real
+# traffic for the database.
+CACHE_WARMER_SENTINEL_KEY = "cache_warmer_sentinel"
+
+
+def get_recently_active_user_ids(since: datetime) -> list[int]:
+    """Returns the IDs of the users who have been active since the
+    given time, most recently active first.  Presence covers users of
+    the apps; UserActivityInterval also covers API clients, which may
+    not report presence."""
+    last_active: dict[int, datetime] = {}
+    for user_id, last_active_time in UserPresence.objects.filter(
+        last_active_time__gte=since
+    ).values_list("user_profile_id", "last_active_time"):
+        assert last_active_time is not None
+        last_active[user_id] = last_active_time
+    for user_id, end in UserActivityInterval.objects.filter(end__gte=since).values_list(
+        "user_profile_id", "end"
+    ):
+        if user_id not in last_active or end > last_active[user_id]:
+            last_active[user_id] = end
+    return sorted(last_active, key=lambda user_id: last_active[user_id], reverse=True)
+
+
+def warm_user_caches(user_ids: list[int]) -> list[UserProfile]:
+    users = bulk_cached_fetch(
+        user_profile_by_id_cache_key,
+        lambda user_ids: base_get_user_queryset().filter(id__in=user_ids),
+        user_ids,
+        id_fetcher=lambda user_profile: user_profile.id,
+    )
+    bulk_cached_fetch(
+        user_profile_narrow_by_id_cache_key,
+        lambda user_ids: base_get_user_narrow_queryset().filter(id__in=user_ids),
+        user_ids,
+        id_fetcher=lambda user_profile: user_profile.id,
+    )
+    bulk_cached_fetch(
+        user_profile_by_api_key_cache_key,
+        lambda api_keys: base_get_user_queryset().filter(api_key__in=api_keys),
+        [user_profile.api_key for user_profile in users.values()],
+        id_fetcher=lambda user_profile: user_profile.api_key,
+    )
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def warm_realm_caches(realm: Realm) -> None:
+    # These are all cache_with_key functions, which are cheap cache
+    # hits if the value is already cached.
+    get_realm_user_dicts(realm.id)
+    active_user_ids(realm.id)
+    active_non_guest_user_ids(realm.id)
+    get_bot_dicts_in_realm(realm)
+
+
+def warm_message_caches(message_ids: list[int]) -> None:
+    # Imported here, since rendering messages requires importing all
+    # of the Markdown processor, which fill_memcached_caches doesn't
+    # need.
+    from zerver.lib.message_cache import MessageDict, stringify_message_dict
+
+    # Like messages_for_ids, but without decoding the messages which
+    # are already cached.
+    generic_bulk_cached_fetch(
+        to_dict_cache_key_id,
+        MessageDict.ids_to_dict,
+        message_ids,
+        id_fetcher=lambda row: row["id"],
+        cache_transformer=stringify_message_dict,
+        extractor=lambda message_bytes: message_bytes,
+        setter=lambda message_bytes: message_bytes,
+        pickled_tupled=False,
+    )
+
+
+def warm_caches(
+    *,
+    since: datetime,
+    batch_size: int = 100,
+    messages_per_realm: int = 1000,
+    pause: float = 0.1,
+) -> None:
+    """Fills the caches used by the users who have been active since
+    the given time, in batches of batch_size users or messages,
+    sleeping for pause seconds after each batch."""
+    remote_cache_time_start = get_remote_cache_time()
+    remote_cache_requests_start = get_remote_cache_requests()
+    start = time.time()
+    db_query_counter = SQLQueryCounter()
+    realms: dict[int, Realm] = {}
+    message_count = 0
+    with connection.execute_wrapper(db_query_counter):
+        user_ids = get_recently_active_user_ids(since)
+        for i in range(0, len(user_ids), batch_size):
+            for user_profile in warm_user_caches(user_ids[i : i + batch_size]):
+                if user_profile.realm_id not in realms:
+                    realms[user_profile.realm_id] = user_profile.realm
+                    warm_realm_caches(user_profile.realm)
+            time.sleep(pause)
+
+        for realm_id in realms:
+            # Uses index: zerver_message_realm_id
+            message_ids = list(
+                Message.objects.filter(realm_id=realm_id)
+                .order_by("-id")
+                .values_list("id", flat=True)[:messages_per_realm]
+            )
+            for i in range(0, len(message_ids), batch_size):
+                warm_message_caches(message_ids[i : i + batch_size])
+                time.sleep(pause)
+            message_count += len(message_ids)
+    logging.info(
+        "Warmed caches for %d users in %d realms, and %d messages: "
+        "%d DB queries, %d memcached requests (%.2f seconds), %.2f seconds total",
+        len(user_ids),
+        len(realms),
+        message_count,
+        db_query_counter.count,
+        get_remote_cache_requests() - remote_cache_requests_start,
+        get_remote_cache_time() - remote_cache_time_start,
+        time.time() - start,
+    )
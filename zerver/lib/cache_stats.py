@@ -0,0 +1,113 @@
+# Per-key-family statistics for the cache.
+#
+# zerver.lib.cache counts, for each family of cache keys (the part of
+# a key before its first ":", e.g. "user_profile_by_id"), how often a
+# key was found in the remote cache or in the per-process local cache,
+# how often it was missing, how many values were set, the total size
+# of a sample of those values, how many keys were deleted, and the
+# time spent waiting on the remote cache.  Each process adds its counts to a Redis hash at most
+# every CACHE_STATS_PUBLISH_INTERVAL seconds, so that the totals cover
+# the whole server; `./manage.py cache_stats` and the
+# /api/internal/cache_stats endpoint report them.
+import logging
+import pickle
+import random
+import time
+from collections import Counter
+from collections.abc import Iterable
+from typing import Any
+
+import redis
+
+from zerver.lib import redis_utils
+
+CACHE_STATS_COUNTERS = [
+    "hits",
+    "local_hits",
+    "misses",
+    "sets",
+    "sized_sets",
+    "set_bytes",
+    "deletes",
+    "microseconds",
+]
+CACHE_STATS_PUBLISH_INTERVAL = 10.0
+# Measuring the size of a value which isn't already bytes or a string
+# means pickling it a second time, so we only measure one in this
+# many of those.
+CACHE_STATS_SIZE_SAMPLE_RATE = 100
+
+# Counts which this process hasn't published yet, keyed by
+# "<family>:<counter>".
+pending_stats: Counter[str] = Counter()
+next_publish = 0.0
+
+logger = logging.getLogger(__name__)
+
+
+def cache_stats_redis_key() -> str:
+    return f"{redis_utils.REDIS_KEY_PREFIX}cache_stats"
+
+
+def get_key_family(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+def record_cache_stat(keys: Iterable[str], counter: str, amount: int = 1) -> None:
+    for key in keys:
+        pending_stats[f"{get_key_family(key)}:{counter}"] += amount
+
+
+def record_value_sizes(items: dict[str, Any]) -> None:
+    for key, val in items.items():
+        if isinstance(val, bytes | str):
+            size = len(val)
+        elif random.randrange(CACHE_STATS_SIZE_SAMPLE_RATE) == 0:
+            size = len(pickle.dumps(val, protocol=5))
+        else:
+            continue
+        record_cache_stat([key], "sized_sets")
+        record_cache_stat([key], "set_bytes", size)
+
+
+def record_cache_time(keys: list[str], seconds: float) -> None:
+    if keys:
+        record_cache_stat(keys, "microseconds", round(seconds * 1000000 / len(keys)))
+    if time.monotonic() >= next_publish:
+        publish_cache_stats()
+
+
+def publish_cache_stats() -> None:
+    global next_publish
+    next_publish = time.monotonic() + CACHE_STATS_PUBLISH_INTERVAL
+    if not pending_stats:
+        return
+    stats = pending_stats.copy()
+    try:
+        with redis_utils.get_redis_client().pipeline() as pipeline:
+            for field, amount in stats.items():
+                pipeline.hincrby(cache_stats_redis_key(), field, amount)
+            pipeline.execute()
+    except redis.exceptions.RedisError:  # nocoverage
+        # The counts are kept, and published next time.
+        logger.warning("Could not publish cache statistics", exc_info=True)
+        return
+    pending_stats.subtract(stats)
+    for field in [field for field, amount in pending_stats.items() if amount == 0]:
+        del pending_stats[field]
+
+
+def get_cache_stats() -> dict[str, dict[str, int]]:
+    """Returns the server-wide counts for each key family, including
+    this process's unpublished ones."""
+    publish_cache_stats()
+    stats: dict[str, dict[str, int]] = {}
+    for field, amount in redis_utils.get_redis_client().hgetall(cache_stats_redis_key()).items():
+        family, counter = field.decode().rsplit(":", 1)
+        stats.setdefault(family, dict.fromkeys(CACHE_STATS_COUNTERS, 0))[counter] = int(amount)
+    return stats
+
+
+def reset_cache_stats() -> None:
+    pending_stats.clear()
+    redis_utils.get_redis_client().delete(cache_stats_redis_key())
@@ -1,5 +1,5 @@
 import time
-from collections.abc import Callable, Iterable, Mapping, Sequence
+from collections.abc import Callable, Iterable, Mapping, Sequence, Sized
 from typing import Any, TypeAlias, TypeVar
 
 from psycopg2.extensions import connection, cursor
@@ -12,6 +12,29 @@ Params: TypeAlias = Sequence[object] | Mapping[str, object] | None
 ParamsT = TypeVar("ParamsT")
 
 
+# Queries with more parameters than this (e.g. bulk inserts) aren't
+# fingerprinted, since hashing them all would be expensive, and they
+# are rarely repeated.
+QUERY_FINGERPRINT_MAX_PARAMS = 100
+
+
+def query_fingerprint(sql: Query, params: object) -> str | None:
+    """A cheap hash of the query and its parameters, which identifies
+    repeats of the same query within a request, or None if the query
+    can't be hashed cheaply."""
+    if isinstance(params, Sized) and len(params) > QUERY_FINGERPRINT_MAX_PARAMS:
+        return None
+    if isinstance(params, Mapping):
+        params = tuple(params.items())
+    elif isinstance(params, list):
+        params = tuple(params)
+    try:
+        return str(hash((sql, params)))
+    except TypeError:
+        # E.g. a Composable query, or a list parameter.
+        return None
+
+
 # Similar to the tracking done in Django's CursorDebugWrapper, but done at the
 # psycopg2 cursor level so it works with SQLAlchemy.
 def wrapper_execute(
@@ -24,11 +47,12 @@ def wrapper_execute(
         stop = time.time()
         duration = stop - start
         assert isinstance(self.connection, TimeTrackingConnection)
-        self.connection.queries.append(
-            {
-                "time": f"{duration:.3f}",
-            }
-        )
+        query = {"time": f"{duration:.3f}"}
+        # The request log line counts repeats of the same query.
+        fingerprint = query_fingerprint(sql, params)
+        if fingerprint is not None:
+            query["fingerprint"] = fingerprint
+        self.connection.queries.append(query)
 
 
 class TimeTrackingCursor(cursor):
@@ -4,12 +4,14 @@ from django.db.models import QuerySet
 
 from zerver.lib.cache import (
     bulk_cached_fetch,
+    cache_set,
     cache_with_key,
     display_recipient_cache_key,
     generic_bulk_cached_fetch,
+    local_cache,
     single_user_display_recipient_cache_key,
 )
-from zerver.lib.per_request_cache import return_same_value_during_entire_request
+from zerver.lib.per_request_cache import per_request_cache
 from zerver.lib.types import DisplayRecipientT, UserDisplayRecipient
 
 if TYPE_CHECKING:
@@ -28,6 +30,13 @@ class TinyStreamResult(TypedDict):
     name: str
 
 
+def set_stream_display_recipient(recipient_id: int, name: str) -> None:
+    key = display_recipient_cache_key(recipient_id)
+    cache_set(key, name, pickled_tupled=False)
+    # Have every process, including this one, evict its local copy.
+    local_cache.delete_many([key])
+
+
 def get_display_recipient_cache_key(
     recipient_id: int, recipient_type: int, recipient_type_id: int | None
 ) -> str:
@@ -209,7 +218,7 @@ def bulk_fetch_display_recipients(
     return {**stream_display_recipients, **direct_message_display_recipients}
 
 
-@return_same_value_during_entire_request
+@per_request_cache(depends_on=["zerver.UserProfile", "zerver.Stream"])
 def get_display_recipient_by_id(
     recipient_id: int, recipient_type: int, recipient_type_id: int | None
 ) -> list[UserDisplayRecipient]:
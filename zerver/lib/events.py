@@ -1,11 +1,13 @@
 # See https://zulip.readthedocs.io/en/latest/subsystems/events-system.html for
 # high-level documentation on how this system works.
 import copy
+import hashlib
 import logging
 import time
-from collections.abc import Callable, Collection, Iterable, Sequence
+from collections.abc import Callable, Collection, Iterable, Mapping, Sequence
 from typing import Any, Literal
 
+import orjson
 from django.conf import settings
 from django.utils.translation import gettext as _
 from typing_extensions import NotRequired, TypedDict
@@ -80,8 +82,10 @@ from zerver.lib.user_groups import (
 from zerver.lib.user_status import get_all_users_status_dict
 from zerver.lib.user_topics import get_topic_mutes, get_user_topics
 from zerver.lib.users import (
+    RealmUsersSnapshot,
     get_cross_realm_dicts,
     get_data_for_inaccessible_user,
+    get_realm_users_snapshot,
     get_users_for_api,
     is_administrator_role,
     is_moderator_role,
@@ -179,6 +183,7 @@ def fetch_initial_state_data(
     include_deactivated_groups: bool = False,
     archived_channels: bool = False,
     simplified_presence_events: bool = False,
+    use_realm_users_snapshot: bool = False,
 ) -> dict[str, Any]:
     """When `event_types` is None, fetches the core data powering the
     web app's `page_params` and `/api/v1/register` (for mobile/terminal
@@ -668,15 +673,28 @@ def fetch_initial_state_data(
         )
 
     if want("realm_user"):
-        state["raw_users"] = get_users_for_api(
-            realm,
-            user_profile,
-            client_gravatar=client_gravatar,
-            user_avatar_url_field_optional=user_avatar_url_field_optional,
-            # Don't send custom profile field values to spectators.
-            include_custom_profile_fields=user_profile is not None,
-            user_list_incomplete=user_list_incomplete,
-        )
+        users_snapshot = None
+        if use_realm_users_snapshot and user_profile is not None:
+            users_snapshot = get_realm_users_snapshot(
+                realm,
+                user_profile,
+                client_gravatar=client_gravatar,
+                user_avatar_url_field_optional=user_avatar_url_field_optional,
+            )
+        if users_snapshot is not None:
+            # Spliced into the response as is by post_process_state,
+            # unless there are events to apply to it first.
+            state["realm_users_snapshot"] = users_snapshot
+        else:
+            state["raw_users"] = get_users_for_api(
+                realm,
+                user_profile,
+                client_gravatar=client_gravatar,
+                user_avatar_url_field_optional=user_avatar_url_field_optional,
+                # Don't send custom profile field values to spectators.
+                include_custom_profile_fields=user_profile is not None,
+                user_list_incomplete=user_list_incomplete,
+            )
         state["cross_realm_bots"] = list(get_cross_realm_dicts())
 
         # For the user's own avatar URL, we force
@@ -2039,6 +2057,8 @@ def do_events_register(
     fetch_event_types: Collection[str] | None = None,
     spectator_requested_language: str | None = None,
     pronouns_field_type_supported: bool = True,
+    section_versions: Mapping[str, str] | None = None,
+    use_realm_users_snapshot: bool = False,
 ) -> dict[str, Any]:
     # Technically we don't need to check this here because
     # build_narrow_predicate will check it, but it's nicer from an error
@@ -2102,6 +2122,8 @@ def do_events_register(
             notification_settings_null=False,
             allow_empty_topic_name=empty_topic_name,
         )
+        if section_versions is not None:
+            apply_section_versions(ret, section_versions)
         return ret
 
     # Fill up the UserMessage rows if a soft-deactivated user has returned
@@ -2155,10 +2177,13 @@ def do_events_register(
         include_deactivated_groups=include_deactivated_groups,
         archived_channels=archived_channels,
         simplified_presence_events=simplified_presence_events,
+        use_realm_users_snapshot=use_realm_users_snapshot,
     )
 
     # Apply events that came in while we were fetching initial data
     events = get_user_events(user_profile, queue_id, -1)
+    if events and "realm_users_snapshot" in ret:
+        ret["raw_users"] = realm_users_snapshot_to_raw_users(ret.pop("realm_users_snapshot"))
     apply_events(
         user_profile,
         state=ret,
@@ -2176,6 +2201,8 @@ def do_events_register(
     post_process_state(
         user_profile, ret, notification_settings_null, allow_empty_topic_name=empty_topic_name
     )
+    if section_versions is not None:
+        apply_section_versions(ret, section_versions)
 
     if len(events) > 0:
         ret["last_event_id"] = events[-1]["id"]
@@ -2184,6 +2211,52 @@ def do_events_register(
     return ret
 
 
+# The large sections of the /register response which a client can skip
+# re-downloading, mapped to the keys of the response that they cover.
+# Each section's version is a hash of its content, so it changes
+# exactly when the data the client would receive does.
+REGISTER_SECTION_KEYS: dict[str, list[str]] = {
+    "custom_profile_fields": ["custom_profile_fields"],
+    "realm_bot": ["realm_bots"],
+    "realm_emoji": ["realm_emoji"],
+    "realm_user": ["realm_users", "realm_non_active_users", "cross_realm_bots"],
+    "realm_user_groups": ["realm_user_groups"],
+    "stream": ["streams"],
+    "subscription": ["subscriptions", "unsubscribed", "never_subscribed"],
+}
+
+
+def get_section_version(state: dict[str, Any], keys: list[str]) -> str:
+    content = orjson.dumps([state[key] for key in keys], option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(content).hexdigest()[:32]
+
+
+def apply_section_versions(state: dict[str, Any], client_versions: Mapping[str, str]) -> None:
+    """Adds the current version of each section in the response to
+    `section_versions`, and drops the sections whose version matches
+    the one the client already holds, listing them in
+    `unchanged_sections` instead, so that the client can reuse its
+    copy from a previous response."""
+    state["section_versions"] = {}
+    state["unchanged_sections"] = []
+    for section, keys in REGISTER_SECTION_KEYS.items():
+        if not all(key in state for key in keys):
+            continue
+        version = get_section_version(state, keys)
+        state["section_versions"][section] = version
+        if client_versions.get(section) == version:
+            state["unchanged_sections"].append(section)
+            for key in keys:
+                del state[key]
+
+
+def realm_users_snapshot_to_raw_users(snapshot: RealmUsersSnapshot) -> dict[int, dict[str, Any]]:
+    return {
+        user_id: {**orjson.loads(user_json), "is_active": is_active}
+        for user_id, is_active, user_json in snapshot
+    }
+
+
 def post_process_state(
     user_profile: UserProfile | None,
     ret: dict[str, Any],
@@ -2229,6 +2302,21 @@ def post_process_state(
 
         del ret["raw_users"]
 
+    if "realm_users_snapshot" in ret:
+        # The users were serialized when the snapshot was built, so
+        # they're included in the response without building them again.
+        ret["realm_users"] = [
+            orjson.Fragment(user_json)
+            for user_id, is_active, user_json in ret["realm_users_snapshot"]
+            if is_active
+        ]
+        ret["realm_non_active_users"] = [
+            orjson.Fragment(user_json)
+            for user_id, is_active, user_json in ret["realm_users_snapshot"]
+            if not is_active
+        ]
+        del ret["realm_users_snapshot"]
+
     if "raw_recent_private_conversations" in ret:
         # Reformat recent_private_conversations to be a list of dictionaries, rather than a dict.
         ret["recent_private_conversations"] = sorted(
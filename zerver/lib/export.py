@@ -198,6 +198,7 @@ ALL_ZULIP_TABLES = {
     "zerver_scheduledmessagenotificationemail",
     "zerver_service",
     "zerver_stream",
+    "zerver_streamtopic",
     "zerver_submessage",
     "zerver_subscription",
     "zerver_useractivity",
@@ -292,6 +293,9 @@ NON_EXPORTED_TABLES = {
     # ChannelEmailAddress entries are low value to export since
     # channel email addresses include the server's hostname.
     "zerver_channelemailaddress",
+    # StreamTopic rows are derived from the messages, and are rebuilt
+    # by the importer.
+    "zerver_streamtopic",
     # For any tables listed below here, it's a bug that they are not present in the export.
 }
 
@@ -7,12 +7,10 @@ from datetime import datetime, timedelta, timezone
 from difflib import unified_diff
 from typing import Any
 
-import bmemcached
 import orjson
 import pyvips
 from bs4 import BeautifulSoup
 from django.conf import settings
-from django.core.cache import cache
 from django.core.management.base import CommandError
 from django.core.validators import validate_email
 from django.db import connection, transaction
@@ -33,6 +31,7 @@ from zerver.actions.realm_settings import (
 from zerver.actions.user_settings import do_change_avatar_fields
 from zerver.lib.avatar_hash import user_avatar_base_path_from_ids
 from zerver.lib.bulk_create import bulk_set_users_or_streams_recipient_fields
+from zerver.lib.cache import disconnect_remote_cache
 from zerver.lib.export import DATE_FIELDS, Field, Path, Record, TableData, TableName
 from zerver.lib.markdown import markdown_convert
 from zerver.lib.markdown import version as markdown_version
@@ -47,7 +46,9 @@ from zerver.lib.onboarding import (
 from zerver.lib.partial import partial
 from zerver.lib.push_notifications import sends_notifications_directly
 from zerver.lib.remote_server import maybe_enqueue_audit_log_upload
+from zerver.lib.search_index import queue_search_index_update
 from zerver.lib.server_initialization import create_internal_realm, server_initialized
+from zerver.lib.stream_topic import rebuild_stream_topics
 from zerver.lib.streams import (
     get_stream_permission_default_group,
     render_stream_description,
@@ -1146,9 +1147,7 @@ def import_uploads(
                 process_func(record)
         else:
             connection.close()
-            _cache = cache._cache  # type: ignore[attr-defined] # not in stubs
-            assert isinstance(_cache, bmemcached.Client)
-            _cache.disconnect_all()
+            disconnect_remote_cache()
             with ProcessPoolExecutor(max_workers=processes) as executor:
                 for future in as_completed(
                     executor.submit(process_func, record) for record in records
@@ -1838,6 +1837,8 @@ def do_import_realm(import_dir: Path, subdomain: str, processes: int = 1) -> Rea
     with connection.cursor() as cursor:
         cursor.execute(update_first_message_id_query, {"realm_id": realm.id})
 
+    rebuild_stream_topics(realm.id)
+
     if "zerver_userstatus" in data:
         fix_datetime_fields(data, "zerver_userstatus")
         re_map_foreign_keys(data, "zerver_userstatus", "user_profile", related_table="user_profile")
@@ -2091,6 +2092,7 @@ def import_message_data(realm: Realm, sender_map: dict[int, Record], import_dir:
         # A LOT HAPPENS HERE.
         # This is where we actually import the message data.
         bulk_import_model(data, Message)
+        queue_search_index_update(message["id"] for message in data["zerver_message"])
 
         # Due to the structure of these message chunks, we're
         # guaranteed to have already imported all the Message objects
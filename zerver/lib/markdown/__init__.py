@@ -54,14 +54,15 @@ from zerver.lib.mention import (
 )
 from zerver.lib.mime_types import AUDIO_INLINE_MIME_TYPES, guess_type
 from zerver.lib.outgoing_http import OutgoingSession
+from zerver.lib.render_pool import get_render_pool, render_in_pool
 from zerver.lib.subdomains import is_static_or_current_realm_url
-from zerver.lib.tex import render_tex
+from zerver.lib.tex import render_tex, render_tex_batch
 from zerver.lib.thumbnail import (
     AttachmentData,
     get_user_upload_previews,
     rewrite_thumbnailed_images,
 )
-from zerver.lib.timeout import unsafe_timeout
+from zerver.lib.timeout import TimeoutExpiredError, unsafe_timeout
 from zerver.lib.timezone import common_timezones
 from zerver.lib.types import LinkifierDict
 from zerver.lib.url_encoding import encode_channel, encode_hash_component
@@ -143,6 +144,7 @@ _T = TypeVar("_T")
 ElementStringNone: TypeAlias = Element | str | None
 
 EMOJI_REGEX = r"(?P<syntax>:[\w\-\+]+:)"
+TEX_RE = r"\B(?<!\$)\$\$(?P<body>[^\n_$](\\\$|[^$\n])*)\$\$(?!\$)\B"
 
 
 def verbose_compile(pattern: str) -> Pattern[str]:
@@ -1385,10 +1387,43 @@ def content_has_emoji_syntax(content: str) -> bool:
     return re.search(EMOJI_REGEX, content) is not None
 
 
+def possible_tex_expressions(content: str) -> set[tuple[str, bool]]:
+    """Returns the (tex, is_inline) expressions that rendering this
+    content might need, so that they can all be rendered in a single
+    batch.  This may overestimate, e.g. for TeX syntax in code blocks.
+    """
+    expressions = {(match.group("body"), True) for match in re.finditer(TEX_RE, content)}
+
+    # Display math comes from ```math blocks, whose paragraphs are
+    # rendered separately by fenced_code's TexHandler.
+    math_fence: str | None = None
+    math_lines: list[str] = []
+    for line in content.split("\n"):
+        if math_fence is None:
+            m = FENCE_RE.match(line)
+            if m is not None and (m.group("lang") or "").lower() == "math":
+                math_fence = m.group("fence")
+                math_lines = []
+        elif line.rstrip() == math_fence:
+            expressions.update(
+                (paragraph, False) for paragraph in "\n".join(math_lines).split("\n\n")
+            )
+            math_fence = None
+        else:
+            math_lines.append(line.rstrip())
+    if math_fence is not None and math_lines:
+        expressions.update((paragraph, False) for paragraph in "\n".join(math_lines).split("\n\n"))
+    return expressions
+
+
 class Tex(markdown.inlinepatterns.Pattern):
+    def __init__(self, pattern: str, zmd: "ZulipMarkdown") -> None:
+        super().__init__(pattern, zmd)
+        self.zmd = zmd
+
     @override
     def handleMatch(self, match: Match[str]) -> str | Element:
-        rendered = render_tex(match.group("body"), is_inline=True)
+        rendered = self.zmd.render_tex(match.group("body"), is_inline=True)
         if rendered is not None:
             return self.md.htmlStash.store(rendered)
         else:  # Something went wrong while rendering
@@ -1941,6 +1976,49 @@ def possible_linked_topics(content: str) -> set[ChannelTopicInfo]:
     }
 
 
+def prefetch_mention_data(
+    mention_backend: MentionBackend,
+    contents: list[str],
+    message_sender: UserProfile | None,
+    acting_user: UserProfile | None = None,
+) -> list[MentionData]:
+    """Resolves the users, user groups, channels and topics that a
+    batch of messages from a single sender might reference with a few
+    bulk queries, rather than a few queries per message.  This fills
+    the caches of mention_backend, so that rendering each message with
+    the returned MentionData does not need to query for them again.
+    """
+    if acting_user is None:
+        acting_user = message_sender
+
+    mention_texts: set[str] = set()
+    group_names: set[str] = set()
+    non_silent_group_names: set[str] = set()
+    stream_names: set[str] = set()
+    channel_topics: set[ChannelTopicInfo] = set()
+    for content in contents:
+        mention_texts |= mention.possible_mentions(content).mention_texts
+        for group_name, mention_type in mention.possible_user_group_mentions(content).items():
+            group_names.add(group_name)
+            if mention_type == "non-silent":
+                non_silent_group_names.add(group_name)
+        stream_names |= possible_linked_stream_names(content)
+        channel_topics |= possible_linked_topics(content)
+
+    if mention_texts:
+        mention_backend.prefetch_full_name_info(
+            mention.get_user_filters(mention_texts), message_sender
+        )
+    if group_names:
+        mention_backend.prefetch_user_group_data(group_names, non_silent_group_names)
+    # Topic links are resolved using the channels cached here.
+    stream_name_info = mention_backend.get_stream_name_map(stream_names, acting_user=acting_user)
+    mention_backend.missing_stream_names |= stream_names - stream_name_info.keys()
+    mention_backend.get_topic_info_map(channel_topics, acting_user=acting_user)
+
+    return [MentionData(mention_backend, content, message_sender) for content in contents]
+
+
 class AlertWordNotificationProcessor(markdown.preprocessors.Preprocessor):
     allowed_before_punctuation = {" ", "\n", "(", '"', ".", ",", "'", ";", "[", "*", "`", ">"}
     allowed_after_punctuation = {
@@ -2147,6 +2225,7 @@ class ZulipMarkdown(markdown.Markdown):
     image_preview_enabled: bool
     url_embed_preview_enabled: bool
     url_embed_data: dict[str, UrlEmbedData | None] | None
+    zulip_rendered_tex: dict[tuple[str, bool], str | None]
 
     def __init__(
         self,
@@ -2157,6 +2236,7 @@ class ZulipMarkdown(markdown.Markdown):
         self.linkifiers = linkifiers
         self.linkifiers_key = linkifiers_key
         self.email_gateway = email_gateway
+        self.zulip_rendered_tex = {}
 
         super().__init__(
             extensions=[
@@ -2261,7 +2341,6 @@ class ZulipMarkdown(markdown.Markdown):
         EMPHASIS_RE = r"(\*)(?!\s+)([^\*^\n]+)(?<!\s)\*"
         STRONG_RE = r"(\*\*)([^\n]+?)\2"
         STRONG_EM_RE = r"(\*\*\*)(?!\s+)([^\*^\n]+)(?<!\s)\*\*\*"
-        TEX_RE = r"\B(?<!\$)\$\$(?P<body>[^\n_$](\\\$|[^$\n])*)\$\$(?!\$)\B"
         TIMESTAMP_RE = r"<time:(?P<time>[^>]*?)>"
 
         # Add inline patterns.  We use a custom numbering of the
@@ -2347,6 +2426,13 @@ class ZulipMarkdown(markdown.Markdown):
         )
         return postprocessors
 
+    def render_tex(self, tex: str, is_inline: bool) -> str | None:
+        # Use the output of the batch render done by do_convert, if
+        # it found this expression, and the batch request didn't fail.
+        if (tex, is_inline) in self.zulip_rendered_tex:
+            return self.zulip_rendered_tex[(tex, is_inline)]
+        return render_tex(tex, is_inline=is_inline)
+
     def handle_zephyr_mirror(self) -> None:
         if self.linkifiers_key == ZEPHYR_MIRROR_MARKDOWN_KEY:
             # Disable almost all inline patterns for zephyr mirror
@@ -2412,11 +2498,46 @@ class TopicLinkMatch:
     precedence: int | None
 
 
+# Topic names repeat heavily in busy channels, and topic_links is
+# called for every message we serialize, so we cache its results in
+# each process, keyed by (linkifiers_key, topic_name).  The cache is
+# cleared whenever topic_links notices that the linkifiers for a
+# realm have changed; topic_links_linkifiers records the linkifiers
+# the cached results were computed with.
+TOPIC_LINKS_CACHE_SIZE = 10000
+topic_links_linkifiers: dict[int, list[LinkifierDict]] = {}
+
+
+def topic_links(linkifiers_key: int, topic_name: str) -> list[dict[str, str]]:
+    if topic_name == "":
+        return []
+
+    linkifiers = linkifiers_for_realm(linkifiers_key)
+    old_linkifiers = topic_links_linkifiers.get(linkifiers_key, linkifiers)
+    # linkifiers_for_realm returns the same object for the whole
+    # request, which lets us skip comparing the lists in bulk fetches.
+    if old_linkifiers is not linkifiers and old_linkifiers != linkifiers:
+        cached_topic_links.cache_clear()
+    topic_links_linkifiers[linkifiers_key] = linkifiers
+
+    # Return new dicts, so that callers can't modify the cached value.
+    return [
+        {"url": url, "text": text} for url, text in cached_topic_links(linkifiers_key, topic_name)
+    ]
+
+
+@lru_cache(maxsize=TOPIC_LINKS_CACHE_SIZE)
+def cached_topic_links(linkifiers_key: int, topic_name: str) -> tuple[tuple[str, str], ...]:
+    return tuple(
+        (link["url"], link["text"]) for link in compute_topic_links(linkifiers_key, topic_name)
+    )
+
+
 # Security note: We don't do any HTML escaping in this
 # function on the URLs; they are expected to be HTML-escaped when
 # rendered by clients (just as links rendered into message bodies
 # are validated and escaped inside `url_to_a`).
-def topic_links(linkifiers_key: int, topic_name: str) -> list[dict[str, str]]:
+def compute_topic_links(linkifiers_key: int, topic_name: str) -> list[dict[str, str]]:
     matches: list[TopicLinkMatch] = []
     linkifiers = linkifiers_for_realm(linkifiers_key)
     precedence = 0
@@ -2620,6 +2741,7 @@ def do_convert(
         message, message_realm, no_previews
     )
     _md_engine.url_embed_data = url_embed_data
+    _md_engine.zulip_rendered_tex = {}
 
     # Pre-fetch data from the DB that is used in the Markdown thread
     user_upload_previews = None
@@ -2668,12 +2790,30 @@ def do_convert(
         )
 
     try:
-        # Spend at most 5 seconds rendering; this protects the backend
-        # from being overloaded by bugs (e.g. Markdown logic that is
-        # extremely inefficient in corner cases) as well as user
-        # errors (e.g. a linkifier that makes some syntax
-        # infinite-loop).
-        rendering_result.rendered_content = unsafe_timeout(5, lambda: _md_engine.convert(content))
+        # Spend at most 5 seconds rendering, including the TeX; this
+        # protects the backend from being overloaded by bugs
+        # (e.g. Markdown logic that is extremely inefficient in corner
+        # cases) as well as user errors (e.g. a linkifier that makes
+        # some syntax infinite-loop).
+        deadline = time.monotonic() + 5
+        if "$$" in content or "math" in content:
+            # Render all of the TeX in the message with a single request
+            # to KaTeX, rather than one per expression.  Any that the
+            # batch failed for are rendered one at a time by the engine,
+            # in whatever time remains.
+            _md_engine.zulip_rendered_tex = unsafe_timeout(
+                5, lambda: render_tex_batch(possible_tex_expressions(content), timeout=5)
+            )
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise TimeoutExpiredError
+        rendered_content = None
+        render_pool = get_render_pool()
+        if render_pool is not None:
+            rendered_content = render_in_pool(render_pool, _md_engine, content, timeout=timeout)
+        if rendered_content is None:
+            rendered_content = unsafe_timeout(timeout, lambda: _md_engine.convert(content))
+        rendering_result.rendered_content = rendered_content
 
         # Post-process the result with the rendered image previews:
         if user_upload_previews is not None:
@@ -2709,6 +2849,7 @@ def do_convert(
         _md_engine.zulip_message = None
         _md_engine.zulip_realm = None
         _md_engine.zulip_db_data = None
+        _md_engine.zulip_rendered_tex = {}
 
 
 markdown_time_start = 0.0
@@ -0,0 +1,272 @@
+# Performance benchmark for Zulip's Markdown processor.
+#
+# zerver/tests/test_markdown.py checks that our Markdown rendering is
+# correct; this module is about how fast it is.  It renders a fixed
+# corpus of realistic, rendering-heavy messages through
+# markdown_convert, and attributes the time (and memory allocated) to
+# the individual Python-Markdown processors registered in
+# ZulipMarkdown, so that a regression in e.g. the
+# InlineInterestingLinkProcessor or the fenced code preprocessor is
+# easy to spot.  Results can be saved as a baseline and compared
+# against later runs; see the `benchmark_markdown` management command.
+import statistics
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, TypedDict
+
+import markdown.util
+
+from zerver.lib.markdown import (
+    ZulipMarkdown,
+    markdown_convert,
+    maybe_update_markdown_engines,
+    md_engines,
+    prefetch_mention_data,
+)
+from zerver.lib.mention import MentionBackend
+from zerver.models import Realm, UserProfile
+
+
+@dataclass
+class BenchmarkCase:
+    name: str
+    content: str
+
+
+@dataclass
+class ProcessorStats:
+    calls: int = 0
+    time: float = 0.0
+    allocated_bytes: int = 0
+
+
+@dataclass
+class CaseResult:
+    name: str
+    content_length: int
+    times: list[float] = field(default_factory=list)
+    peak_bytes: int = 0
+
+    @property
+    def median_time(self) -> float:
+        return statistics.median(self.times)
+
+
+@dataclass
+class BenchmarkResult:
+    iterations: int
+    cases: dict[str, CaseResult]
+    processors: dict[str, ProcessorStats]
+
+
+class BaselineEntry(TypedDict):
+    time_ms: float
+    allocated_bytes: int
+
+
+class Baseline(TypedDict):
+    cases: dict[str, BaselineEntry]
+    processors: dict[str, BaselineEntry]
+
+
+def build_benchmark_corpus(
+    mention_names: list[str], stream_names: list[str]
+) -> list[BenchmarkCase]:
+    """The corpus is generated deterministically from the user and
+    channel names passed in, so that results are comparable between
+    runs against the same database."""
+    code_lines = []
+    for i in range(400):
+        code_lines.append(f"def function_{i}(argument: int) -> int:")
+        code_lines.append(f"    return argument * {i} + len('string {i}')  # comment {i}")
+    long_code = "```python\n" + "\n".join(code_lines) + "\n```"
+
+    mention_lines = []
+    for i in range(200):
+        name = mention_names[i % len(mention_names)] if mention_names else "Iago"
+        mention_lines.append(f"@**{name}** please look at item {i}, cc @_**{name}**")
+    mentions = "\n".join(mention_lines)
+
+    link_lines = []
+    for i in range(200):
+        stream = stream_names[i % len(stream_names)] if stream_names else "Verona"
+        link_lines.append(
+            f"See #{i} and ZUL-{i} in #**{stream}>topic {i}**, "
+            f"https://example.com/issues/{i} and [docs](https://zulip.com/help/{i})."
+        )
+    links = "\n".join(link_lines)
+
+    table_rows = ["| " + " | ".join(f"Header {c}" for c in range(8)) + " |"]
+    table_rows.append("|" + "---|" * 8)
+    table_rows.extend(
+        "| " + " | ".join(f"**cell** {row}.{c} `code`" for c in range(8)) + " |"
+        for row in range(150)
+    )
+    table = "\n".join(table_rows)
+
+    tex_lines = [f"Inline $$x_{i} = \\frac{{{i}}}{{y^2}}$$ and more text." for i in range(40)]
+    tex_lines.append("```math\n\\int_0^\\infty e^{-x^2} dx = \\frac{\\sqrt{\\pi}}{2}\n```")
+    tex = "\n".join(tex_lines)
+
+    return [
+        BenchmarkCase("long_code_block", long_code),
+        BenchmarkCase("heavy_mentions", mentions),
+        BenchmarkCase("many_links", links),
+        BenchmarkCase("large_table", table),
+        BenchmarkCase("latex", tex),
+        BenchmarkCase("mixed", "\n\n".join([mentions[:2000], links[:2000], table[:2000], tex])),
+    ]
+
+
+def processor_registries(
+    engine: ZulipMarkdown,
+) -> Iterator[tuple[str, markdown.util.Registry[Any], str]]:
+    yield "preprocessor", engine.preprocessors, "run"
+    yield "blockprocessor", engine.parser.blockprocessors, "run"
+    yield "inlinepattern", engine.inlinePatterns, "handleMatch"
+    yield "treeprocessor", engine.treeprocessors, "run"
+    yield "postprocessor", engine.postprocessors, "run"
+
+
+@contextmanager
+def instrument_markdown_engine(
+    engine: ZulipMarkdown, stats: dict[str, ProcessorStats], track_allocations: bool = False
+) -> Iterator[None]:
+    """Wrap the entry point of every processor registered in the
+    engine, accumulating per-processor statistics in `stats`.
+
+    Processors are keyed by class, so e.g. all linkifiers are reported
+    together.  Note that the InlineProcessor treeprocessor is what runs
+    the inline patterns, so its time includes theirs."""
+    wrapped: list[tuple[object, str]] = []
+
+    def make_wrapper(key: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            entry = stats.setdefault(key, ProcessorStats())
+            if track_allocations:
+                before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                entry.time += time.perf_counter() - start
+                entry.calls += 1
+                if track_allocations:
+                    entry.allocated_bytes += max(0, tracemalloc.get_traced_memory()[0] - before)
+
+        return wrapper
+
+    for kind, registry, method_name in processor_registries(engine):
+        for processor in registry:
+            # Shadow the bound method with an instance attribute, which
+            # we can simply delete again afterwards.
+            key = f"{kind}/{type(processor).__name__}"
+            setattr(processor, method_name, make_wrapper(key, getattr(processor, method_name)))
+            wrapped.append((processor, method_name))
+    try:
+        yield
+    finally:
+        for processor, method_name in wrapped:
+            delattr(processor, method_name)
+
+
+def run_markdown_benchmark(
+    realm: Realm,
+    sender: UserProfile,
+    corpus: list[BenchmarkCase],
+    iterations: int = 5,
+) -> BenchmarkResult:
+    # Prefetch everything that markdown_convert would otherwise query
+    # for mentions and links, so that the measurements are of
+    # rendering only.
+    mention_backend = MentionBackend(realm.id)
+    mention_data = dict(
+        zip(
+            [case.name for case in corpus],
+            prefetch_mention_data(mention_backend, [case.content for case in corpus], sender),
+            strict=True,
+        )
+    )
+
+    def render(case: BenchmarkCase) -> None:
+        markdown_convert(
+            case.content,
+            message_realm=realm,
+            mention_data=mention_data[case.name],
+            acting_user=sender,
+            no_previews=True,
+        )
+
+    # Warm up the Markdown engine and any caches (emoji, linkifiers)
+    # before measuring anything.
+    for case in corpus:
+        render(case)
+    maybe_update_markdown_engines(realm.id, False)
+    engine = md_engines[(realm.id, False)]
+
+    cases = {case.name: CaseResult(case.name, len(case.content)) for case in corpus}
+    processors: dict[str, ProcessorStats] = {}
+    with instrument_markdown_engine(engine, processors):
+        for _ in range(iterations):
+            for case in corpus:
+                start = time.perf_counter()
+                render(case)
+                cases[case.name].times.append(time.perf_counter() - start)
+
+    # Allocations are measured in a separate pass, since tracemalloc
+    # slows down execution considerably.
+    allocations: dict[str, ProcessorStats] = {}
+    tracemalloc.start()
+    try:
+        with instrument_markdown_engine(engine, allocations, track_allocations=True):
+            for case in corpus:
+                tracemalloc.reset_peak()
+                baseline_memory = tracemalloc.get_traced_memory()[0]
+                render(case)
+                cases[case.name].peak_bytes = tracemalloc.get_traced_memory()[1] - baseline_memory
+    finally:
+        tracemalloc.stop()
+
+    for key, stats in processors.items():
+        stats.allocated_bytes = allocations.get(key, ProcessorStats()).allocated_bytes
+    return BenchmarkResult(iterations=iterations, cases=cases, processors=processors)
+
+
+def result_to_baseline(result: BenchmarkResult) -> Baseline:
+    return Baseline(
+        cases={
+            name: BaselineEntry(time_ms=case.median_time * 1000, allocated_bytes=case.peak_bytes)
+            for name, case in result.cases.items()
+        },
+        processors={
+            name: BaselineEntry(
+                time_ms=stats.time * 1000 / result.iterations,
+                allocated_bytes=stats.allocated_bytes,
+            )
+            for name, stats in result.processors.items()
+        },
+    )
+
+
+def find_regressions(
+    current: Baseline, baseline: Baseline, threshold: float = 0.2, min_time_ms: float = 1.0
+) -> list[str]:
+    """Returns a description of each case or processor whose time
+    increased by more than `threshold` (a fraction) compared to the
+    baseline.  Differences smaller than `min_time_ms` are treated as
+    noise."""
+    regressions = []
+    for section in ("cases", "processors"):
+        for name, entry in current[section].items():
+            old_entry = baseline[section].get(name)
+            if old_entry is None:
+                continue
+            old_time, new_time = old_entry["time_ms"], entry["time_ms"]
+            if new_time - old_time < min_time_ms:
+                continue
+            if new_time > old_time * (1 + threshold):
+                regressions.append(f"{name}: {old_time:.2f}ms -> {new_time:.2f}ms")
+    return regressions
@@ -559,10 +559,15 @@ class FencedBlockPreprocessor(Preprocessor):
         return "\n\n".join(output)
 
     def format_tex(self, text: str) -> str:
+        from zerver.lib.markdown import ZulipMarkdown
+
         paragraphs = text.split("\n\n")
         tex_paragraphs = []
         for paragraph in paragraphs:
-            html = render_tex(paragraph, is_inline=False)
+            if isinstance(self.md, ZulipMarkdown):
+                html = self.md.render_tex(paragraph, is_inline=False)
+            else:
+                html = render_tex(paragraph, is_inline=False)
             if html is not None:
                 tex_paragraphs.append(html)
             else:
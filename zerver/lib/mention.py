@@ -50,6 +50,14 @@ class UserFilter:
     id: int | None
     full_name: str | None
 
+    def key(self) -> tuple[int | None, str | None]:
+        return (self.id, self.full_name.lower() if self.full_name is not None else None)
+
+    def matches(self, user: FullNameInfo) -> bool:
+        if self.id is not None and user.id != self.id:
+            return False
+        return self.full_name is None or user.full_name.lower() == self.full_name.lower()
+
     def Q(self) -> Q:
         if self.full_name is not None and self.id is not None:
             return Q(full_name__iexact=self.full_name, id=self.id)
@@ -103,8 +111,15 @@ class MentionBackend:
     def __init__(self, realm_id: int) -> None:
         self.realm_id = realm_id
         self.user_cache: dict[tuple[int, str], FullNameInfo] = {}
+        # Only populated when prefetching data for batches of messages
+        # from the same sender; see prefetch_mention_data.
+        self.user_filter_cache: dict[tuple[int | None, str | None], list[FullNameInfo]] = {}
         self.stream_cache: dict[str, ChannelInfo] = {}
         self.topic_cache: dict[ChannelTopicInfo, int | None] = {}
+        # Populated only by prefetch_mention_data, like user_filter_cache.
+        self.missing_stream_names: set[str] = set()
+        self.user_group_cache: dict[str, NamedUserGroup | None] = {}
+        self.user_group_members_cache: dict[int, set[int]] = {}
 
     def get_full_name_info_list(
         self, user_filters: list[UserFilter], message_sender: UserProfile | None
@@ -117,6 +132,11 @@ class MentionBackend:
         #  - results are the objects we pull from cache
         #  - unseen_user_filters are filters where need to hit the DB
         for user_filter in user_filters:
+            prefetched_users = self.user_filter_cache.get(user_filter.key())
+            if prefetched_users is not None:
+                result += prefetched_users
+                continue
+
             # We expect callers who take advantage of our user_cache to supply both
             # id and full_name in the user mentions in their messages.
             if user_filter.id is not None and user_filter.full_name is not None:
@@ -167,6 +187,30 @@ class MentionBackend:
 
         return result
 
+    def prefetch_full_name_info(
+        self, user_filters: list[UserFilter], message_sender: UserProfile | None
+    ) -> None:
+        """Resolves the user filters for a whole batch of messages from
+        the same sender in a single query, so that later calls to
+        get_full_name_info_list for any of them don't hit the database.
+        """
+        user_filters = [
+            user_filter
+            for user_filter in user_filters
+            if user_filter.key() not in self.user_filter_cache
+        ]
+        if not user_filters:
+            return
+
+        users = self.get_full_name_info_list(user_filters, message_sender)
+        for user_filter in user_filters:
+            matching_users = [user for user in users if user_filter.matches(user)]
+            # If our case-insensitive comparison doesn't agree with the
+            # database's, we don't cache anything, and just fall back
+            # to querying for this filter.
+            if matching_users:
+                self.user_filter_cache[user_filter.key()] = matching_users
+
     def get_stream_name_map(
         self, stream_names: set[str], acting_user: UserProfile | None
     ) -> dict[str, int]:
@@ -179,7 +223,7 @@ class MentionBackend:
         for stream_name in stream_names:
             if stream_name in self.stream_cache:
                 result[stream_name] = self.stream_cache[stream_name].channel_id
-            else:
+            elif stream_name not in self.missing_stream_names:
                 unseen_stream_names.append(stream_name)
 
         if not unseen_stream_names:
@@ -283,6 +327,59 @@ class MentionBackend:
 
         return result
 
+    def get_user_groups_by_name(self, group_names: set[str]) -> list[NamedUserGroup]:
+        result = [
+            group
+            for group_name in group_names & self.user_group_cache.keys()
+            if (group := self.user_group_cache[group_name]) is not None
+        ]
+        unseen_group_names = group_names - self.user_group_cache.keys()
+        if unseen_group_names:
+            result += NamedUserGroup.objects.filter(
+                realm_id=self.realm_id, name__in=unseen_group_names
+            )
+        return result
+
+    def get_user_group_members(self, user_group_ids: list[int]) -> dict[int, set[int]]:
+        result = {
+            group_id: self.user_group_members_cache[group_id]
+            for group_id in user_group_ids
+            if group_id in self.user_group_members_cache
+        }
+        unseen_group_ids = [group_id for group_id in user_group_ids if group_id not in result]
+        if unseen_group_ids:
+            # Fetch membership for the groups in a single, efficient
+            # bulk query, mapping each group to its direct and
+            # indirect members.
+            for group_root_id, member_id in (
+                get_root_id_annotated_recursive_subgroups_for_groups(
+                    unseen_group_ids, self.realm_id
+                )
+                .filter(direct_members__is_active=True)
+                .values_list("root_id", "direct_members")  # type: ignore[misc]  # root_id is an annotated field.
+            ):
+                result.setdefault(group_root_id, set()).add(member_id)
+        return result
+
+    def prefetch_user_group_data(
+        self, group_names: set[str], non_silent_group_names: set[str]
+    ) -> None:
+        """Fetches the user groups mentioned in a whole batch of
+        messages, and the membership of those that were mentioned
+        non-silently, in two queries."""
+        user_groups = self.get_user_groups_by_name(group_names)
+        self.user_group_cache.update(dict.fromkeys(group_names))
+        self.user_group_cache.update({group.name: group for group in user_groups})
+
+        user_group_ids = [
+            group.id
+            for group in user_groups
+            if not group.deactivated and group.name in non_silent_group_names
+        ]
+        members = self.get_user_group_members(user_group_ids)
+        for group_id in user_group_ids:
+            self.user_group_members_cache[group_id] = members.get(group_id, set())
+
 
 def user_mention_matches_topic_wildcard(mention: str) -> bool:
     return mention in topic_wildcards
@@ -340,12 +437,7 @@ def possible_user_group_mentions(content: str) -> dict[str, Literal["silent", "n
     return mentions
 
 
-def get_possible_mentions_info(
-    mention_backend: MentionBackend, mention_texts: set[str], message_sender: UserProfile | None
-) -> list[FullNameInfo]:
-    if not mention_texts:
-        return []
-
+def get_user_filters(mention_texts: set[str]) -> list[UserFilter]:
     user_filters = list()
 
     name_re = r"(?P<full_name>.+)?\|(?P<mention_id>\d+)$"
@@ -365,7 +457,16 @@ def get_possible_mentions_info(
             # For **name** syntax.
             user_filters.append(UserFilter(full_name=mention_text, id=None))
 
-    return mention_backend.get_full_name_info_list(user_filters, message_sender)
+    return user_filters
+
+
+def get_possible_mentions_info(
+    mention_backend: MentionBackend, mention_texts: set[str], message_sender: UserProfile | None
+) -> list[FullNameInfo]:
+    if not mention_texts:
+        return []
+
+    return mention_backend.get_full_name_info_list(get_user_filters(mention_texts), message_sender)
 
 
 class MentionData:
@@ -373,7 +474,6 @@ class MentionData:
         self, mention_backend: MentionBackend, content: str, message_sender: UserProfile | None
     ) -> None:
         self.mention_backend = mention_backend
-        realm_id = mention_backend.realm_id
         self.message_sender = message_sender
         mentions = possible_mentions(content)
         possible_mentions_info = get_possible_mentions_info(
@@ -381,7 +481,7 @@ class MentionData:
         )
         self.full_name_info = {row.full_name.lower(): row for row in possible_mentions_info}
         self.user_id_info = {row.id: row for row in possible_mentions_info}
-        self.init_user_group_data(realm_id=realm_id, content=content)
+        self.init_user_group_data(content=content)
         self.has_stream_wildcards = mentions.message_has_stream_wildcards
         self.has_topic_wildcards = mentions.message_has_topic_wildcards
 
@@ -391,13 +491,13 @@ class MentionData:
     def message_has_topic_wildcards(self) -> bool:
         return self.has_topic_wildcards
 
-    def init_user_group_data(self, realm_id: int, content: str) -> None:
+    def init_user_group_data(self, content: str) -> None:
         self.user_group_name_info: dict[str, NamedUserGroup] = {}
         self.user_group_members: dict[int, set[int]] = defaultdict(set)
         user_group_names_mentions = possible_user_group_mentions(content)
         if user_group_names_mentions:
-            named_user_groups = NamedUserGroup.objects.filter(
-                realm_id=realm_id, name__in=user_group_names_mentions
+            named_user_groups = self.mention_backend.get_user_groups_by_name(
+                set(user_group_names_mentions)
             )
 
             # No filter here as we need user_group_name_info for all groups mentions.
@@ -419,15 +519,9 @@ class MentionData:
             if len(filtered_group_ids) == 0:
                 return
 
-            # Fetch membership for the groups filtered above in a
-            # single, efficient bulk query, mapping each group to its
-            # direct and indirect members.
-            for group_root_id, member_id in (
-                get_root_id_annotated_recursive_subgroups_for_groups(filtered_group_ids, realm_id)
-                .filter(direct_members__is_active=True)
-                .values_list("root_id", "direct_members")  # type: ignore[misc]  # root_id is an annotated field.
-            ):
-                self.user_group_members[group_root_id].add(member_id)
+            self.user_group_members.update(
+                self.mention_backend.get_user_group_members(filtered_group_ids)
+            )
 
     def get_user_by_name(self, name: str) -> FullNameInfo | None:
         # warning: get_user_by_name is not dependable if two
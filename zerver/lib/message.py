@@ -283,7 +283,12 @@ def messages_for_ids(
     message_edit_history_visibility_policy: int,
     user_profile: UserProfile | None,
     realm: Realm,
+    raw_content: bool = False,
 ) -> list[dict[str, Any]]:
+    """With raw_content=True, the content of messages found in the
+    cache is returned as orjson.Fragment objects, for callers which
+    just serialize the message dicts into a response; see
+    extract_message_dict."""
     id_fetcher = lambda row: row["id"]
 
     message_dicts = generic_bulk_cached_fetch(
@@ -292,7 +297,9 @@ def messages_for_ids(
         message_ids,
         id_fetcher=id_fetcher,
         cache_transformer=lambda obj: obj,
-        extractor=extract_message_dict,
+        extractor=lambda message_bytes: extract_message_dict(
+            message_bytes, raw_content=raw_content
+        ),
         setter=stringify_message_dict,
         pickled_tupled=False,
     )
@@ -7,7 +7,13 @@ from typing import Any, TypedDict
 import orjson
 
 from zerver.lib.avatar import get_avatar_field, get_avatar_for_inaccessible_user
-from zerver.lib.cache import cache_set_many, cache_with_key, to_dict_cache_key, to_dict_cache_key_id
+from zerver.lib.cache import (
+    cache_delete,
+    cache_set_many,
+    cache_with_key,
+    to_dict_cache_key,
+    to_dict_cache_key_id,
+)
 from zerver.lib.display_recipient import bulk_fetch_display_recipients
 from zerver.lib.markdown import render_message_markdown, topic_links
 from zerver.lib.markdown import version as markdown_version
@@ -62,12 +68,104 @@ def sew_messages_and_submessages(
             message["submessages"].append(submessage)
 
 
-def extract_message_dict(message_bytes: bytes) -> dict[str, Any]:
-    return orjson.loads(message_bytes)
+# Message dicts are cached as three lines of JSON: the dict without
+# its content fields, followed by the JSON-encoded content and
+# rendered_content.  (orjson escapes newlines within strings, so none
+# of the lines can contain one.)  The content fields are usually most
+# of the payload, and code paths which only pass them through to an
+# API response can use raw_content=True to get them as
+# orjson.Fragment objects, which orjson writes out as-is, without
+# decoding and re-encoding them.
+RAW_CONTENT_FIELDS = ("content", "rendered_content")
+
+# The first line is usually a JSON array of the values of these
+# fields, in this order, followed by those of the OPTIONAL fields if
+# the message has been edited; reactions are arrays of the values of
+# REACTION_FIELDS.  Leaving out the field names, which are the same
+# for every message, makes cached messages considerably smaller.
+# Dicts which don't fit this schema are cached with a JSON object as
+# their first line instead.
+MESSAGE_CACHE_FIELDS = (
+    "id",
+    "sender_id",
+    "recipient_type_id",
+    "recipient_type",
+    "recipient_id",
+    "timestamp",
+    "client",
+    TOPIC_NAME,
+    "sender_realm_id",
+    TOPIC_LINKS,
+    "is_me_message",
+    "reactions",
+    "submessages",
+)
+MESSAGE_CACHE_OPTIONAL_FIELDS = ("last_edit_timestamp", "edit_history")
+MESSAGE_CACHE_REACTION_FIELDS = ("emoji_name", "emoji_code", "reaction_type", "user_id")
+
+
+def encode_message_cache_header(header: dict[str, Any]) -> bytes:
+    field_names = MESSAGE_CACHE_FIELDS
+    if "last_edit_timestamp" in header:
+        field_names += MESSAGE_CACHE_OPTIONAL_FIELDS
+    reactions = header.get("reactions")
+    if (
+        header.keys() != set(field_names)
+        or not isinstance(reactions, list)
+        or any(reaction.keys() != set(MESSAGE_CACHE_REACTION_FIELDS) for reaction in reactions)
+    ):
+        return orjson.dumps(header)
+    values = [header[field_name] for field_name in field_names]
+    values[MESSAGE_CACHE_FIELDS.index("reactions")] = [
+        [reaction[field_name] for field_name in MESSAGE_CACHE_REACTION_FIELDS]
+        for reaction in reactions
+    ]
+    return orjson.dumps(values)
+
+
+def decode_message_cache_header(header_bytes: bytes) -> dict[str, Any]:
+    if not header_bytes.startswith(b"["):
+        return orjson.loads(header_bytes)
+    values = orjson.loads(header_bytes)
+    message_dict = dict(zip(MESSAGE_CACHE_FIELDS, values, strict=False))
+    if len(values) > len(MESSAGE_CACHE_FIELDS):
+        message_dict.update(
+            zip(MESSAGE_CACHE_OPTIONAL_FIELDS, values[len(MESSAGE_CACHE_FIELDS) :], strict=True)
+        )
+    message_dict["reactions"] = [
+        dict(zip(MESSAGE_CACHE_REACTION_FIELDS, reaction, strict=True))
+        for reaction in message_dict["reactions"]
+    ]
+    return message_dict
+
+
+def extract_message_dict(message_bytes: bytes, raw_content: bool = False) -> dict[str, Any] | None:
+    """Returns None if message_bytes is not in the format written by
+    stringify_message_dict (e.g. it was cached by an older version of
+    the server), so that callers can treat it as a cache miss."""
+    header, *content_fields = message_bytes.split(b"\n")
+    if len(content_fields) != len(RAW_CONTENT_FIELDS):
+        return None
+    try:
+        message_dict = decode_message_cache_header(header)
+        for field_name, field_bytes in zip(RAW_CONTENT_FIELDS, content_fields, strict=True):
+            if raw_content:
+                message_dict[field_name] = orjson.Fragment(field_bytes)
+            else:
+                message_dict[field_name] = orjson.loads(field_bytes)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return message_dict
 
 
 def stringify_message_dict(message_dict: dict[str, Any]) -> bytes:
-    return orjson.dumps(message_dict)
+    header = {key: value for key, value in message_dict.items() if key not in RAW_CONTENT_FIELDS}
+    return b"\n".join(
+        [
+            encode_message_cache_header(header),
+            *(orjson.dumps(message_dict[field_name]) for field_name in RAW_CONTENT_FIELDS),
+        ]
+    )
 
 
 @cache_with_key(to_dict_cache_key, timeout=3600 * 24, pickled_tupled=False)
@@ -142,6 +240,11 @@ class MessageDict:
         """
         encoded_object_bytes = message_to_encoded_cache(message, realm_id)
         obj = extract_message_dict(encoded_object_bytes)
+        if obj is None:
+            # The cached value is malformed; replace it.
+            cache_delete(to_dict_cache_key(message, realm_id))
+            obj = extract_message_dict(message_to_encoded_cache(message, realm_id))
+            assert obj is not None
 
         """
         The steps below are similar to what we do in
@@ -1,21 +1,27 @@
+import hashlib
 import re
+import secrets
+import time
 from collections.abc import Callable, Iterable, Sequence
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import Any, Generic, TypeAlias, TypeVar
 
+import orjson
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core import signing
 from django.core.exceptions import ValidationError
 from django.db import connection
 from django.utils.translation import gettext as _
 from pydantic import BaseModel, model_validator
 from sqlalchemy.dialects import postgresql
-from sqlalchemy.engine import Connection, Row
+from sqlalchemy.engine import Connection
 from sqlalchemy.sql import (
     ClauseElement,
     ColumnElement,
     Select,
     and_,
+    cast,
     column,
     false,
     func,
@@ -33,6 +39,12 @@ from sqlalchemy.types import ARRAY, Boolean, Integer, Text
 from typing_extensions import override
 
 from zerver.lib.addressee import get_user_profiles, get_user_profiles_by_ids
+from zerver.lib.cache import (
+    cache_get,
+    cache_set,
+    web_public_narrow_results_cache_key,
+    web_public_narrow_results_generation_cache_key,
+)
 from zerver.lib.exceptions import ErrorCode, JsonableError, MissingAuthenticationError
 from zerver.lib.message import (
     access_message,
@@ -41,6 +53,7 @@ from zerver.lib.message import (
 )
 from zerver.lib.narrow_predicate import channel_operators, channels_operators
 from zerver.lib.recipient_users import recipient_for_user_profiles
+from zerver.lib.search_index import SEARCH_INDEX_MAX_RESULTS, SearchIndexMatch, search_messages
 from zerver.lib.sqlalchemy_utils import get_sqlalchemy_connection
 from zerver.lib.streams import (
     can_access_stream_history_by_id,
@@ -57,6 +70,7 @@ from zerver.lib.topic_sqlalchemy import (
     topic_match_sa,
 )
 from zerver.lib.types import Validator
+from zerver.lib.unread_watermarks import get_unread_watermark, set_unread_watermark
 from zerver.lib.user_groups import get_recursive_membership_groups
 from zerver.lib.user_topics import exclude_stream_and_topic_mutes
 from zerver.lib.validator import (
@@ -217,6 +231,11 @@ class InvalidOperatorCombinationError(JsonableError):
 
 ConditionTransform: TypeAlias = Callable[[ClauseElement], ClauseElement]
 
+# The user's channel and topic muting conditions, by the ID of the
+# channel a narrow is limited to (or None), for sharing them between
+# the narrows fetched by a single request; see exclude_muting_conditions.
+MutingConditionsCache: TypeAlias = dict[int | None, list[ClauseElement]]
+
 # These delimiters will not appear in rendered messages or HTML-escaped topics.
 TS_START = "<ts-match>"
 TS_STOP = "</ts-match>"
@@ -269,11 +288,17 @@ class NarrowBuilder:
         msg_id_column: ColumnElement[Integer],
         realm: Realm,
         is_web_public_query: bool = False,
+        include_search_highlights: bool = True,
+        muting_conditions_cache: MutingConditionsCache | None = None,
     ) -> None:
         self.user_profile = user_profile
         self.msg_id_column = msg_id_column
         self.realm = realm
         self.is_web_public_query = is_web_public_query
+        # Whether search terms should add the content_matches and
+        # topic_matches columns, for highlighting the matches.
+        self.include_search_highlights = include_search_highlights
+        self.muting_conditions_cache = muting_conditions_cache
         self.by_method_map = {
             "has": self.by_has,
             "in": self.by_in,
@@ -383,7 +408,9 @@ class NarrowBuilder:
 
         if operand == "home":
             conditions = exclude_muting_conditions(
-                self.user_profile, [NarrowParameter(operator="in", operand="home")]
+                self.user_profile,
+                [NarrowParameter(operator="in", operand="home")],
+                self.muting_conditions_cache,
             )
             if conditions:
                 return query.where(maybe_negate(and_(*conditions)))
@@ -438,7 +465,9 @@ class NarrowBuilder:
             # a lot more efficient if limited to only those muting
             # rules that appear in such channels.
             conditions = exclude_muting_conditions(
-                self.user_profile, [NarrowParameter(operator="is", operand="muted")]
+                self.user_profile,
+                [NarrowParameter(operator="is", operand="muted")],
+                self.muting_conditions_cache,
             )
             if conditions:
                 return query.where(maybe_negate(not_(and_(*conditions))))
@@ -789,6 +818,18 @@ class NarrowBuilder:
         return query.where(maybe_negate(cond))
 
     def by_search(self, query: Select, operand: str, maybe_negate: ConditionTransform) -> Select:
+        if settings.SEARCH_INDEX_PATH is not None:
+            matches = search_messages(
+                self.realm.id, operand, highlight=self.include_search_highlights
+            )
+            if matches is not None:
+                return self._by_search_index(query, operand, matches, maybe_negate)
+            # The index hasn't been built yet.
+        return self._by_search_postgresql(query, operand, maybe_negate)
+
+    def _by_search_postgresql(
+        self, query: Select, operand: str, maybe_negate: ConditionTransform
+    ) -> Select:
         if settings.USING_PGROONGA:
             return self._by_search_pgroonga(query, operand, maybe_negate)
         else:
@@ -801,32 +842,77 @@ class NarrowBuilder:
         query_extract_keywords = func.pgroonga_query_extract_keywords
         operand_escaped = func.escape_html(operand, type_=Text)
         keywords = query_extract_keywords(operand_escaped)
-        query = query.add_columns(
-            match_positions_character(column("rendered_content", Text), keywords).label(
-                "content_matches"
-            ),
-            match_positions_character(
-                func.escape_html(topic_column_sa(), type_=Text), keywords
-            ).label("topic_matches"),
-        )
+        if self.include_search_highlights:
+            query = query.add_columns(
+                match_positions_character(column("rendered_content", Text), keywords).label(
+                    "content_matches"
+                ),
+                match_positions_character(
+                    func.escape_html(topic_column_sa(), type_=Text), keywords
+                ).label("topic_matches"),
+            )
         condition = column("search_pgroonga", Text).op("&@~")(operand_escaped)
         return query.where(maybe_negate(condition))
 
+    def _by_search_index(
+        self,
+        query: Select,
+        operand: str,
+        matches: list[SearchIndexMatch],
+        maybe_negate: ConditionTransform,
+    ) -> Select:
+        if self.include_search_highlights:
+            # Pass the match offsets for each message to PostgreSQL, so
+            # that the columns are the same as for the other backends.
+            content_matches = {str(match.message_id): match.content_matches for match in matches}
+            topic_matches = {str(match.message_id): match.topic_matches for match in matches}
+            message_id_key = cast(self.msg_id_column, Text)
+            no_matches = literal([], postgresql.JSONB)
+            query = query.add_columns(
+                func.coalesce(
+                    literal(content_matches, postgresql.JSONB)[message_id_key], no_matches
+                ).label("content_matches"),
+                func.coalesce(
+                    literal(topic_matches, postgresql.JSONB)[message_id_key], no_matches
+                ).label("topic_matches"),
+            )
+        condition: ColumnElement[bool] = self.msg_id_column.in_(
+            [match.message_id for match in matches]
+        )
+        if len(matches) >= SEARCH_INDEX_MAX_RESULTS:
+            # The index only returned the most recent matches, so we
+            # search the older messages in PostgreSQL.  This way,
+            # neither the results nor their negation are limited to
+            # the matches the index returned.
+            older_messages_query = self._by_search_postgresql(select(), operand, lambda cond: cond)
+            assert older_messages_query.whereclause is not None
+            condition = or_(
+                condition,
+                and_(
+                    self.msg_id_column < matches[-1].message_id,
+                    older_messages_query.whereclause,
+                ),
+            )
+        return query.where(maybe_negate(condition))
+
     def _by_search_tsearch(
         self, query: Select, operand: str, maybe_negate: ConditionTransform
     ) -> Select:
         tsquery = func.plainto_tsquery(literal("zulip.english_us_search"), literal(operand))
-        query = query.add_columns(
-            ts_locs_array(
-                literal("zulip.english_us_search", Text), column("rendered_content", Text), tsquery
-            ).label("content_matches"),
-            # We HTML-escape the topic in PostgreSQL to avoid doing a server round-trip
-            ts_locs_array(
-                literal("zulip.english_us_search", Text),
-                func.escape_html(topic_column_sa(), type_=Text),
-                tsquery,
-            ).label("topic_matches"),
-        )
+        if self.include_search_highlights:
+            query = query.add_columns(
+                ts_locs_array(
+                    literal("zulip.english_us_search", Text),
+                    column("rendered_content", Text),
+                    tsquery,
+                ).label("content_matches"),
+                # We HTML-escape the topic in PostgreSQL to avoid doing a server round-trip
+                ts_locs_array(
+                    literal("zulip.english_us_search", Text),
+                    func.escape_html(topic_column_sa(), type_=Text),
+                    tsquery,
+                ).label("topic_matches"),
+            )
 
         # Do quoted string matching.  We really want phrase
         # search here so we can ignore punctuation and do
@@ -912,6 +998,24 @@ def get_channel_from_narrow_access_unchecked(
     return None
 
 
+def get_channel_narrow_recipient_id(
+    realm: Realm, narrow: list[NarrowParameter] | None
+) -> int | None:
+    """The recipient ID of the one channel the narrow is limited to,
+    if any."""
+    if narrow is None or realm.is_zephyr_mirror_realm:
+        # Channel terms match several channels in Zephyr mirror realms.
+        return None
+    for term in narrow:
+        if term.operator in channel_operators and not term.negated:
+            try:
+                channel = get_stream_by_narrow_operand_access_unchecked(term.operand, realm)
+            except Stream.DoesNotExist:
+                return None
+            return channel.recipient_id
+    return None
+
+
 # This function verifies if the current narrow has the necessary
 # terms to point to a channel or a direct message conversation.
 def can_narrow_define_conversation(narrow: list[NarrowParameter]) -> bool:
@@ -1039,7 +1143,9 @@ def update_narrow_terms_containing_with_operator(
 
 
 def exclude_muting_conditions(
-    user_profile: UserProfile, narrow: list[NarrowParameter] | None
+    user_profile: UserProfile,
+    narrow: list[NarrowParameter] | None,
+    muting_conditions_cache: MutingConditionsCache | None = None,
 ) -> list[ClauseElement]:
     conditions: list[ClauseElement] = []
     channel_id = None
@@ -1053,7 +1159,12 @@ def exclude_muting_conditions(
     except Stream.DoesNotExist:
         pass
 
+    if muting_conditions_cache is not None and channel_id in muting_conditions_cache:
+        return muting_conditions_cache[channel_id]
+
     conditions = exclude_stream_and_topic_mutes(conditions, user_profile, channel_id)
+    if muting_conditions_cache is not None:
+        muting_conditions_cache[channel_id] = conditions
 
     # Muted user logic for hiding messages is implemented entirely
     # client-side. This is by design, as it allows UI to hint that
@@ -1160,6 +1271,11 @@ def get_base_query_for_search(
     return (query, inner_msg_id_col)
 
 
+def get_search_operand(narrow: list[NarrowParameter]) -> str:
+    # Like add_narrow_conditions, combine all of the search terms.
+    return " ".join(term.operand for term in narrow if term.operator == "search")
+
+
 def add_narrow_conditions(
     user_profile: UserProfile | None,
     inner_msg_id_col: ColumnElement[Integer],
@@ -1167,6 +1283,8 @@ def add_narrow_conditions(
     narrow: list[NarrowParameter] | None,
     is_web_public_query: bool,
     realm: Realm,
+    include_search_highlights: bool = True,
+    muting_conditions_cache: MutingConditionsCache | None = None,
 ) -> tuple[Select, bool, bool]:
     is_search = False  # for now
 
@@ -1174,7 +1292,14 @@ def add_narrow_conditions(
         return (query, is_search, False)
 
     # Build the query for the narrow
-    builder = NarrowBuilder(user_profile, inner_msg_id_col, realm, is_web_public_query)
+    builder = NarrowBuilder(
+        user_profile,
+        inner_msg_id_col,
+        realm,
+        is_web_public_query,
+        include_search_highlights=include_search_highlights,
+        muting_conditions_cache=muting_conditions_cache,
+    )
     search_operands = []
 
     # As we loop through terms, builder does most of the work to extend
@@ -1205,10 +1330,11 @@ def add_narrow_conditions(
         # is no need for any special handling in `process_fts_updates` to align with this
         # escaping logic.
         is_search = True
-        query = query.add_columns(
-            func.escape_html(topic_column_sa(), type_=Text).label("escaped_topic_name"),
-            column("rendered_content", Text),
-        )
+        if include_search_highlights:
+            query = query.add_columns(
+                func.escape_html(topic_column_sa(), type_=Text).label("escaped_topic_name"),
+                column("rendered_content", Text),
+            )
         search_term = NarrowParameter(
             operator="search",
             operand=" ".join(search_operands),
@@ -1222,6 +1348,7 @@ def find_first_unread_anchor(
     sa_conn: Connection,
     user_profile: UserProfile | None,
     narrow: list[NarrowParameter] | None,
+    muting_conditions_cache: MutingConditionsCache | None = None,
 ) -> int:
     # For anonymous web users, all messages are treated as read, and so
     # always return LARGER_THAN_MAX_MESSAGE_ID.
@@ -1238,6 +1365,7 @@ def find_first_unread_anchor(
         need_user_message=need_user_message,
     )
     query = query.add_columns(column("flags", Integer))
+    base_query = query
 
     query, is_search, is_dm_narrow = add_narrow_conditions(
         user_profile=user_profile,
@@ -1246,28 +1374,65 @@ def find_first_unread_anchor(
         narrow=narrow,
         is_web_public_query=False,
         realm=user_profile.realm,
+        include_search_highlights=False,
+        muting_conditions_cache=muting_conditions_cache,
     )
 
     condition = column("flags", Integer).op("&")(UserMessage.flags.read.mask) == 0
 
     # We exclude messages on muted topics when finding the first unread
     # message in this narrow
+    muting_conditions: list[ClauseElement] = []
     if not is_dm_narrow:
         # Since building the channel/topic muting conditions takes
         # extra queries and makes the query potentially much more
         # verbose for PostgreSQL to parse, we skip this for searches
         # which we know they cannot apply do -- DMs.
-        muting_conditions = exclude_muting_conditions(user_profile, narrow)
+        muting_conditions = exclude_muting_conditions(user_profile, narrow, muting_conditions_cache)
         if muting_conditions:
             condition = and_(condition, *muting_conditions)
 
-    first_unread_query = query.where(condition)
-    first_unread_query = first_unread_query.order_by(inner_msg_id_col.asc()).limit(1)
-    first_unread_result = list(sa_conn.execute(first_unread_query).fetchall())
-    if len(first_unread_result) > 0:
-        anchor = first_unread_result[0][0]
+    def get_first_unread_id(first_unread_query: Select) -> int:
+        first_unread_query = first_unread_query.order_by(inner_msg_id_col.asc()).limit(1)
+        first_unread_result = list(sa_conn.execute(first_unread_query).fetchall())
+        if len(first_unread_result) > 0:
+            return first_unread_result[0][0]
+        return LARGER_THAN_MAX_MESSAGE_ID
+
+    # In a channel narrow, skip over the user's unread messages older
+    # than the first unread message in the channel.
+    watermark_recipient_id = get_channel_narrow_recipient_id(user_profile.realm, narrow)
+    if watermark_recipient_id is None:
+        return get_first_unread_id(query.where(condition))
+
+    watermark = get_unread_watermark(user_profile.id, watermark_recipient_id)
+    lower_bound = inner_msg_id_col >= (0 if watermark is None else watermark)
+    if narrow is not None and len(narrow) == 1 and not muting_conditions:
+        # The first unread message in the narrow is exactly the first
+        # unread message in the channel.
+        anchor = first_unread_in_channel_id = get_first_unread_id(
+            query.where(condition, lower_bound)
+        )
     else:
-        anchor = LARGER_THAN_MAX_MESSAGE_ID
+        # Find the first unread message in the channel, including
+        # muted ones, to update the watermark with; the first one in
+        # the narrow can't be older.
+        first_unread_in_channel_id = get_first_unread_id(
+            base_query.where(
+                column("flags", Integer).op("&")(UserMessage.flags.read.mask) == 0,
+                column("recipient_id", Integer) == literal(watermark_recipient_id),
+                lower_bound,
+            )
+        )
+        if first_unread_in_channel_id == LARGER_THAN_MAX_MESSAGE_ID:
+            anchor = LARGER_THAN_MAX_MESSAGE_ID
+        else:
+            anchor = get_first_unread_id(
+                query.where(condition, inner_msg_id_col >= first_unread_in_channel_id)
+            )
+
+    if first_unread_in_channel_id != watermark:
+        set_unread_watermark(user_profile.id, watermark_recipient_id, first_unread_in_channel_id)
 
     return anchor
 
@@ -1482,24 +1647,137 @@ def clean_narrow_for_message_fetch(
 
 
 @dataclass
-class FetchedMessages(LimitedMessages[Row]):
+class FetchedMessages(LimitedMessages[Sequence[Any]]):
     anchor: int | None
     include_history: bool
     is_search: bool
 
 
-def fetch_messages(
-    *,
+@dataclass
+class NarrowCursor:
+    narrow: list[NarrowParameter] | None
+    anchor: int
+    older: bool
+
+
+NARROW_CURSOR_SALT = "zerver.lib.narrow.NarrowCursor"
+# Cursors are only meant for scrolling through a narrow, so they
+# needn't stay valid for long.
+NARROW_CURSOR_MAX_AGE = 24 * 3600
+
+
+def make_narrow_cursor(
+    narrow: list[NarrowParameter] | None,
+    user_profile: UserProfile | None,
+    realm: Realm,
+    anchor: int,
+    older: bool,
+) -> str:
+    """Returns an opaque cursor for fetching the messages in the narrow
+    before (if older) or after the anchor message ID.  Cursors are
+    signed, and bound to the user and realm that they were issued to,
+    since the narrow they contain has already been cleaned and access
+    checked for that user."""
+    return signing.dumps(
+        {
+            "realm_id": realm.id,
+            "user_id": None if user_profile is None else user_profile.id,
+            "narrow": None if narrow is None else [term.model_dump() for term in narrow],
+            "anchor": anchor,
+            "older": older,
+        },
+        salt=NARROW_CURSOR_SALT,
+        compress=True,
+    )
+
+
+def parse_narrow_cursor(
+    cursor: str, user_profile: UserProfile | None, realm: Realm
+) -> NarrowCursor:
+    try:
+        data = signing.loads(cursor, salt=NARROW_CURSOR_SALT, max_age=NARROW_CURSOR_MAX_AGE)
+    except signing.BadSignature:
+        raise JsonableError(_("Invalid cursor"))
+    user_id = None if user_profile is None else user_profile.id
+    if data["realm_id"] != realm.id or data["user_id"] != user_id:
+        raise JsonableError(_("Invalid cursor"))
+    narrow = data["narrow"]
+    return NarrowCursor(
+        narrow=None if narrow is None else [NarrowParameter(**term) for term in narrow],
+        anchor=data["anchor"],
+        older=data["older"],
+    )
+
+
+@dataclass
+class NarrowQuery:
+    query: Select
+    inner_msg_id_col: ColumnElement[Integer]
+    include_history: bool
+    is_search: bool
+
+
+@dataclass
+class NarrowConditions:
+    whereclause: ColumnElement[bool] | None
+    is_search: bool
+
+
+# Clients scrolling through a narrow fetch it one batch at a time.  To
+# avoid rebuilding the narrow's conditions (which involves looking up
+# channels, users, and groups) for every batch, requests which resume
+# from a cursor reuse the conditions built by the previous batch for a
+# short while.  This is only a process-local cache, since the clause
+# objects aren't serializable.
+#
+# Only the narrow's own conditions are cached; the access checks
+# (ok_to_include_history, and the restrictions in
+# get_base_query_for_search) are redone for every request, and
+# whether history was included is part of the key.  Conditions which
+# embed data that can change between batches aren't cached at all;
+# see can_cache_narrow_conditions.
+NARROW_CONDITIONS_CACHE_SIZE = 100
+NARROW_CONDITIONS_CACHE_SECONDS = 30
+narrow_conditions_cache: dict[str, tuple[float, NarrowConditions]] = {}
+
+
+def narrow_conditions_cache_key(
     narrow: list[NarrowParameter] | None,
     user_profile: UserProfile | None,
     realm: Realm,
     is_web_public_query: bool,
-    anchor: int | None,
-    include_anchor: bool,
-    num_before: int,
-    num_after: int,
-    client_requested_message_ids: list[int] | None = None,
-) -> FetchedMessages:
+    include_history: bool,
+) -> str:
+    terms = None if narrow is None else [term.model_dump() for term in narrow]
+    user_id = None if user_profile is None else user_profile.id
+    return orjson.dumps([realm.id, user_id, is_web_public_query, include_history, terms]).decode()
+
+
+def can_cache_narrow_conditions(narrow: list[NarrowParameter] | None) -> bool:
+    if narrow is None:
+        return True
+    for term in narrow:
+        if term.operator in channels_operators:
+            # These conditions list which channels are public, so they
+            # encode access decisions.
+            return False
+        if term.operator == "search" and settings.SEARCH_INDEX_PATH is not None:
+            # These conditions list the IDs of the messages that the
+            # search index matched, which change as messages are sent
+            # and edited.
+            return False
+        if (term.operator, term.operand) in [("in", "home"), ("is", "muted")]:
+            # These conditions list the user's muted channels and topics.
+            return False
+    return True
+
+
+def build_narrow_base_query(
+    narrow: list[NarrowParameter] | None,
+    user_profile: UserProfile | None,
+    realm: Realm,
+    is_web_public_query: bool,
+) -> tuple[Select, ColumnElement[Integer], bool]:
     include_history = ok_to_include_history(narrow, user_profile, is_web_public_query)
     if include_history:
         # The initial query in this case doesn't use `zerver_usermessage`,
@@ -1517,7 +1795,6 @@ def fetch_messages(
 
     # get_base_query_for_search and ok_to_include_history are responsible for ensuring
     # that we only include messages the user has access to.
-    query: SelectBase
     query, inner_msg_id_col = get_base_query_for_search(
         realm_id=realm.id,
         user_profile=user_profile,
@@ -1525,7 +1802,41 @@ def fetch_messages(
     )
     if need_user_message:
         query = query.add_columns(column("flags", Integer))
+    return (query, inner_msg_id_col, include_history)
+
+
+def build_narrow_conditions(
+    narrow: list[NarrowParameter] | None,
+    user_profile: UserProfile | None,
+    realm: Realm,
+    is_web_public_query: bool,
+    inner_msg_id_col: ColumnElement[Integer],
+) -> NarrowConditions:
+    query, is_search, _is_dm_narrow = add_narrow_conditions(
+        user_profile=user_profile,
+        inner_msg_id_col=inner_msg_id_col,
+        query=select(),
+        narrow=narrow,
+        realm=realm,
+        is_web_public_query=is_web_public_query,
+        include_search_highlights=False,
+    )
+    return NarrowConditions(whereclause=query.whereclause, is_search=is_search)
+
 
+def build_narrow_query(
+    narrow: list[NarrowParameter] | None,
+    user_profile: UserProfile | None,
+    realm: Realm,
+    is_web_public_query: bool,
+    muting_conditions_cache: MutingConditionsCache | None = None,
+) -> NarrowQuery:
+    query, inner_msg_id_col, include_history = build_narrow_base_query(
+        narrow, user_profile, realm, is_web_public_query
+    )
+
+    # Search highlights are computed separately, for just the messages
+    # that are returned; see get_search_fields_for_messages.
     query, is_search, _is_dm_narrow = add_narrow_conditions(
         user_profile=user_profile,
         inner_msg_id_col=inner_msg_id_col,
@@ -1533,7 +1844,139 @@ def fetch_messages(
         narrow=narrow,
         realm=realm,
         is_web_public_query=is_web_public_query,
+        include_search_highlights=False,
+        muting_conditions_cache=muting_conditions_cache,
     )
+    return NarrowQuery(
+        query=query,
+        inner_msg_id_col=inner_msg_id_col,
+        include_history=include_history,
+        is_search=is_search,
+    )
+
+
+def get_narrow_query(
+    narrow: list[NarrowParameter] | None,
+    user_profile: UserProfile | None,
+    realm: Realm,
+    is_web_public_query: bool,
+) -> NarrowQuery:
+    """Like build_narrow_query, but using narrow_conditions_cache."""
+    query, inner_msg_id_col, include_history = build_narrow_base_query(
+        narrow, user_profile, realm, is_web_public_query
+    )
+    if not can_cache_narrow_conditions(narrow):
+        conditions = build_narrow_conditions(
+            narrow, user_profile, realm, is_web_public_query, inner_msg_id_col
+        )
+    else:
+        key = narrow_conditions_cache_key(
+            narrow, user_profile, realm, is_web_public_query, include_history
+        )
+        now = time.monotonic()
+        cached = narrow_conditions_cache.pop(key, None)
+        if cached is not None and now - cached[0] < NARROW_CONDITIONS_CACHE_SECONDS:
+            conditions = cached[1]
+        else:
+            conditions = build_narrow_conditions(
+                narrow, user_profile, realm, is_web_public_query, inner_msg_id_col
+            )
+            now = time.monotonic()
+            if len(narrow_conditions_cache) >= NARROW_CONDITIONS_CACHE_SIZE:
+                # Evict the least recently used entry.
+                del narrow_conditions_cache[next(iter(narrow_conditions_cache))]
+        narrow_conditions_cache[key] = (now, conditions)
+
+    if conditions.whereclause is not None:
+        query = query.where(conditions.whereclause)
+    return NarrowQuery(
+        query=query,
+        inner_msg_id_col=inner_msg_id_col,
+        include_history=include_history,
+        is_search=conditions.is_search,
+    )
+
+
+# Spectators all see the same messages for a given narrow, so popular
+# web-public views (e.g. the most active channels) are shared between
+# them.  Cached results are invalidated, via a per-realm generation,
+# whenever messages in web-public channels are sent, edited, moved, or
+# deleted, or such channels change; see
+# flush_web_public_narrow_results.  The timeout is just a backstop.
+WEB_PUBLIC_NARROW_RESULTS_CACHE_SECONDS = 60
+
+
+def get_web_public_narrow_results_generation(realm_id: int) -> str:
+    key = web_public_narrow_results_generation_cache_key(realm_id)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached[0]
+    generation = secrets.token_hex(8)
+    cache_set(key, generation)
+    return generation
+
+
+def get_web_public_narrow_results_cache_key(
+    narrow: list[NarrowParameter] | None,
+    realm: Realm,
+    anchor: int,
+    include_anchor: bool,
+    num_before: int,
+    num_after: int,
+) -> str:
+    terms = None if narrow is None else [term.model_dump() for term in narrow]
+    narrow_hash = hashlib.sha256(
+        orjson.dumps(
+            [
+                terms,
+                anchor,
+                include_anchor,
+                num_before,
+                num_after,
+                get_first_visible_message_id(realm),
+            ]
+        )
+    ).hexdigest()
+    generation = get_web_public_narrow_results_generation(realm.id)
+    return web_public_narrow_results_cache_key(realm.id, generation, narrow_hash)
+
+
+def fetch_messages(
+    *,
+    narrow: list[NarrowParameter] | None,
+    user_profile: UserProfile | None,
+    realm: Realm,
+    is_web_public_query: bool,
+    anchor: int | None,
+    include_anchor: bool,
+    num_before: int,
+    num_after: int,
+    client_requested_message_ids: list[int] | None = None,
+    use_narrow_query_cache: bool = False,
+    muting_conditions_cache: MutingConditionsCache | None = None,
+) -> FetchedMessages:
+    web_public_results_key = None
+    if is_web_public_query and client_requested_message_ids is None:
+        if anchor is None:
+            # All messages are read for spectators.
+            anchor = LARGER_THAN_MAX_MESSAGE_ID
+        web_public_results_key = get_web_public_narrow_results_cache_key(
+            narrow, realm, anchor, include_anchor, num_before, num_after
+        )
+        cached = cache_get(web_public_results_key)
+        if cached is not None:
+            return cached[0]
+
+    if use_narrow_query_cache:
+        narrow_query = get_narrow_query(narrow, user_profile, realm, is_web_public_query)
+    else:
+        narrow_query = build_narrow_query(
+            narrow, user_profile, realm, is_web_public_query, muting_conditions_cache
+        )
+    query: SelectBase = narrow_query.query
+    inner_msg_id_col = narrow_query.inner_msg_id_col
+    include_history = narrow_query.include_history
+    is_search = narrow_query.is_search
 
     anchored_to_left = False
     anchored_to_right = False
@@ -1548,6 +1991,7 @@ def fetch_messages(
                     sa_conn,
                     user_profile,
                     narrow,
+                    muting_conditions_cache,
                 )
 
             anchored_to_left = anchor == 0
@@ -1588,7 +2032,7 @@ def fetch_messages(
         else:
             visible_rows = rows
         return FetchedMessages(
-            rows=visible_rows,
+            rows=list(visible_rows),
             found_anchor=False,
             found_newest=False,
             found_oldest=False,
@@ -1609,8 +2053,8 @@ def fetch_messages(
         first_visible_message_id=first_visible_message_id,
     )
 
-    return FetchedMessages(
-        rows=query_info.rows,
+    fetched_messages = FetchedMessages(
+        rows=list(query_info.rows),
         found_anchor=query_info.found_anchor,
         found_newest=query_info.found_newest,
         found_oldest=query_info.found_oldest,
@@ -1619,3 +2063,10 @@ def fetch_messages(
         include_history=include_history,
         is_search=is_search,
     )
+    if web_public_results_key is not None:
+        cache_set(
+            web_public_results_key,
+            replace(fetched_messages, rows=[tuple(row) for row in fetched_messages.rows]),
+            timeout=WEB_PUBLIC_NARROW_RESULTS_CACHE_SECONDS,
+        )
+    return fetched_messages
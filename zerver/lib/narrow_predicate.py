@@ -1,10 +1,11 @@
-from collections.abc import Collection
-from typing import Any, Protocol
+from collections.abc import Callable, Collection, Sequence
+from functools import lru_cache
+from typing import Any, Protocol, TypeAlias
 
 from django.utils.translation import gettext as _
 
 from zerver.lib.exceptions import JsonableError
-from zerver.lib.narrow_helpers import NeverNegatedNarrowTerm
+from zerver.lib.narrow_helpers import NeverNegatedNarrowTerm, narrow_dataclasses_from_tuples
 from zerver.lib.topic import RESOLVED_TOPIC_PREFIX, get_topic_from_message_info
 
 # "stream" is a legacy alias for "channel"
@@ -30,6 +31,46 @@ class NarrowPredicate(Protocol):
     def __call__(self, *, message: dict[str, Any], flags: list[str]) -> bool: ...
 
 
+MessageCheck: TypeAlias = Callable[[dict[str, Any], list[str]], bool]
+
+
+def compile_narrow_term(term: NeverNegatedNarrowTerm) -> MessageCheck | None:
+    """Returns a check for whether a message matches the narrow term,
+    with all the work that only depends on the term already done, or
+    None if every message matches it."""
+    operator = term.operator
+    operand = term.operand
+    if operator in channel_operators:
+        channel_name = operand.lower()
+        return lambda message, flags: (
+            message["type"] == "stream" and message["display_recipient"].lower() == channel_name
+        )
+    elif operator == "topic":
+        topic_name = operand.lower()
+        return lambda message, flags: (
+            message["type"] == "stream"
+            and get_topic_from_message_info(message).lower() == topic_name
+        )
+    elif operator == "sender":
+        sender_email = operand.lower()
+        return lambda message, flags: message["sender_email"].lower() == sender_email
+    elif operator == "is" and operand in ["dm", "private"]:
+        # "is:private" is a legacy alias for "is:dm"
+        return lambda message, flags: message["type"] == "private"
+    elif operator == "is" and operand in ["starred"]:
+        return lambda message, flags: "starred" in flags
+    elif operator == "is" and operand == "unread":
+        return lambda message, flags: "read" not in flags
+    elif operator == "is" and operand in ["alerted", "mentioned"]:
+        return lambda message, flags: "mentioned" in flags
+    elif operator == "is" and operand == "resolved":
+        return lambda message, flags: (
+            message["type"] == "stream"
+            and get_topic_from_message_info(message).startswith(RESOLVED_TOPIC_PREFIX)
+        )
+    return None
+
+
 def build_narrow_predicate(
     narrow: Collection[NeverNegatedNarrowTerm],
 ) -> NarrowPredicate:
@@ -37,48 +78,35 @@ def build_narrow_predicate(
     NarrowLibraryTest."""
     check_narrow_for_events(narrow)
 
+    # Tornado calls the predicate for every message event sent to a
+    # narrowed queue's user, so we interpret the narrow just once, here.
+    checks: list[MessageCheck] = []
+    for narrow_term in narrow:
+        # TODO: Eventually handle negated narrow terms.
+        check = compile_narrow_term(narrow_term)
+        if check is not None:
+            checks.append(check)
+
+    if not checks:
+        return lambda *, message, flags: True
+
+    if len(checks) == 1:
+        [check] = checks
+        return lambda *, message, flags: check(message, flags)
+
     def narrow_predicate(*, message: dict[str, Any], flags: list[str]) -> bool:
-        def satisfies_operator(*, operator: str, operand: str) -> bool:
-            if operator in channel_operators:
-                if message["type"] != "stream":
-                    return False
-                if operand.lower() != message["display_recipient"].lower():
-                    return False
-            elif operator == "topic":
-                if message["type"] != "stream":
-                    return False
-                topic_name = get_topic_from_message_info(message)
-                if operand.lower() != topic_name.lower():
-                    return False
-            elif operator == "sender":
-                if operand.lower() != message["sender_email"].lower():
-                    return False
-            elif operator == "is" and operand in ["dm", "private"]:
-                # "is:private" is a legacy alias for "is:dm"
-                if message["type"] != "private":
-                    return False
-            elif operator == "is" and operand in ["starred"]:
-                if operand not in flags:
-                    return False
-            elif operator == "is" and operand == "unread":
-                if "read" in flags:
-                    return False
-            elif operator == "is" and operand in ["alerted", "mentioned"]:
-                if "mentioned" not in flags:
-                    return False
-            elif operator == "is" and operand == "resolved":
-                if message["type"] != "stream":
-                    return False
-                topic_name = get_topic_from_message_info(message)
-                if not topic_name.startswith(RESOLVED_TOPIC_PREFIX):
-                    return False
-            return True
-
-        for narrow_term in narrow:
-            # TODO: Eventually handle negated narrow terms.
-            if not satisfies_operator(operator=narrow_term.operator, operand=narrow_term.operand):
-                return False
-
-        return True
+        return all(check(message, flags) for check in checks)
 
     return narrow_predicate
+
+
+@lru_cache(maxsize=1024)
+def get_shared_narrow_predicate(narrow: tuple[tuple[str, str], ...]) -> NarrowPredicate:
+    return build_narrow_predicate(narrow_dataclasses_from_tuples(narrow))
+
+
+def get_narrow_predicate(narrow: Collection[Sequence[str]]) -> NarrowPredicate:
+    """Like build_narrow_predicate, for a narrow in the legacy tuple
+    format, but sharing the predicate between all the event queues
+    with the same narrow."""
+    return get_shared_narrow_predicate(tuple((operator, operand) for operator, operand in narrow))
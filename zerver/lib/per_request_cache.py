@@ -1,26 +1,56 @@
-from collections.abc import Callable
-from typing import Any, TypeVar
+from collections.abc import Callable, Iterable
+from functools import wraps
+from typing import TYPE_CHECKING, Any, TypeVar
 
+from django.db.models.signals import post_delete, post_save
+from typing_extensions import ParamSpec
+
+if TYPE_CHECKING:
+    from django.db.models import Model
+
+ParamT = ParamSpec("ParamT")
 ReturnT = TypeVar("ReturnT")
 
-FUNCTION_NAME_TO_PER_REQUEST_RESULT: dict[str, dict[int, Any]] = {}
+FUNCTION_NAME_TO_PER_REQUEST_RESULT: dict[str, dict[Any, Any]] = {}
+
+
+def per_request_cache(
+    *, depends_on: Iterable["type[Model] | str"] = ()
+) -> Callable[[Callable[ParamT, ReturnT]], Callable[ParamT, ReturnT]]:
+    """Memoizes the function for the rest of the request (or queue
+    event), keyed by all of its arguments, which must be hashable.
+
+    depends_on lists models (or "app_label.ModelName" strings) whose
+    saves and deletes flush the function's results, so that a change
+    made earlier in the same request is seen by later calls."""
+
+    def decorator(f: Callable[ParamT, ReturnT]) -> Callable[ParamT, ReturnT]:
+        cache_key = f.__name__
+
+        assert cache_key not in FUNCTION_NAME_TO_PER_REQUEST_RESULT
+        FUNCTION_NAME_TO_PER_REQUEST_RESULT[cache_key] = {}
 
+        def flush(**kwargs: object) -> None:
+            flush_per_request_cache(cache_key)
 
-def return_same_value_during_entire_request(f: Callable[..., ReturnT]) -> Callable[..., ReturnT]:
-    cache_key = f.__name__
+        for model in depends_on:
+            post_save.connect(flush, sender=model, weak=False)
+            post_delete.connect(flush, sender=model, weak=False)
 
-    assert cache_key not in FUNCTION_NAME_TO_PER_REQUEST_RESULT
-    FUNCTION_NAME_TO_PER_REQUEST_RESULT[cache_key] = {}
+        @wraps(f)
+        def wrapper(*args: ParamT.args, **kwargs: ParamT.kwargs) -> ReturnT:
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+            results = FUNCTION_NAME_TO_PER_REQUEST_RESULT[cache_key]
+            if key in results:
+                return results[key]
 
-    def wrapper(key: int, *args: Any) -> ReturnT:
-        if key in FUNCTION_NAME_TO_PER_REQUEST_RESULT[cache_key]:
-            return FUNCTION_NAME_TO_PER_REQUEST_RESULT[cache_key][key]
+            result = f(*args, **kwargs)
+            results[key] = result
+            return result
 
-        result = f(key, *args)
-        FUNCTION_NAME_TO_PER_REQUEST_RESULT[cache_key][key] = result
-        return result
+        return wrapper
 
-    return wrapper
+    return decorator
 
 
 def flush_per_request_cache(cache_key: str) -> None:
@@ -0,0 +1,68 @@
+import pickle
+from functools import lru_cache
+from typing import Any
+
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+from redis.cache import CacheConfig
+from typing_extensions import override
+
+from zerver.lib import zstd_level9
+
+# Like bmemcached, we compress values larger than this.
+COMPRESSION_THRESHOLD = 128
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class ZstdRedisSerializer(RedisSerializer):
+    """Compresses large pickled values with zstd, as bmemcached does
+    for memcached.  Integers are stored as-is, so that incr works;
+    pickles never start with the zstd frame magic number, so
+    compressed values are recognizable without a flag."""
+
+    @override
+    def dumps(self, obj: Any) -> int | bytes:
+        data = super().dumps(obj)
+        if isinstance(data, bytes) and len(data) > COMPRESSION_THRESHOLD:
+            return zstd_level9.compress(data)
+        return data
+
+    @override
+    def loads(self, data: bytes) -> Any:
+        if data.startswith(ZSTD_MAGIC):
+            data = zstd_level9.decompress(data)
+        return super().loads(data)
+
+
+class ZulipRedisCache(RedisCache):
+    """Django's Redis cache backend, which already does get_many with
+    a single MGET, set_many in a single pipeline, and delete_many with
+    a single DEL, plus:
+
+    * values are compressed, as with memcached, and
+    * with the client_cache_size option, each process keeps up to
+      that many values in memory, using Redis's server-assisted
+      client-side caching (RESP3 CLIENT TRACKING), so the server
+      invalidates them when they change.
+    """
+
+    def __init__(self, server: str, params: dict[str, Any]) -> None:
+        super().__init__(server, params)
+        options = dict(self._options)
+        client_cache_size = options.pop("client_cache_size", 0)
+        if client_cache_size:
+            options.update(protocol=3, cache_config=CacheConfig(max_size=client_cache_size))
+        self._options = {"serializer": ZstdRedisSerializer, **options}
+
+
+@lru_cache(None)
+def _get_redis_cache(location: str, param_bytes: bytes) -> ZulipRedisCache:
+    params = pickle.loads(param_bytes)  # noqa: S301
+    return ZulipRedisCache(location, params)
+
+
+def SingletonRedisCache(location: str, params: dict[str, Any]) -> ZulipRedisCache:
+    # As with SingletonBMemcached, Django instantiates the cache
+    # backend per-task, but redis-py's connection pool is already
+    # thread-safe, and the client-side cache should be shared by the
+    # whole process.
+    return _get_redis_cache(location, pickle.dumps(params))
@@ -0,0 +1,392 @@
+# Optional pool of subprocesses for running the Markdown engine.
+#
+# By default, do_convert runs the Markdown engine in a thread, using
+# zerver.lib.timeout.unsafe_timeout to give up on renders that take
+# too long.  That cannot actually stop a pathological render: the
+# thread keeps running (and competing for the GIL) until it notices
+# the asynchronous exception, which it never will if it is stuck
+# inside a single long regular expression match.
+#
+# With settings.MARKDOWN_RENDER_POOL_SIZE set, each server process
+# instead sends its renders to a small pool of subprocesses.  A
+# subprocess which takes too long is simply killed, and a replacement
+# started right away, so that it's ready by the time it's needed; each
+# render has a hard CPU time limit enforced by the kernel.  Renders
+# wait in a queue for a free subprocess; every few minutes, the pool
+# logs the queue depth and how renders went.
+#
+# The subprocesses are started with the "spawn" method, since forking
+# a server process with open connections and threads is unsafe, and
+# so take a while to import Zulip and set up Django.  All of them are
+# started when the pool is created; a render which finds none of the
+# free ones ready yet runs in a thread, as without the pool, rather
+# than waiting for one.
+#
+# This module is the subprocesses' entry point, so it must be
+# importable before Django is set up; that's why it only imports Zulip
+# code which doesn't need Django at the top level, and the rest
+# lazily.
+import logging
+import math
+import os
+import resource
+import threading
+import time
+import traceback
+from dataclasses import dataclass, fields, replace
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+from zerver.lib.timeout import TimeoutExpiredError
+
+if TYPE_CHECKING:
+    from zerver.lib.markdown import DbData, MessageRenderingResult, ZulipMarkdown
+    from zerver.lib.types import LinkifierDict
+    from zerver.lib.url_preview.types import UrlEmbedData
+    from zerver.models import Realm
+
+# How often to log the pool's statistics, in seconds.
+RENDER_POOL_STATS_INTERVAL = 300
+
+logger = logging.getLogger("zulip.render_pool")
+
+
+class RenderWorkerError(Exception):
+    """The Markdown engine raised an exception in a render
+    subprocess; the message is the formatted traceback."""
+
+
+@dataclass
+class RenderJob:
+    content: str
+    linkifiers_key: int
+    linkifiers: list["LinkifierDict"]
+    email_gateway: bool
+    has_message: bool
+    realm: "Realm | None"
+    db_data: "DbData | None"
+    image_preview_enabled: bool
+    url_embed_preview_enabled: bool
+    url_embed_data: "dict[str, UrlEmbedData | None] | None"
+    rendered_tex: dict[tuple[str, bool], str | None]
+    rendering_result: "MessageRenderingResult"
+
+
+@dataclass
+class RenderJobResult:
+    rendered_content: str
+    rendering_result: "MessageRenderingResult"
+    has_link: bool
+    has_image: bool
+
+
+@dataclass
+class RenderJobError:
+    traceback: str
+
+
+@dataclass
+class RenderPoolStats:
+    # Renders currently waiting for a free subprocess.
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    # Total seconds renders have spent waiting in the queue.
+    queue_time: float = 0.0
+    busy_workers: int = 0
+    renders: int = 0
+    # Renders which ran in a thread because no subprocess was ready.
+    unready: int = 0
+    timeouts: int = 0
+    crashes: int = 0
+
+
+class RenderWorker:
+    def __init__(self, cpu_limit: int) -> None:
+        context = get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=render_worker_main,
+            args=(child_conn, cpu_limit),
+            name="markdown-render",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def is_ready(self) -> bool:
+        """Whether the subprocess has finished starting up; this raises
+        EOFError if it died instead."""
+        if not self.ready and self.conn.poll():
+            assert self.conn.recv() == "ready"
+            self.ready = True
+        return self.ready
+
+    def render(self, job: RenderJob, timeout: float) -> RenderJobResult:
+        assert self.ready
+        self.conn.send(job)
+        if not self.conn.poll(timeout):
+            raise TimeoutExpiredError
+        # This raises EOFError if the subprocess died, e.g. by
+        # exceeding its CPU time limit.
+        result = self.conn.recv()
+        if isinstance(result, RenderJobError):
+            raise RenderWorkerError(result.traceback)
+        assert isinstance(result, RenderJobResult)
+        return result
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class RenderPool:
+    def __init__(self, size: int, cpu_limit: int) -> None:
+        self.size = size
+        self.cpu_limit = cpu_limit
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle_workers = [RenderWorker(cpu_limit) for _ in range(size)]
+        self.stats = RenderPoolStats()
+        self.stats_logged_at = time.monotonic()
+
+    def replace_worker(self, worker: RenderWorker) -> None:
+        worker.kill()
+        # The new subprocess sets up Django while we return, rather
+        # than when the next render needs it.
+        replacement = RenderWorker(self.cpu_limit)
+        with self.lock:
+            self.idle_workers.append(replacement)
+
+    def take_ready_worker(self) -> RenderWorker | None:
+        ready_worker = None
+        dead_workers = []
+        with self.lock:
+            for worker in list(self.idle_workers):
+                try:
+                    if not worker.is_ready():
+                        continue
+                except (EOFError, OSError):
+                    self.idle_workers.remove(worker)
+                    self.stats.crashes += 1
+                    dead_workers.append(worker)
+                    continue
+                self.idle_workers.remove(worker)
+                self.stats.busy_workers += 1
+                ready_worker = worker
+                break
+        for worker in dead_workers:
+            self.replace_worker(worker)
+        return ready_worker
+
+    def maybe_log_stats(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.stats_logged_at < RENDER_POOL_STATS_INTERVAL:
+                return
+            self.stats_logged_at = now
+            stats = replace(self.stats)
+            # The maximum is reported for each interval.
+            self.stats.max_queue_depth = self.stats.queue_depth
+        logger.info(
+            "Markdown render pool: queue depth %d (max %d), %.3fs queued, %d/%d workers busy, "
+            "%d renders, %d unready, %d timeouts, %d crashes",
+            stats.queue_depth,
+            stats.max_queue_depth,
+            stats.queue_time,
+            stats.busy_workers,
+            self.size,
+            stats.renders,
+            stats.unready,
+            stats.timeouts,
+            stats.crashes,
+        )
+
+    def render(self, job: RenderJob, timeout: float) -> RenderJobResult | None:
+        """Returns None if no subprocess was ready to take the job."""
+        with self.lock:
+            self.stats.queue_depth += 1
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+        start = time.perf_counter()
+        acquired = self.slots.acquire(timeout=timeout)
+        with self.lock:
+            self.stats.queue_depth -= 1
+            self.stats.queue_time += time.perf_counter() - start
+            if not acquired:
+                self.stats.timeouts += 1
+        if not acquired:
+            logging.warning(
+                "Timed out waiting for a Markdown render subprocess; queue depth %d",
+                self.stats.queue_depth,
+            )
+            self.maybe_log_stats()
+            raise TimeoutExpiredError
+
+        worker = self.take_ready_worker()
+        if worker is None:
+            with self.lock:
+                self.stats.unready += 1
+            self.slots.release()
+            self.maybe_log_stats()
+            return None
+
+        try:
+            result = worker.render(job, timeout)
+        except TimeoutExpiredError:
+            self.replace_worker(worker)
+            with self.lock:
+                self.stats.timeouts += 1
+            raise
+        except (EOFError, OSError):
+            self.replace_worker(worker)
+            with self.lock:
+                self.stats.crashes += 1
+            raise RenderWorkerError("Markdown render subprocess died")
+        except RenderWorkerError:
+            # The engine failed cleanly, so the subprocess can be reused.
+            with self.lock:
+                self.idle_workers.append(worker)
+            raise
+        else:
+            with self.lock:
+                self.stats.renders += 1
+                self.idle_workers.append(worker)
+            return result
+        finally:
+            with self.lock:
+                self.stats.busy_workers -= 1
+            self.slots.release()
+            self.maybe_log_stats()
+
+
+render_pool: RenderPool | None = None
+render_pool_pid: int | None = None
+
+
+def get_render_pool() -> RenderPool | None:
+    global render_pool, render_pool_pid
+    if settings.MARKDOWN_RENDER_POOL_SIZE <= 0:
+        return None
+    # A forked child must not share its parent's subprocesses.
+    if render_pool is None or render_pool_pid != os.getpid():
+        render_pool = RenderPool(
+            settings.MARKDOWN_RENDER_POOL_SIZE, settings.MARKDOWN_RENDER_CPU_LIMIT_SECONDS
+        )
+        render_pool_pid = os.getpid()
+    return render_pool
+
+
+def render_in_pool(
+    pool: RenderPool, engine: "ZulipMarkdown", content: str, timeout: float
+) -> str | None:
+    """Render content with a subprocess's copy of the engine, which
+    has been set up for this message by do_convert.  Returns None if
+    no subprocess was ready."""
+    job = RenderJob(
+        content=content,
+        linkifiers_key=engine.linkifiers_key,
+        linkifiers=engine.linkifiers,
+        email_gateway=engine.email_gateway,
+        has_message=engine.zulip_message is not None,
+        realm=engine.zulip_realm,
+        db_data=engine.zulip_db_data,
+        image_preview_enabled=engine.image_preview_enabled,
+        url_embed_preview_enabled=engine.url_embed_preview_enabled,
+        url_embed_data=engine.url_embed_data,
+        rendered_tex=engine.zulip_rendered_tex,
+        rendering_result=engine.zulip_rendering_result,
+    )
+    result = pool.render(job, timeout)
+    if result is None:
+        return None
+
+    # Copy back everything the engine records as a side effect.
+    for field in fields(result.rendering_result):
+        setattr(
+            engine.zulip_rendering_result, field.name, getattr(result.rendering_result, field.name)
+        )
+    if engine.zulip_message is not None:
+        engine.zulip_message.has_link = result.has_link
+        engine.zulip_message.has_image = result.has_image
+    return result.rendered_content
+
+
+# The rest of this file runs in the render subprocesses.
+
+worker_engines: dict[tuple[int, bool], "ZulipMarkdown"] = {}
+
+
+def run_render_job(job: RenderJob) -> RenderJobResult:
+    from zerver.lib.markdown import ZulipMarkdown
+    from zerver.models import Message
+
+    engine_key = (job.linkifiers_key, job.email_gateway)
+    engine = worker_engines.get(engine_key)
+    if engine is None or engine.linkifiers != job.linkifiers:
+        engine = ZulipMarkdown(
+            linkifiers=job.linkifiers,
+            linkifiers_key=job.linkifiers_key,
+            email_gateway=job.email_gateway,
+        )
+        worker_engines[engine_key] = engine
+    engine.reset()
+
+    # The engine only uses the message to record whether it has links
+    # and images, so a placeholder is enough.
+    message = Message() if job.has_message else None
+    engine.zulip_message = message
+    engine.zulip_rendering_result = job.rendering_result
+    engine.zulip_realm = job.realm
+    engine.zulip_db_data = job.db_data
+    engine.image_preview_enabled = job.image_preview_enabled
+    engine.url_embed_preview_enabled = job.url_embed_preview_enabled
+    engine.url_embed_data = job.url_embed_data
+    engine.zulip_rendered_tex = job.rendered_tex
+    try:
+        rendered_content = engine.convert(job.content)
+    finally:
+        engine.zulip_message = None
+        engine.zulip_realm = None
+        engine.zulip_db_data = None
+        engine.zulip_rendered_tex = {}
+
+    return RenderJobResult(
+        rendered_content=rendered_content,
+        rendering_result=job.rendering_result,
+        has_link=message is not None and message.has_link,
+        has_image=message is not None and message.has_image,
+    )
+
+
+def limit_cpu_time(cpu_limit: int) -> None:
+    # RLIMIT_CPU counts CPU time over the life of the process, so we
+    # move the limit forward before each render.  The kernel sends
+    # SIGXCPU, which kills us, once the limit is exceeded.
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft_limit = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_limit
+    hard_limit = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard_limit != resource.RLIM_INFINITY:
+        soft_limit = min(soft_limit, hard_limit)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft_limit, hard_limit))
+
+
+def render_worker_main(conn: Connection, cpu_limit: int) -> None:  # nocoverage
+    import django
+
+    django.setup()
+    conn.send("ready")
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            # Our server process has gone away.
+            return
+        limit_cpu_time(cpu_limit)
+        try:
+            conn.send(run_render_job(job))
+        except Exception:
+            conn.send(RenderJobError(traceback.format_exc()))
@@ -38,8 +38,11 @@ from django.db.models import Model
 from django.utils.timezone import now as timezone_now
 from psycopg2.sql import SQL, Composable, Identifier, Literal
 
+from zerver.lib.cache import flush_web_public_narrow_results
 from zerver.lib.logging_util import log_to_file
 from zerver.lib.request import RequestVariableConversionError
+from zerver.lib.search_index import queue_search_index_update
+from zerver.lib.stream_topic import StreamTopicKey, get_stream_topic_keys, refresh_stream_topics
 from zerver.models import (
     ArchivedAttachment,
     ArchivedReaction,
@@ -153,7 +156,10 @@ def run_archiving(
             )
             if new_chunk:
                 move_related_objects_to_archive(new_chunk)
+                stream_topics = get_stream_topic_keys(new_chunk)
                 delete_messages(new_chunk)
+                refresh_stream_topics(stream_topics)
+                flush_web_public_narrows_for_stream_topics(stream_topics)
                 message_count += len(new_chunk)
             else:
                 archive_transaction.delete()  # Nothing was archived
@@ -179,6 +185,19 @@ def run_archiving(
     return message_count
 
 
+def flush_web_public_narrows_for_stream_topics(stream_topics: Iterable[StreamTopicKey]) -> None:
+    recipient_ids = {recipient_id for realm_id, recipient_id, topic_name in stream_topics}
+    if not recipient_ids:
+        return
+    web_public_realm_ids = (
+        Stream.objects.filter(recipient_id__in=recipient_ids, is_web_public=True)
+        .values_list("realm_id", flat=True)
+        .distinct()
+    )
+    for realm_id in web_public_realm_ids:
+        flush_web_public_narrow_results(realm_id)
+
+
 # Note about batching these Message archiving queries:
 # We can simply use LIMIT without worrying about OFFSETs and ordering
 # while executing batches, because any Message already archived (in the previous batch)
@@ -594,6 +613,8 @@ def restore_data_from_archive(archive_transaction: ArchiveTransaction) -> int:
     # the block ends.
     with transaction.atomic(durable=True):
         msg_ids = restore_messages_from_archive(archive_transaction.id)
+        refresh_stream_topics(get_stream_topic_keys(msg_ids))
+        queue_search_index_update(msg_ids)
         restore_models_with_message_key_from_archive(archive_transaction.id)
         restore_attachments_from_archive(archive_transaction.id)
         restore_attachment_messages_from_archive(archive_transaction.id)
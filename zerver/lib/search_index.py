@@ -0,0 +1,217 @@
+# Optional local full-text search index.
+#
+# By default, full-text search (the `search:` narrow operator) runs
+# inside PostgreSQL, using either its built-in text search or
+# PGroonga, and so competes with message writes on the primary
+# database.  With settings.SEARCH_INDEX_PATH set, searches are instead
+# answered by an embedded inverted index: an SQLite FTS5 database at
+# that path.
+#
+# The index is only ever written to by the `search_index` queue
+# worker, which is fed the IDs of messages which were sent, edited, or
+# deleted; it re-reads those messages from the database, and indexes
+# the ones which still exist.  Server processes open the index
+# read-only to search it.  The index is in WAL mode, so searches are
+# not blocked by the worker's writes.  It has to be on storage that is
+# local to the application server; `./manage.py build_search_index`
+# creates it, and indexes existing messages.
+#
+# A search returns the IDs of the realm's matching messages, together
+# with the offsets of the matches in the message's rendered content
+# and (HTML-escaped) topic, in the same form that the PostgreSQL
+# backends compute for highlighting.  NarrowBuilder.by_search only
+# ever uses them to limit its query further, so stale entries in the
+# index (e.g. for messages deleted by a retention policy) can't expose
+# messages the user doesn't have access to.  A search returns at most
+# SEARCH_INDEX_MAX_RESULTS (the most recent) matches; if it is cut
+# short, NarrowBuilder.by_search searches older messages in PostgreSQL.
+# Until the index has been built, searches also use PostgreSQL.
+import re
+import sqlite3
+from collections.abc import Collection, Iterable
+from dataclasses import dataclass
+
+import orjson
+from django.conf import settings
+
+from zerver.lib.queue import queue_event_on_commit
+from zerver.models import Message
+
+# The maximum number of (most recent) matching messages a search
+# returns, since the IDs are passed back to PostgreSQL.
+SEARCH_INDEX_MAX_RESULTS = 10000
+
+SEARCH_INDEX_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5(
+    content,
+    topic,
+    realm_id UNINDEXED,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
+
+# These delimiters are removed from the indexed text, so they can't
+# appear in it otherwise.
+MATCH_START = "\x01"
+MATCH_STOP = "\x02"
+
+
+@dataclass
+class SearchIndexMatch:
+    message_id: int
+    content_matches: list[tuple[int, int]]
+    topic_matches: list[tuple[int, int]]
+
+
+def escape_html(text: str) -> str:
+    # This must match the escape_html function in PostgreSQL, which
+    # is what escapes topics for search results.
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+        .replace("'", "&#39;")
+    )
+
+
+def mask_html(html: str) -> str:
+    """Blanks out HTML tags and entities (and our match delimiters),
+    so that they aren't indexed.  The result has the same length as
+    the input, so that match offsets apply to the original HTML."""
+    return re.sub(
+        rf"<[^>]*>|&#?\w+;|[{MATCH_START}{MATCH_STOP}]",
+        lambda match: " " * len(match.group()),
+        html,
+    )
+
+
+def match_offsets(highlighted: str) -> list[tuple[int, int]]:
+    offsets = []
+    position = 0
+    start = 0
+    for part in re.split(f"([{MATCH_START}{MATCH_STOP}])", highlighted):
+        if part == MATCH_START:
+            start = position
+        elif part == MATCH_STOP:
+            offsets.append((start, position - start))
+        else:
+            position += len(part)
+    return offsets
+
+
+def build_fts_query(operand: str) -> str:
+    # Like the PostgreSQL backend, we require every word, and every
+    # quoted string as a phrase.  Each is quoted so that FTS5 doesn't
+    # interpret any of it as query syntax.
+    phrases = []
+    for term in re.findall(r'"[^"]+"|\S+', operand):
+        if term[0] == '"' and term[-1] == '"':
+            term = term[1:-1]
+        phrases.append('"' + term.replace('"', '""') + '"')
+    return " ".join(phrases)
+
+
+def open_search_index(readonly: bool) -> sqlite3.Connection:
+    assert settings.SEARCH_INDEX_PATH is not None
+    if readonly:
+        return sqlite3.connect(f"file:{settings.SEARCH_INDEX_PATH}?mode=ro", uri=True)
+    conn = sqlite3.connect(settings.SEARCH_INDEX_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SEARCH_INDEX_SCHEMA)
+    return conn
+
+
+def search_messages(
+    realm_id: int,
+    operand: str,
+    *,
+    message_ids: Collection[int] | None = None,
+    highlight: bool = True,
+) -> list[SearchIndexMatch] | None:
+    """Searches the realm's messages (returning the most recent
+    SEARCH_INDEX_MAX_RESULTS matches), or just the given ones.  Without
+    highlight, the match offsets are left empty, which is much cheaper
+    when only the message IDs are needed.  Returns None if the index
+    can't be searched, e.g. because it hasn't been built yet."""
+    if highlight:
+        match_columns = """
+            highlight(message_search, 0, :start, :stop),
+            highlight(message_search, 1, :start, :stop)
+        """
+    else:
+        match_columns = "'', ''"
+    message_ids_condition = ""
+    if message_ids is not None:
+        message_ids_condition = "AND rowid IN (SELECT value FROM json_each(:message_ids))"
+    try:
+        conn = open_search_index(readonly=True)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT rowid, {match_columns}
+            FROM message_search
+            WHERE message_search MATCH :query AND realm_id = :realm_id {message_ids_condition}
+            ORDER BY rowid DESC
+            LIMIT :limit
+            """,  # noqa: S608
+            {
+                "start": MATCH_START,
+                "stop": MATCH_STOP,
+                "query": build_fts_query(operand),
+                "realm_id": realm_id,
+                "message_ids": orjson.dumps(sorted(message_ids or [])).decode(),
+                "limit": SEARCH_INDEX_MAX_RESULTS if message_ids is None else len(message_ids),
+            },
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # The index exists, but its table hasn't been created yet.
+        return None
+    finally:
+        conn.close()
+    return [
+        SearchIndexMatch(
+            message_id=message_id,
+            content_matches=match_offsets(content),
+            topic_matches=match_offsets(topic),
+        )
+        for message_id, content, topic in rows
+    ]
+
+
+def update_search_index(message_ids: Iterable[int]) -> None:
+    """(Re)indexes the messages with the given IDs, and removes any
+    which no longer exist from the index."""
+    message_ids = set(message_ids)
+    messages = Message.objects.filter(id__in=message_ids).only(
+        "id", "realm_id", "subject", "rendered_content"
+    )
+    conn = open_search_index(readonly=False)
+    try:
+        with conn:
+            conn.executemany(
+                "DELETE FROM message_search WHERE rowid = ?",
+                [(message_id,) for message_id in message_ids],
+            )
+            conn.executemany(
+                "INSERT INTO message_search (rowid, content, topic, realm_id) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        message.id,
+                        mask_html(message.rendered_content or ""),
+                        mask_html(escape_html(message.topic_name())),
+                        message.realm_id,
+                    )
+                    for message in messages
+                ],
+            )
+    finally:
+        conn.close()
+
+
+def queue_search_index_update(message_ids: Iterable[int]) -> None:
+    if settings.SEARCH_INDEX_PATH is None:
+        return
+    queue_event_on_commit("search_index", {"message_ids": sorted(message_ids)})
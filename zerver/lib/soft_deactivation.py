@@ -13,6 +13,7 @@ from django.utils.timezone import now as timezone_now
 
 from zerver.lib.logging_util import log_to_file
 from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.unread_watermarks import lower_unread_watermarks_for_users
 from zerver.lib.user_message import bulk_insert_all_ums
 from zerver.lib.utils import assert_is_not_none
 from zerver.models import (
@@ -238,6 +239,10 @@ def add_missing_messages(user_profile: UserProfile) -> None:
         user_profile, stream_messages, all_stream_subscription_logs
     )
 
+    if message_ids_to_insert:
+        # The user may now have older unread messages.
+        lower_unread_watermarks_for_users([user_profile.id], min(message_ids_to_insert))
+
     # Doing a bulk create for all the UserMessage objects stored for creation.
     while len(message_ids_to_insert) > 0:
         message_ids, message_ids_to_insert = (
@@ -1,4 +1,8 @@
-from zerver.models import UserTopic
+from collections.abc import Collection, Iterable
+
+from django.db import connection
+
+from zerver.models import Message, StreamTopic, UserTopic
 
 
 class StreamTopicTarget:
@@ -35,3 +39,143 @@ class StreamTopicTarget:
         for row in query:
             user_id_to_visibility_policy[row["user_profile_id"]] = row["visibility_policy"]
         return user_id_to_visibility_policy
+
+
+# Maintenance of the StreamTopic table, which summarizes the topics in
+# each channel, so that listing a channel's topics is proportional to
+# the number of topics rather than to the channel's history.
+#
+# Sending messages just adds them to their topics' rows, once the
+# sending transaction has committed, so that concurrent sends don't
+# wait on each other's row locks.  (A topic which is recomputed in
+# between may count such a message twice, until it is next
+# recomputed.)  Everything else that changes which messages are in a topic (moving, deleting,
+# or restoring messages, and importing or merging channels) instead
+# recomputes the affected topics' rows from the Message table, using
+# the zerver_message_realm_recipient_upper_subject index.
+#
+# Topics are case-insensitive, so all of this matches topic names
+# using PostgreSQL's upper(), like the unique constraint on the table.
+
+StreamTopicKey = tuple[int, int, str]
+
+# Aggregates a set of channel messages into StreamTopic rows; the
+# topic name is the one used by the most recent message.  The rows are
+# sorted, so that concurrent statements lock them in the same order.
+STREAM_TOPIC_ROWS_QUERY = """
+    SELECT
+        zerver_message.realm_id,
+        zerver_message.recipient_id,
+        (array_agg(zerver_message.subject ORDER BY zerver_message.id DESC))[1],
+        max(zerver_message.id),
+        count(*)
+    FROM zerver_message
+    {join}
+    WHERE zerver_message.is_channel_message AND {where}
+    GROUP BY
+        zerver_message.realm_id,
+        zerver_message.recipient_id,
+        upper(zerver_message.subject)
+    ORDER BY
+        zerver_message.recipient_id,
+        upper(zerver_message.subject)
+"""
+
+INSERT_STREAM_TOPICS = """
+    INSERT INTO zerver_streamtopic
+        (realm_id, recipient_id, topic_name, last_message_id, message_count)
+"""
+
+
+def get_stream_topic_keys(message_ids: Iterable[int]) -> set[StreamTopicKey]:
+    return set(
+        # Uses index: zerver_message_pkey
+        Message.objects.filter(id__in=message_ids, is_channel_message=True)
+        .values_list("realm_id", "recipient_id", "subject")
+        .distinct()
+    )
+
+
+def add_messages_to_stream_topics(message_ids: Collection[int]) -> None:
+    """Called with newly sent messages, after they're committed."""
+    if not message_ids:
+        return
+    query = (
+        INSERT_STREAM_TOPICS
+        + STREAM_TOPIC_ROWS_QUERY.format(join="", where="zerver_message.id = ANY(%(message_ids)s)")
+        + """
+    ON CONFLICT (recipient_id, upper(topic_name)) DO UPDATE SET
+        topic_name = CASE
+            WHEN EXCLUDED.last_message_id > zerver_streamtopic.last_message_id
+            THEN EXCLUDED.topic_name
+            ELSE zerver_streamtopic.topic_name
+        END,
+        last_message_id = greatest(EXCLUDED.last_message_id, zerver_streamtopic.last_message_id),
+        message_count = zerver_streamtopic.message_count + EXCLUDED.message_count
+    """
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(query, {"message_ids": list(message_ids)})
+
+
+def refresh_stream_topics(topics: Collection[StreamTopicKey]) -> None:
+    """Recomputes the StreamTopic rows for the given (realm ID,
+    recipient ID, topic name) topics, after messages were moved into
+    or out of them."""
+    if not topics:
+        return
+    params = {
+        "realm_ids": [realm_id for realm_id, recipient_id, topic_name in topics],
+        "recipient_ids": [recipient_id for realm_id, recipient_id, topic_name in topics],
+        "topic_names": [topic_name for realm_id, recipient_id, topic_name in topics],
+    }
+    topics_query = """
+        (
+            SELECT DISTINCT realm_id, recipient_id, upper(topic_name) AS upper_topic_name
+            FROM unnest(%(realm_ids)s::integer[], %(recipient_ids)s::integer[], %(topic_names)s::text[])
+                AS topic(realm_id, recipient_id, topic_name)
+        ) AS topic
+    """
+    delete_query = f"""
+    DELETE FROM zerver_streamtopic
+    USING {topics_query}
+    WHERE
+        zerver_streamtopic.recipient_id = topic.recipient_id AND
+        upper(zerver_streamtopic.topic_name) = topic.upper_topic_name
+    """  # noqa: S608
+    insert_query = (
+        INSERT_STREAM_TOPICS
+        + STREAM_TOPIC_ROWS_QUERY.format(
+            join=f"""
+    INNER JOIN {topics_query} ON (
+        zerver_message.realm_id = topic.realm_id AND
+        zerver_message.recipient_id = topic.recipient_id AND
+        upper(zerver_message.subject) = topic.upper_topic_name
+    )""",
+            where="TRUE",
+        )
+        # A message sent concurrently may have recreated a row.
+        + """
+    ON CONFLICT (recipient_id, upper(topic_name)) DO UPDATE SET
+        topic_name = EXCLUDED.topic_name,
+        last_message_id = EXCLUDED.last_message_id,
+        message_count = EXCLUDED.message_count
+    """
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(delete_query, params)
+        cursor.execute(insert_query, params)
+
+
+def rebuild_stream_topics(realm_id: int, recipient_ids: list[int] | None = None) -> None:
+    """Recomputes all of the StreamTopic rows for the realm, or for just
+    the given channels' recipients."""
+    stream_topics = StreamTopic.objects.filter(realm_id=realm_id)
+    where = "zerver_message.realm_id = %(realm_id)s"
+    if recipient_ids is not None:
+        stream_topics = stream_topics.filter(recipient_id__in=recipient_ids)
+        where += " AND zerver_message.recipient_id = ANY(%(recipient_ids)s)"
+    stream_topics.delete()
+    query = INSERT_STREAM_TOPICS + STREAM_TOPIC_ROWS_QUERY.format(join="", where=where)
+    with connection.cursor() as cursor:
+        cursor.execute(query, {"realm_id": realm_id, "recipient_ids": recipient_ids})
@@ -34,7 +34,7 @@ from zerver.actions.realm_settings import do_set_realm_user_default_setting
 from zerver.actions.user_settings import do_change_user_setting
 from zerver.lib import cache
 from zerver.lib.avatar import avatar_url
-from zerver.lib.cache import get_cache_backend
+from zerver.lib.cache import get_cache_backend, local_cache
 from zerver.lib.db import Params, Query, TimeTrackingCursor
 from zerver.lib.integrations import WEBHOOK_INTEGRATIONS
 from zerver.lib.per_request_cache import flush_per_request_caches
@@ -219,6 +219,7 @@ def queries_captured(
     if not keep_cache_warm:
         cache = get_cache_backend(None)
         cache.clear()
+        local_cache.clear()
         flush_per_request_caches()
         clear_client_cache()
     with mock.patch.multiple(
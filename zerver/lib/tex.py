@@ -1,22 +1,40 @@
 import logging
 import os
 import subprocess
+from collections.abc import Iterable
 from typing import Any
 
 import lxml.html
 import requests
 from django.conf import settings
 
+from zerver.lib.cache import (
+    cache_get,
+    cache_get_many,
+    cache_set,
+    cache_set_many,
+    katex_rendered_tex_cache_key,
+)
 from zerver.lib.outgoing_http import OutgoingSession
 from zerver.lib.storage import static_path
 
+# We set a very short timeout because these requests are expected to
+# be quite fast (milliseconds) and blocking on this affects message
+# rendering performance.
+KATEX_TIMEOUT = 0.5
+# A batch request gets KATEX_TIMEOUT per expression, up to this limit.
+KATEX_BATCH_MAX_TIMEOUT = 5.0
+
 
 class KatexSession(OutgoingSession):
-    def __init__(self, **kwargs: Any) -> None:
-        # We set a very short timeout because these requests are
-        # expected to be quite fast (milliseconds) and blocking on
-        # this affects message rendering performance.
-        super().__init__(role="katex", timeout=0.5, **kwargs)
+    def __init__(self, timeout: float = KATEX_TIMEOUT, **kwargs: Any) -> None:
+        super().__init__(role="katex", timeout=timeout, **kwargs)
+
+
+# KaTeX's output only depends on its input, so we cache the rendered
+# HTML in the remote cache, keyed by a hash of the TeX.  This makes
+# re-renders and commonly used expressions cheap across all processes.
+TEX_CACHE_TIMEOUT = 3600 * 24 * 7
 
 
 def render_tex(tex: str, is_inline: bool = True) -> str | None:
@@ -33,38 +51,150 @@ def render_tex(tex: str, is_inline: bool = True) -> str | None:
                  (default True)
     """
 
+    key = katex_rendered_tex_cache_key(tex, is_inline)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached[0]
+
+    rendered = render_tex_uncached(tex, is_inline)
+    # We don't cache failures, since they may be transient.
+    if rendered is not None:
+        cache_set(key, rendered, timeout=TEX_CACHE_TIMEOUT)
+    return rendered
+
+
+def render_tex_batch(
+    expressions: Iterable[tuple[str, bool]], timeout: float = KATEX_BATCH_MAX_TIMEOUT
+) -> dict[tuple[str, bool], str | None]:
+    """Render many (tex, is_inline) expressions, with a single round
+    trip to the cache and, when using the KaTeX server, a single
+    request, taking at most timeout seconds, for all of those not
+    already cached.
+
+    Returns a dict mapping each expression to its rendered HTML, or
+    None if rendering it failed.  If the batch request to the KaTeX
+    server failed as a whole, the expressions it was for are left out,
+    so that callers can render them one at a time with render_tex."""
+
+    keys = {
+        katex_rendered_tex_cache_key(tex, is_inline): (tex, is_inline)
+        for tex, is_inline in expressions
+    }
+    if not keys:
+        return {}
+
+    result: dict[tuple[str, bool], str | None] = {
+        keys[key]: cached[0] for key, cached in cache_get_many(list(keys)).items()
+    }
+    missing = [expression for expression in keys.values() if expression not in result]
+    if not missing:
+        return result
+
+    rendered: list[str | None] | None
+    if settings.KATEX_SERVER:
+        rendered = render_tex_batch_with_server(missing, timeout)
+        if rendered is None:
+            return result
+    else:
+        rendered = [render_tex_with_cli(tex, is_inline) for tex, is_inline in missing]
+
+    items_to_cache = {}
+    for (tex, is_inline), html in zip(missing, rendered, strict=True):
+        result[(tex, is_inline)] = html
+        if html is not None:
+            items_to_cache[katex_rendered_tex_cache_key(tex, is_inline)] = (html,)
+    if items_to_cache:
+        cache_set_many(items_to_cache, timeout=TEX_CACHE_TIMEOUT)
+    return result
+
+
+def render_tex_uncached(tex: str, is_inline: bool) -> str | None:
     if settings.KATEX_SERVER:
-        try:
-            resp = KatexSession().post(
-                # We explicitly disable the Smokescreen proxy for this
-                # call, since it intentionally connects to localhost.
-                # This is safe because the host is explicitly fixed, and
-                # the port is pulled from our own configuration.
-                f"http://localhost:{settings.KATEX_SERVER_PORT}/",
-                data={
-                    "content": tex,
-                    "is_display": "false" if is_inline else "true",
-                    "shared_secret": settings.SHARED_SECRET,
-                },
-                proxies={"http": ""},
-            )
-        except requests.exceptions.Timeout:
-            logging.warning("KaTeX rendering service timed out with %d byte long input", len(tex))
-            return None
-        except requests.exceptions.RequestException as e:
-            logging.warning("KaTeX rendering service failed: %s", type(e).__name__)
-            return None
-
-        if resp.status_code == 200:
-            return resp.content.decode().strip()
-        elif resp.status_code == 400:
-            return None
-        else:
-            logging.warning(
-                "KaTeX rendering service failed: (%s) %s", resp.status_code, resp.content.decode()
-            )
-            return None
+        return render_tex_with_server(tex, is_inline)
+    return render_tex_with_cli(tex, is_inline)
+
+
+def render_tex_with_server(tex: str, is_inline: bool) -> str | None:
+    try:
+        resp = KatexSession().post(
+            # We explicitly disable the Smokescreen proxy for this
+            # call, since it intentionally connects to localhost.
+            # This is safe because the host is explicitly fixed, and
+            # the port is pulled from our own configuration.
+            f"http://localhost:{settings.KATEX_SERVER_PORT}/",
+            data={
+                "content": tex,
+                "is_display": "false" if is_inline else "true",
+                "shared_secret": settings.SHARED_SECRET,
+            },
+            proxies={"http": ""},
+        )
+    except requests.exceptions.Timeout:
+        logging.warning("KaTeX rendering service timed out with %d byte long input", len(tex))
+        return None
+    except requests.exceptions.RequestException as e:
+        logging.warning("KaTeX rendering service failed: %s", type(e).__name__)
+        return None
+
+    if resp.status_code == 200:
+        return resp.content.decode().strip()
+    elif resp.status_code == 400:
+        return None
+    else:
+        logging.warning(
+            "KaTeX rendering service failed: (%s) %s", resp.status_code, resp.content.decode()
+        )
+        return None
+
+
+def render_tex_batch_with_server(
+    expressions: list[tuple[str, bool]], max_timeout: float = KATEX_BATCH_MAX_TIMEOUT
+) -> list[str | None] | None:
+    """Returns None, rather than a result for each expression, if the
+    request failed, e.g. because it timed out, or because the KaTeX
+    server is an older one without the /batch endpoint."""
+    timeout = min(KATEX_TIMEOUT * len(expressions), max_timeout)
+    try:
+        resp = KatexSession(timeout=timeout).post(
+            # See render_tex_with_server for why we disable the proxy.
+            f"http://localhost:{settings.KATEX_SERVER_PORT}/batch",
+            json={
+                "expressions": [
+                    {"content": tex, "is_display": not is_inline} for tex, is_inline in expressions
+                ],
+                "shared_secret": settings.SHARED_SECRET,
+            },
+            proxies={"http": ""},
+        )
+    except requests.exceptions.Timeout:
+        logging.warning(
+            "KaTeX rendering service timed out with a batch of %d expressions", len(expressions)
+        )
+        return None
+    except requests.exceptions.RequestException as e:
+        logging.warning("KaTeX rendering service failed: %s", type(e).__name__)
+        return None
+
+    if resp.status_code != 200:
+        logging.warning(
+            "KaTeX rendering service failed: (%s) %s", resp.status_code, resp.content.decode()
+        )
+        return None
+    try:
+        rendered = resp.json()
+    except ValueError:
+        rendered = None
+    if (
+        not isinstance(rendered, list)
+        or len(rendered) != len(expressions)
+        or not all(html is None or isinstance(html, str) for html in rendered)
+    ):
+        logging.warning("KaTeX rendering service returned an invalid batch response")
+        return None
+    return [html.strip() if html is not None else None for html in rendered]
+
 
+def render_tex_with_cli(tex: str, is_inline: bool) -> str | None:
     katex_path = (
         static_path("webpack-bundles/katex-cli.js")
         if settings.PRODUCTION
@@ -11,7 +11,7 @@ from django.utils.translation import override as override_language
 
 from zerver.lib.types import EditHistoryEvent, StreamMessageEditRequest
 from zerver.lib.utils import assert_is_not_none
-from zerver.models import Message, Reaction, UserMessage, UserProfile
+from zerver.models import Message, Reaction, StreamTopic, UserMessage, UserProfile
 
 # Only use these constants for events.
 ORIG_TOPIC = "orig_subject"
@@ -270,30 +270,15 @@ def get_topic_history_for_public_stream(
     recipient_id: int,
     allow_empty_topic_name: bool,
 ) -> list[dict[str, Any]]:
-    cursor = connection.cursor()
-    # Uses index: zerver_message_realm_recipient_subject
-    # Note that this is *case-sensitive*, so that we can display the
-    # most recently-used case (in generate_topic_history_from_db_rows)
-    query = """
-    SELECT
-        "zerver_message"."subject" as topic,
-        max("zerver_message".id) as max_message_id
-    FROM "zerver_message"
-    WHERE (
-        "zerver_message"."realm_id" = %s AND
-        "zerver_message"."recipient_id" = %s AND
-        "zerver_message"."is_channel_message"
-    )
-    GROUP BY (
-        "zerver_message"."subject"
+    # StreamTopic has a row per topic, with the topic name as cased by
+    # the most recent message; see zerver.lib.stream_topic.
+    rows = (
+        # Uses index: zerver_streamtopic_recipient_last_message_id
+        StreamTopic.objects.filter(realm_id=realm_id, recipient_id=recipient_id)
+        .order_by("-last_message_id")
+        .values_list("topic_name", "last_message_id")
     )
-    ORDER BY max("zerver_message".id) DESC
-    """
-    cursor.execute(query, [realm_id, recipient_id])
-    rows = cursor.fetchall()
-    cursor.close()
-
-    return generate_topic_history_from_db_rows(rows, allow_empty_topic_name)
+    return generate_topic_history_from_db_rows(list(rows), allow_empty_topic_name)
 
 
 def get_topic_history_for_stream(
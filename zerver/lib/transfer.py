@@ -3,13 +3,12 @@ import os
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
 
-import bmemcached
 import magic
 from django.conf import settings
-from django.core.cache import cache
 from django.db import connection
 
 from zerver.lib.avatar_hash import user_avatar_path
+from zerver.lib.cache import disconnect_remote_cache
 from zerver.lib.mime_types import guess_type
 from zerver.lib.thumbnail import BadImageError
 from zerver.lib.upload import upload_emoji_image, write_avatar_images
@@ -58,9 +57,7 @@ def transfer_avatars_to_s3(processes: int) -> None:
             _transfer_avatar_to_s3(user)
     else:  # nocoverage
         connection.close()
-        _cache = cache._cache  # type: ignore[attr-defined] # not in stubs
-        assert isinstance(_cache, bmemcached.Client)
-        _cache.disconnect_all()
+        disconnect_remote_cache()
         with ProcessPoolExecutor(max_workers=processes) as executor:
             for future in as_completed(
                 executor.submit(_transfer_avatar_to_s3, user) for user in users
@@ -124,9 +121,7 @@ def transfer_message_files_to_s3(processes: int) -> None:
             _transfer_message_files_to_s3(attachment)
     else:  # nocoverage
         connection.close()
-        _cache = cache._cache  # type: ignore[attr-defined] # not in stubs
-        assert isinstance(_cache, bmemcached.Client)
-        _cache.disconnect_all()
+        disconnect_remote_cache()
         with ProcessPoolExecutor(max_workers=processes) as executor:
             for future in as_completed(
                 executor.submit(_transfer_message_files_to_s3, attachment)
@@ -170,9 +165,7 @@ def transfer_emoji_to_s3(processes: int) -> None:
             _transfer_emoji_to_s3(realm_emoji)
     else:  # nocoverage
         connection.close()
-        _cache = cache._cache  # type: ignore[attr-defined] # not in stubs
-        assert isinstance(_cache, bmemcached.Client)
-        _cache.disconnect_all()
+        disconnect_remote_cache()
         with ProcessPoolExecutor(max_workers=processes) as executor:
             for future in as_completed(
                 executor.submit(_transfer_emoji_to_s3, realm_emoji) for realm_emoji in realm_emojis
@@ -0,0 +1,158 @@
+# Per-user "unread watermarks", for finding the first unread message
+# in a channel quickly.
+#
+# find_first_unread_anchor looks for the user's oldest unread message
+# matching the narrow, by walking the user's unread UserMessage rows
+# in order of message ID until it finds one that matches.  For a user
+# with a large backlog of unread messages in other conversations,
+# that's a lot of rows to skip over on every channel narrow.
+#
+# A watermark for a user and a recipient is a message ID such that
+# the user has no unread messages to that recipient with smaller IDs,
+# so that the scan can start there.  find_first_unread_anchor stores
+# the exact ID of the first unread message (or LARGER_THAN_MAX_MESSAGE_ID,
+# if there is none) whenever it finds it.  Watermarks are only lower
+# bounds, so they stay correct when messages are marked as read or
+# deleted.
+#
+# The paths which give users unread messages lower the watermarks,
+# by recording "floors" that are combined with the stored watermark
+# when it's read:
+#
+# * Sending a message lowers the floor for its recipient, which
+#   covers every user receiving it.
+# * Marking messages as unread, moving unread messages between
+#   channels, and soft reactivation lower the floor for the user,
+#   which covers all of their watermarks.
+#
+# Memcached can't atomically lower a value, so floors live in
+# integer keys which are created with add() and lowered with decr();
+# if two processes lower a floor at the same time, it ends up lower
+# than it needs to be, which is harmless.  Floors are grouped into
+# buckets of UNREAD_WATERMARK_FLOOR_BUCKET_SECONDS, and a stored
+# watermark only consults the buckets starting from when the data it
+# was computed from was read; older floors are already reflected in
+# it.  Each bucket lives longer than any watermark that consults it.
+import logging
+import time
+from collections.abc import Iterable
+
+from django.db import transaction
+
+from zerver.lib.cache import (
+    KEY_PREFIX,
+    REMOTE_CACHE_ERRORS,
+    cache_get_many,
+    cache_set,
+    get_cache_backend,
+    unread_watermark_cache_key,
+    unread_watermark_recipient_floor_cache_key,
+    unread_watermark_user_floor_cache_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Watermarks are recomputed at least this often.
+UNREAD_WATERMARKS_CACHE_SECONDS = 3600
+
+UNREAD_WATERMARK_FLOOR_BUCKET_SECONDS = 600
+
+# How long before a watermark is stored the database snapshot it was
+# computed from might have been taken.
+UNREAD_WATERMARK_SNAPSHOT_SECONDS = 60
+
+
+def get_floor_bucket(timestamp: float) -> int:
+    return int(timestamp // UNREAD_WATERMARK_FLOOR_BUCKET_SECONDS)
+
+
+def get_unread_watermark(user_profile_id: int, recipient_id: int) -> int | None:
+    """Returns the user's watermark for the recipient, or None if it
+    isn't cached."""
+    now = time.time()
+    # Every bucket which a cached watermark might consult.
+    buckets = range(
+        get_floor_bucket(now - UNREAD_WATERMARKS_CACHE_SECONDS - UNREAD_WATERMARK_SNAPSHOT_SECONDS),
+        get_floor_bucket(now) + 1,
+    )
+    watermark_key = unread_watermark_cache_key(user_profile_id, recipient_id)
+    floor_keys = {
+        bucket: [
+            unread_watermark_user_floor_cache_key(user_profile_id, bucket),
+            unread_watermark_recipient_floor_cache_key(recipient_id, bucket),
+        ]
+        for bucket in buckets
+    }
+    cached = cache_get_many([watermark_key, *(key for keys in floor_keys.values() for key in keys)])
+    if watermark_key not in cached:
+        return None
+    watermark, first_bucket = cached[watermark_key][0]
+    return min(
+        [
+            watermark,
+            *(
+                cached[key]
+                for bucket, keys in floor_keys.items()
+                if bucket >= first_bucket
+                for key in keys
+                if key in cached
+            ),
+        ]
+    )
+
+
+def set_unread_watermark(user_profile_id: int, recipient_id: int, first_unread_id: int) -> None:
+    """Records that first_unread_id is the user's first unread message
+    to the recipient, as of the current transaction's snapshot."""
+    first_bucket = get_floor_bucket(time.time() - UNREAD_WATERMARK_SNAPSHOT_SECONDS)
+    cache_set(
+        unread_watermark_cache_key(user_profile_id, recipient_id),
+        (first_unread_id, first_bucket),
+        timeout=UNREAD_WATERMARKS_CACHE_SECONDS,
+    )
+
+
+def lower_unread_watermark_floors(keys: list[str], message_id: int) -> None:
+    cache_backend = get_cache_backend(None)
+    # Outlives every watermark which consults this bucket.
+    timeout = UNREAD_WATERMARKS_CACHE_SECONDS + 2 * UNREAD_WATERMARK_FLOOR_BUCKET_SECONDS
+    for key in keys:
+        try:
+            floor = cache_backend.get(KEY_PREFIX + key)
+            if floor is None:
+                if cache_backend.add(KEY_PREFIX + key, message_id, timeout=timeout):
+                    continue
+                floor = cache_backend.get(KEY_PREFIX + key)
+            if floor is not None and floor > message_id:
+                cache_backend.decr(KEY_PREFIX + key, floor - message_id)
+        except (*REMOTE_CACHE_ERRORS, ValueError) as e:
+            logger.exception(e)
+
+
+def lower_unread_watermarks_for_recipients(first_message_ids: dict[int, int]) -> None:
+    """Lowers the watermarks of every user for each recipient to the
+    given message ID, once the transaction commits."""
+
+    def lower_floors() -> None:
+        bucket = get_floor_bucket(time.time())
+        for recipient_id, message_id in first_message_ids.items():
+            lower_unread_watermark_floors(
+                [unread_watermark_recipient_floor_cache_key(recipient_id, bucket)], message_id
+            )
+
+    transaction.on_commit(lower_floors)
+
+
+def lower_unread_watermarks_for_users(user_ids: Iterable[int], message_id: int) -> None:
+    """Lowers all of the users' watermarks to the given message ID,
+    once the transaction commits."""
+    user_ids = list(user_ids)
+
+    def lower_floors() -> None:
+        bucket = get_floor_bucket(time.time())
+        lower_unread_watermark_floors(
+            [unread_watermark_user_floor_cache_key(user_id, bucket) for user_id in user_ids],
+            message_id,
+        )
+
+    transaction.on_commit(lower_floors)
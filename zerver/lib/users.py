@@ -1,12 +1,14 @@
 import itertools
 import re
+import secrets
 import unicodedata
 from collections import defaultdict
 from collections.abc import Iterable, Mapping, Sequence
 from email.headerregistry import Address
 from operator import itemgetter
-from typing import Any, TypedDict
+from typing import Any, TypeAlias, TypedDict
 
+import orjson
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db.models import Q, QuerySet
@@ -17,7 +19,14 @@ from typing_extensions import NotRequired
 from zulip_bots.custom_exceptions import ConfigValidationError
 
 from zerver.lib.avatar import avatar_url, get_avatar_field, get_avatar_for_inaccessible_user
-from zerver.lib.cache import cache_with_key, get_cross_realm_dicts_key
+from zerver.lib.cache import (
+    cache_get,
+    cache_set,
+    cache_with_key,
+    get_cross_realm_dicts_key,
+    realm_users_snapshot_cache_key,
+    realm_users_snapshot_version_cache_key,
+)
 from zerver.lib.create_user import get_dummy_email_address_for_display_regex
 from zerver.lib.exceptions import JsonableError, OrganizationOwnerRequiredError
 from zerver.lib.string_validation import check_string_is_printable
@@ -1165,6 +1174,79 @@ def get_users_for_api(
     return result
 
 
+# (user_id, is_active, serialized user dict without is_active) for each
+# user in the realm, ordered by user ID.
+RealmUsersSnapshot: TypeAlias = list[tuple[int, bool, bytes]]
+
+
+def get_realm_users_snapshot(
+    realm: Realm,
+    acting_user: UserProfile,
+    *,
+    client_gravatar: bool,
+    user_avatar_url_field_optional: bool,
+) -> RealmUsersSnapshot | None:
+    """Returns what get_users_for_api would for all users in the realm,
+    already serialized, from a snapshot shared with everyone in the
+    realm who has the same role and client options.  Returns None if
+    acting_user might not be able to access all users, in which case
+    get_users_for_api must be used.
+
+    The snapshots are keyed by a version for the realm, which
+    flush_realm_users_snapshot resets whenever a user's row or custom
+    profile field values change.
+    """
+    if acting_user.is_guest or settings.PARTIAL_USERS:
+        return None
+
+    version_key = realm_users_snapshot_version_cache_key(realm.id)
+    cached_version = cache_get(version_key)
+    if cached_version is not None:
+        version = cached_version[0]
+    else:
+        version = secrets.token_hex(8)
+        cache_set(version_key, version, timeout=3600 * 24 * 7)
+
+    snapshot_key = realm_users_snapshot_cache_key(
+        realm.id, version, acting_user.role, client_gravatar, user_avatar_url_field_optional
+    )
+    cached_snapshot = cache_get(snapshot_key)
+    if cached_snapshot is not None:
+        snapshot: RealmUsersSnapshot = cached_snapshot[0]
+    else:
+        # Which delivery_email values a user can see depends only on
+        # their role, except for their own, which we fill in below.
+        viewer = UserProfile(id=0, realm=realm, role=acting_user.role)
+        user_dicts = get_users_for_api(
+            realm,
+            viewer,
+            client_gravatar=client_gravatar,
+            user_avatar_url_field_optional=user_avatar_url_field_optional,
+        )
+        snapshot = []
+        for user_id, user_dict in sorted(user_dicts.items()):
+            # Like post_process_state, leave out is_active, since
+            # which list a user is in already says it.
+            user_json = orjson.dumps(
+                {key: value for key, value in user_dict.items() if key != "is_active"},
+                option=orjson.OPT_SORT_KEYS,
+            )
+            snapshot.append((user_id, user_dict["is_active"], user_json))
+        cache_set(snapshot_key, snapshot, timeout=3600 * 24 * 7)
+
+    for i, (user_id, is_active, user_json) in enumerate(snapshot):
+        if user_id == acting_user.id:
+            own_user_dict = orjson.loads(user_json)
+            own_user_dict["delivery_email"] = acting_user.delivery_email
+            snapshot[i] = (
+                user_id,
+                is_active,
+                orjson.dumps(own_user_dict, option=orjson.OPT_SORT_KEYS),
+            )
+            break
+    return snapshot
+
+
 def get_active_bots_owned_by_user(user_profile: UserProfile) -> QuerySet[UserProfile]:
     return UserProfile.objects.filter(is_bot=True, is_active=True, bot_owner=user_profile)
 
@@ -0,0 +1,43 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import CommandError, CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.search_index import update_search_index
+from zerver.models import Message
+
+
+class Command(ZulipBaseCommand):
+    help = """Index existing messages in the local search index (see SEARCH_INDEX_PATH).
+
+New, edited, and deleted messages are indexed by the search_index queue
+worker; this command is for building the index for the first time, or
+rebuilding it.  It is safe to run while the queue worker is running."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Number of messages to index at a time"
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        if settings.SEARCH_INDEX_PATH is None:
+            raise CommandError("SEARCH_INDEX_PATH is not set.")
+
+        last_message_id = 0
+        indexed = 0
+        while True:
+            message_ids = list(
+                Message.objects.filter(id__gt=last_message_id)
+                .order_by("id")
+                .values_list("id", flat=True)[: options["batch_size"]]
+            )
+            if not message_ids:
+                break
+            update_search_index(message_ids)
+            last_message_id = message_ids[-1]
+            indexed += len(message_ids)
+            print(f"Indexed {indexed} messages.")
@@ -0,0 +1,49 @@
+from typing import Any
+
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.cache_stats import get_cache_stats, reset_cache_stats
+from zerver.lib.management import ZulipBaseCommand
+
+
+class Command(ZulipBaseCommand):
+    help = """Show cache hit rates, sizes, and latency, for each family of cache keys.
+
+The counts cover every server process since they were last reset.  A
+family with a poor hit rate may have too short a timeout, or its
+entries may be evicted for lack of memory."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counts after showing them"
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        stats = get_cache_stats()
+        print(
+            f"{'family':<40} {'hits':>10} {'local':>10} {'misses':>10} {'hit %':>6}"
+            f" {'sets':>8} {'avg size':>9} {'deletes':>8} {'avg ms':>7}"
+        )
+        for family, counts in sorted(
+            stats.items(),
+            key=lambda item: item[1]["hits"] + item[1]["local_hits"] + item[1]["misses"],
+            reverse=True,
+        ):
+            lookups = counts["hits"] + counts["local_hits"] + counts["misses"]
+            hit_rate = 100 * (lookups - counts["misses"]) / lookups if lookups else 0
+            average_size = (
+                counts["set_bytes"] // counts["sized_sets"] if counts["sized_sets"] else 0
+            )
+            remote_requests = counts["hits"] + counts["misses"] + counts["sets"] + counts["deletes"]
+            average_ms = counts["microseconds"] / 1000 / remote_requests if remote_requests else 0
+            print(
+                f"{family:<40} {counts['hits']:>10} {counts['local_hits']:>10}"
+                f" {counts['misses']:>10} {hit_rate:>6.1f} {counts['sets']:>8}"
+                f" {average_size:>9} {counts['deletes']:>8} {average_ms:>7.2f}"
+            )
+
+        if options["reset"]:
+            reset_cache_stats()
@@ -2,20 +2,26 @@ import csv
 import os
 import queue
 import shutil
+import tempfile
 from argparse import ArgumentParser
 from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from email.headerregistry import Address
 from functools import lru_cache, reduce
 from operator import or_
 from threading import Lock, Thread
-from typing import Any, NoReturn, Union
+from typing import IO, Any, NoReturn, Union
 
 import orjson
 from django.core.management.base import CommandError
-from django.db.models import Q
+from django.db import connection
+from django.db.models import Max, Min, Q
+from django.db.models.sql import Query
 from typing_extensions import override
 
+from zerver.lib.cache import disconnect_remote_cache
 from zerver.lib.management import ZulipBaseCommand
 from zerver.lib.soft_deactivation import reactivate_user_if_soft_deactivated
 from zerver.lib.upload import save_attachment_contents
@@ -54,6 +60,158 @@ def download_worker(base_path: str) -> NoReturn:
         download_queue.task_done()
 
 
+def start_download_workers(base_path: str, threads: int) -> None:
+    for i in range(threads):
+        Thread(target=download_worker, daemon=True, args=(base_path,)).start()
+
+
+@lru_cache(maxsize=1000)
+def format_sender(full_name: str, delivery_email: str) -> str:
+    return str(Address(display_name=full_name, addr_spec=delivery_email))
+
+
+@lru_cache(maxsize=1000)
+def format_recipient(recipient_id: int) -> tuple[str, bool]:
+    recipient = Recipient.objects.get(id=recipient_id)
+
+    if recipient.type == Recipient.STREAM:
+        stream = Stream.objects.values("name").get(id=recipient.type_id)
+        return "#" + stream["name"], True
+
+    users = (
+        UserProfile.objects.filter(
+            subscription__recipient_id=recipient.id,
+        )
+        .order_by("full_name")
+        .values_list("full_name", "delivery_email")
+    )
+
+    return ", ".join(format_sender(e[0], e[1]) for e in users), False
+
+
+def format_full_recipient(recipient_id: int, subject: str) -> str:
+    recip_str, has_subject = format_recipient(recipient_id)
+    if not has_subject:
+        return recip_str
+    return f"{recip_str} > {subject}"
+
+
+def split_id_range(min_id: int | None, max_id: int | None, parts: int) -> list[tuple[int, int]]:
+    """Splits [min_id, max_id] into up to `parts` ranges, each given as
+    (exclusive lower bound, inclusive upper bound)."""
+    if min_id is None or max_id is None:
+        return []
+    step = -(-(max_id - min_id + 1) // parts)
+    return [(start - 1, min(start + step - 1, max_id)) for start in range(min_id, max_id + 1, step)]
+
+
+@dataclass
+class SearchExport:
+    # A Query, rather than a QuerySet, so that it can be sent to the
+    # worker processes without being evaluated.
+    query: Query
+    usermessage_joined: bool
+    json_format: bool
+    attachments_path: str | None
+
+    @property
+    def file_mode(self) -> str:
+        return "wb" if self.json_format else "w"
+
+    @property
+    def columns(self) -> list[str]:
+        columns = [
+            "id",
+            "timestamp (UTC)",
+            "sender",
+            "recipient",
+            "content",
+            "edit history",
+        ]
+        if self.attachments_path:
+            columns += ["attachments"]
+        return columns
+
+    def transform_message(self, message: Message) -> dict[str, str]:
+        row = {
+            "id": str(message.id),
+            "timestamp (UTC)": message.date_sent.astimezone(timezone.utc).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            ),
+            "sender": format_sender(message.sender.full_name, message.sender.delivery_email),
+            "recipient": format_full_recipient(message.recipient_id, message.subject),
+            "content": message.content,
+            "edit history": message.edit_history if message.edit_history is not None else "",
+        }
+        if self.attachments_path:
+            if message.has_attachment:
+                attachments = message.attachment_set.all()
+                row["attachments"] = " ".join(a.path_id for a in attachments)
+                for attachment in attachments:
+                    download_queue.put(attachment.path_id)
+            else:
+                row["attachments"] = ""
+        return row
+
+    def chunked_results(self, min_id: int, max_id: int | None) -> Iterator[list[dict[str, str]]]:
+        messages_query = Message.objects.all()
+        messages_query.query = self.query
+        if max_id is not None:
+            messages_query = messages_query.filter(id__lte=max_id)
+            if self.usermessage_joined:
+                messages_query = messages_query.extra(
+                    where=["zerver_usermessage.message_id <= %s"], params=[max_id]
+                )
+        while True:
+            batch_query = messages_query.filter(id__gt=min_id)
+            if self.usermessage_joined:
+                batch_query = batch_query.extra(
+                    where=["zerver_usermessage.message_id > %s"], params=[min_id]
+                )
+            batch = [self.transform_message(m) for m in batch_query[:BATCH_SIZE]]
+            if len(batch) == 0:
+                break
+            min_id = int(batch[-1]["id"])
+            yield batch
+
+    def write_header(self, output_file: IO[Any]) -> None:
+        if self.json_format:
+            output_file.write(b"[\n")
+        else:
+            csv.DictWriter(output_file, self.columns).writeheader()
+
+    def write_footer(self, output_file: IO[Any]) -> None:
+        if self.json_format:
+            output_file.write(b"\n]")
+
+    def write_messages(self, output_file: IO[Any], min_id: int, max_id: int | None) -> int:
+        """Writes the messages with IDs in (min_id, max_id] as they are
+        fetched, without the header or footer; returns how many were
+        written."""
+        count = 0
+        csvwriter = csv.DictWriter(output_file, self.columns)
+        for batch in self.chunked_results(min_id, max_id):
+            if self.json_format:
+                if count > 0:
+                    output_file.write(b",\n")
+                chunk = orjson.dumps(batch, option=orjson.OPT_INDENT_2)
+                assert chunk.startswith(b"[\n")
+                assert chunk.endswith(b"\n]")
+                output_file.write(chunk[2:-2])
+            else:
+                csvwriter.writerows(batch)
+            count += len(batch)
+            print(f"Exported {count} messages through ID {batch[-1]['id']}")
+        return count
+
+
+def export_message_range(export: SearchExport, part_path: str, min_id: int, max_id: int) -> int:
+    with open(part_path, export.file_mode) as part_file:
+        count = export.write_messages(part_file, min_id, max_id)
+    download_queue.join()
+    return count
+
+
 class Command(ZulipBaseCommand):
     help = """Exports the messages matching certain search terms, or from
 senders/recipients.
@@ -78,7 +236,18 @@ This is most often used for legal compliance.
         parser.add_argument(
             "--force", action="store_true", help="Overwrite the output file if it exists already"
         )
-        parser.add_argument("--threads", default=5, type=int)
+        parser.add_argument(
+            "--threads",
+            default=5,
+            type=int,
+            help="Threads to download attachments with, in each process",
+        )
+        parser.add_argument(
+            "--processes",
+            default=1,
+            type=int,
+            help="Processes to export with; each exports a range of message IDs in parallel",
+        )
 
         parser.add_argument(
             "--file",
@@ -154,6 +323,9 @@ This is most often used for legal compliance.
                 "Unknown file format: {options['output']}  Only .csv and .json are supported"
             )
 
+        if options["processes"] < 1:
+            raise CommandError("--processes must be at least 1")
+
         if os.path.exists(options["output"]) and not options["force"]:
             raise CommandError(
                 f"Output path '{options['output']}' already exists; use --force to overwrite"
@@ -249,108 +421,60 @@ This is most often used for legal compliance.
         if need_distinct:
             messages_query = messages_query.distinct("id")
 
-        if options["write_attachments"]:
-            for i in range(options["threads"]):
-                Thread(
-                    target=download_worker, daemon=True, args=(options["write_attachments"],)
-                ).start()
-
-        @lru_cache(maxsize=1000)
-        def format_sender(full_name: str, delivery_email: str) -> str:
-            return str(Address(display_name=full_name, addr_spec=delivery_email))
-
-        def format_full_recipient(recipient_id: int, subject: str) -> str:
-            recip_str, has_subject = format_recipient(recipient_id)
-            if not has_subject:
-                return recip_str
-            return f"{recip_str} > {subject}"
-
-        @lru_cache(maxsize=1000)
-        def format_recipient(recipient_id: int) -> tuple[str, bool]:
-            recipient = Recipient.objects.get(id=recipient_id)
-
-            if recipient.type == Recipient.STREAM:
-                stream = Stream.objects.values("name").get(id=recipient.type_id)
-                return "#" + stream["name"], True
-
-            users = (
-                UserProfile.objects.filter(
-                    subscription__recipient_id=recipient.id,
-                )
-                .order_by("full_name")
-                .values_list("full_name", "delivery_email")
-            )
-
-            return ", ".join(format_sender(e[0], e[1]) for e in users), False
-
-        def transform_message(message: Message) -> dict[str, str]:
-            row = {
-                "id": str(message.id),
-                "timestamp (UTC)": message.date_sent.astimezone(timezone.utc).strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                ),
-                "sender": format_sender(message.sender.full_name, message.sender.delivery_email),
-                "recipient": format_full_recipient(message.recipient_id, message.subject),
-                "content": message.content,
-                "edit history": message.edit_history if message.edit_history is not None else "",
-            }
-            if options["write_attachments"]:
-                if message.has_attachment:
-                    attachments = message.attachment_set.all()
-                    row["attachments"] = " ".join(a.path_id for a in attachments)
-                    for attachment in attachments:
-                        download_queue.put(attachment.path_id)
-                else:
-                    row["attachments"] = ""
-            return row
-
-        def chunked_results() -> Iterator[list[dict[str, str]]]:
-            min_id = 0
-            while True:
-                batch_query = messages_query.filter(id__gt=min_id)
-                if usermessage_joined:
-                    batch_query = batch_query.extra(
-                        where=["zerver_usermessage.message_id > %s"], params=[min_id]
-                    )
-                batch = [transform_message(m) for m in batch_query[:BATCH_SIZE]]
-                if len(batch) == 0:
-                    break
-                min_id = int(batch[-1]["id"])
-                yield batch
+        export = SearchExport(
+            query=messages_query.query,
+            usermessage_joined=usermessage_joined,
+            json_format=options["output"].endswith(".json"),
+            attachments_path=options["write_attachments"],
+        )
 
         print("Exporting messages...")
-        if options["output"].endswith(".json"):
-            with open(options["output"], "wb") as json_file:
-                first_chunk = True
-                for batch in chunked_results():
-                    print(".")
-                    if not first_chunk:
-                        json_file.write(b",\n")
-                    chunk = orjson.dumps(batch, option=orjson.OPT_INDENT_2)
-                    if not first_chunk:
-                        assert chunk.startswith(b"[\n")
-                        chunk = chunk[2:]
-                    assert chunk.endswith(b"\n]")
-                    chunk = chunk[:-2]
-                    json_file.write(chunk)
-                    first_chunk = False
-                json_file.write(b"\n]")
-        elif options["output"].endswith(".csv"):
-            with open(options["output"], "w") as csv_file:
-                columns = [
-                    "id",
-                    "timestamp (UTC)",
-                    "sender",
-                    "recipient",
-                    "content",
-                    "edit history",
-                ]
-
-                if options["write_attachments"]:
-                    columns += ["attachments"]
-                csvwriter = csv.DictWriter(csv_file, columns)
-                csvwriter.writeheader()
-                for batch in chunked_results():
-                    print(".")
-                    csvwriter.writerows(batch)
-        download_queue.join()
+        if options["processes"] == 1:
+            if export.attachments_path:
+                start_download_workers(export.attachments_path, options["threads"])
+            with open(options["output"], export.file_mode) as output_file:
+                export.write_header(output_file)
+                export.write_messages(output_file, 0, None)
+                export.write_footer(output_file)
+            download_queue.join()
+            return
+
+        # Split the realm's message IDs into more ranges than there are
+        # processes, so that a busy stretch of history doesn't leave
+        # the other processes idle.
+        id_range = Message.objects.filter(realm=realm).aggregate(Min("id"), Max("id"))
+        ranges = split_id_range(id_range["id__min"], id_range["id__max"], options["processes"] * 4)
+        output_dir = os.path.dirname(os.path.abspath(options["output"]))
+        with tempfile.TemporaryDirectory(dir=output_dir) as parts_dir:
+            part_paths = [os.path.join(parts_dir, f"{i}.part") for i in range(len(ranges))]
+            connection.close()
+            disconnect_remote_cache()
+            counts: dict[str, int] = {}
+            with ProcessPoolExecutor(
+                max_workers=options["processes"],
+                initializer=start_download_workers if export.attachments_path else None,
+                initargs=(export.attachments_path, options["threads"]),
+            ) as executor:
+                futures = {
+                    executor.submit(export_message_range, export, part_path, after_id, last_id): (
+                        part_path
+                    )
+                    for part_path, (after_id, last_id) in zip(part_paths, ranges, strict=True)
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    counts[futures[future]] = future.result()
+                    print(f"Finished {done}/{len(futures)} ranges of messages")
+
+            print("Combining results...")
+            with open(options["output"], export.file_mode) as output_file:
+                export.write_header(output_file)
+                first_part = True
+                for part_path in part_paths:
+                    if counts[part_path] == 0:
+                        continue
+                    if export.json_format and not first_part:
+                        output_file.write(b",\n")
+                    with open(part_path, export.file_mode.replace("w", "r")) as part_file:
+                        shutil.copyfileobj(part_file, output_file)
+                    first_part = False
+                export.write_footer(output_file)
@@ -0,0 +1,80 @@
+import time
+from argparse import ArgumentParser
+from datetime import timedelta
+from typing import Any
+
+from django.utils.timezone import now as timezone_now
+from typing_extensions import override
+
+from zerver.lib.cache import cache_get, cache_set
+from zerver.lib.cache_helpers import CACHE_WARMER_SENTINEL_KEY, warm_caches
+from zerver.lib.management import ZulipBaseCommand
+
+
+class Command(ZulipBaseCommand):
+    help = """Fill the caches used by recently active users and their
+organizations' recent messages, most recently active users first.
+
+With --watch, checks every minute whether memcached has been emptied
+(e.g. by a restart), and refills it if so; this is how it is run
+under supervisor.
+
+Usage: ./manage.py warm_caches [--watch]
+"""
+
+    @override
+    def add_arguments(self, parser: ArgumentParser) -> None:
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Run forever, refilling the caches whenever memcached is emptied",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=2,
+            help="Warm caches for users active in this many days (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of users or messages to fetch at a time (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--messages-per-realm",
+            type=int,
+            default=1000,
+            help="Number of recent messages to warm in each realm (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="Seconds to sleep between batches, to limit database load (default: %(default)s)",
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        def warm() -> None:
+            warm_caches(
+                since=timezone_now() - timedelta(days=options["days"]),
+                batch_size=options["batch_size"],
+                messages_per_realm=options["messages_per_realm"],
+                pause=options["pause"],
+            )
+
+        if not options["watch"]:
+            warm()
+            return
+
+        try:
+            while True:
+                # The sentinel goes missing when memcached restarts, or
+                # when a deploy changes the cache key prefix.
+                if cache_get(CACHE_WARMER_SENTINEL_KEY) is None:
+                    warm()
+                    cache_set(CACHE_WARMER_SENTINEL_KEY, True, timeout=3600 * 24 * 7)
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
@@ -203,7 +203,10 @@ def write_log_line(
     queries = connection.connection.queries if connection.connection is not None else []
     if len(queries) > 0:
         query_time = sum(float(query.get("time", 0)) for query in queries)
-        db_time_output = f" (db: {format_timedelta(query_time)}/{len(queries)}q)"
+        fingerprints = [query["fingerprint"] for query in queries if "fingerprint" in query]
+        duplicate_queries = len(fingerprints) - len(set(fingerprints))
+        duplicate_output = f", {duplicate_queries} dup" if duplicate_queries else ""
+        db_time_output = f" (db: {format_timedelta(query_time)}/{len(queries)}q{duplicate_output})"
 
     if "extra" in log_data:
         extra_request_data = " {}".format(log_data["extra"])
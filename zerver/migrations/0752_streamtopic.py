@@ -0,0 +1,53 @@
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("zerver", "0751_externalauthid_zerver_user_externalauth_uniq"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StreamTopic",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("topic_name", models.CharField(max_length=60)),
+                ("last_message_id", models.IntegerField()),
+                ("message_count", models.IntegerField()),
+                (
+                    "realm",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="zerver.realm"
+                    ),
+                ),
+                (
+                    "recipient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="zerver.recipient"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["recipient", "-last_message_id"],
+                        name="zerver_streamtopic_recipient_last_message_id",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        models.F("recipient"),
+                        django.db.models.functions.text.Upper("topic_name"),
+                        name="zerver_streamtopic_recipient_upper_topic_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations, transaction
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.state import StateApps
+from django.db.models import Max
+
+BATCH_SIZE = 100000
+
+
+def backfill_stream_topics(apps: StateApps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    Message = apps.get_model("zerver", "Message")
+
+    max_id = Message.objects.aggregate(Max("id"))["id__max"]
+    if max_id is None:
+        return
+
+    # Start over if an earlier attempt was interrupted.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DELETE FROM zerver_streamtopic")
+
+    lower_bound = 1
+    while lower_bound <= max_id:
+        upper_bound = lower_bound + BATCH_SIZE - 1
+        print(f"Processing messages {lower_bound} to {upper_bound} / {max_id}")
+        # Each batch's topics are merged into the rows from earlier
+        # batches, and from any messages sent meanwhile.
+        with transaction.atomic(), schema_editor.connection.cursor() as cursor:
+            # Uses index: zerver_message_pkey
+            cursor.execute(
+                """
+                INSERT INTO zerver_streamtopic
+                    (realm_id, recipient_id, topic_name, last_message_id, message_count)
+                SELECT
+                    realm_id,
+                    recipient_id,
+                    (array_agg(subject ORDER BY id DESC))[1],
+                    max(id),
+                    count(*)
+                FROM zerver_message
+                WHERE id BETWEEN %(lower_bound)s AND %(upper_bound)s AND is_channel_message
+                GROUP BY realm_id, recipient_id, upper(subject)
+                ON CONFLICT (recipient_id, upper(topic_name)) DO UPDATE SET
+                    topic_name = CASE
+                        WHEN EXCLUDED.last_message_id > zerver_streamtopic.last_message_id
+                        THEN EXCLUDED.topic_name
+                        ELSE zerver_streamtopic.topic_name
+                    END,
+                    last_message_id = greatest(
+                        EXCLUDED.last_message_id, zerver_streamtopic.last_message_id
+                    ),
+                    message_count = zerver_streamtopic.message_count + EXCLUDED.message_count
+                """,
+                {"lower_bound": lower_bound, "upper_bound": upper_bound},
+            )
+        lower_bound = upper_bound + 1
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("zerver", "0752_streamtopic"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_stream_topics, reverse_code=migrations.RunPython.noop, elidable=True
+        ),
+    ]
@@ -64,6 +64,7 @@ from zerver.models.scheduled_jobs import ScheduledMessage as ScheduledMessage
 from zerver.models.scheduled_jobs import (
     ScheduledMessageNotificationEmail as ScheduledMessageNotificationEmail,
 )
+from zerver.models.stream_topics import StreamTopic as StreamTopic
 from zerver.models.streams import ChannelEmailAddress as ChannelEmailAddress
 from zerver.models.streams import DefaultStream as DefaultStream
 from zerver.models.streams import DefaultStreamGroup as DefaultStreamGroup
@@ -0,0 +1,52 @@
+from django.db import models
+from django.db.models import CASCADE
+from django.db.models.functions import Upper
+from typing_extensions import override
+
+from zerver.models.constants import MAX_TOPIC_NAME_LENGTH
+from zerver.models.realms import Realm
+from zerver.models.recipients import Recipient
+
+
+class StreamTopic(models.Model):
+    """A summary of one topic in a channel, so that listing a channel's
+    topics doesn't have to aggregate over all of its messages.  These
+    rows are derived from the Message table, and maintained by
+    zerver.lib.stream_topic whenever messages are sent, moved, or
+    deleted."""
+
+    realm = models.ForeignKey(Realm, on_delete=CASCADE)
+    # The channel's recipient, matching Message.recipient.
+    recipient = models.ForeignKey(Recipient, on_delete=CASCADE)
+    # Topics are case-insensitive; this is the case used by the most
+    # recent message.
+    topic_name = models.CharField(max_length=MAX_TOPIC_NAME_LENGTH)
+    last_message_id = models.IntegerField()
+    message_count = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                "recipient",
+                Upper("topic_name"),
+                name="zerver_streamtopic_recipient_upper_topic_uniq",
+            ),
+        ]
+
+        indexes = [
+            # For listing a channel's topics, most recent first.
+            models.Index(
+                fields=("recipient", "-last_message_id"),
+                name="zerver_streamtopic_recipient_last_message_id",
+            ),
+        ]
+
+    @override
+    def __str__(self) -> str:
+        return f"{self.recipient_id} {self.topic_name} ({self.message_count})"
+
+    @property
+    def is_resolved(self) -> bool:
+        from zerver.lib.topic import RESOLVED_TOPIC_PREFIX
+
+        return self.topic_name.startswith(RESOLVED_TOPIC_PREFIX)
@@ -1146,7 +1146,7 @@ def get_user_by_id_in_realm_including_cross_realm(
     raise UserProfile.DoesNotExist
 
 
-@cache_with_key(realm_user_dicts_cache_key, timeout=3600 * 24 * 7)
+@cache_with_key(realm_user_dicts_cache_key, timeout=3600 * 24 * 7, coalesce=True)
 def get_realm_user_dicts(realm_id: int) -> list[RawUserDict]:
     return list(
         UserProfile.objects.filter(
@@ -1185,7 +1185,7 @@ def get_realm_user_dicts_from_ids(realm_id: int, user_ids: list[int]) -> list[Ra
     )
 
 
-@cache_with_key(active_user_ids_cache_key, timeout=3600 * 24 * 7)
+@cache_with_key(active_user_ids_cache_key, timeout=3600 * 24 * 7, coalesce=True)
 def active_user_ids(realm_id: int) -> list[int]:
     query = UserProfile.objects.filter(
         realm_id=realm_id,
@@ -1194,7 +1194,7 @@ def active_user_ids(realm_id: int) -> list[int]:
     return list(query)
 
 
-@cache_with_key(active_non_guest_user_ids_cache_key, timeout=3600 * 24 * 7)
+@cache_with_key(active_non_guest_user_ids_cache_key, timeout=3600 * 24 * 7, coalesce=True)
 def active_non_guest_user_ids(realm_id: int) -> list[int]:
     query = (
         UserProfile.objects.filter(
@@ -1237,7 +1237,9 @@ def get_source_profile(email: str, realm_id: int) -> UserProfile | None:
         return None
 
 
-@cache_with_key(lambda realm: bot_dicts_in_realm_cache_key(realm.id), timeout=3600 * 24 * 7)
+@cache_with_key(
+    lambda realm: bot_dicts_in_realm_cache_key(realm.id), timeout=3600 * 24 * 7, coalesce=True
+)
 def get_bot_dicts_in_realm(realm: "Realm") -> list[dict[str, Any]]:
     return list(UserProfile.objects.filter(realm=realm, is_bot=True).values(*bot_dict_fields))
 
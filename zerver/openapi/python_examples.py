@@ -1116,6 +1116,30 @@ def get_messages(client: Client) -> None:
     assert len(result["messages"]) <= request["num_before"]
 
 
+@openapi_test_function("/messages/narrows:get")
+def get_messages_for_narrows(client: Client) -> None:
+    # {code_example|start}
+    # Get the 20 last messages in the combined feed, and the
+    # messages around the first unread message in the channel
+    # named "Verona".
+    request = {
+        "narrows": [
+            {"anchor": "newest", "num_before": 20},
+            {
+                "narrow": [{"operator": "channel", "operand": "Verona"}],
+                "anchor": "first_unread",
+                "num_before": 10,
+                "num_after": 10,
+            },
+        ],
+    }
+    result = client.call_endpoint(url="messages/narrows", method="GET", request=request)
+    # {code_example|end}
+    assert_success_response(result)
+    validate_against_openapi_schema(result, "/messages/narrows", "get", "200")
+    assert len(result["results"]) == 2
+
+
 @openapi_test_function("/messages/matches_narrow:get")
 def check_messages_match_narrow(client: Client) -> None:
     message = {"type": "stream", "to": "Verona", "topic": "test_topic", "content": "http://foo.com"}
@@ -1969,6 +1993,7 @@ def test_messages(client: Client, nonadmin_client: Client) -> None:
     update_message(client, message_id, content)
     get_raw_message(client, message_id)
     get_messages(client)
+    get_messages_for_narrows(client)
     check_messages_match_narrow(client)
     get_message_history(client, message_id)
     get_read_receipts(client, message_id)
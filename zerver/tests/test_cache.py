@@ -1,27 +1,50 @@
+import pickle
+from datetime import timedelta
 from unittest.mock import Mock, patch
 
 from bmemcached.exceptions import MemcachedException
 from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.timezone import now as timezone_now
 
 from zerver.apps import flush_cache
+from zerver.lib import cache
 from zerver.lib.cache import (
     MEMCACHED_MAX_KEY_LENGTH,
     InvalidCacheKeyError,
+    LocalCache,
+    acquire_cache_lease,
+    bounce_key_prefix_for_testing,
     bulk_cached_fetch,
     cache_delete,
     cache_delete_many,
     cache_get,
     cache_get_many,
+    cache_lease_key,
     cache_set,
     cache_set_many,
     cache_with_key,
+    get_cache_backend,
+    local_cache,
+    local_cache_version_cache_key,
+    release_cache_lease,
     safe_cache_get_many,
     safe_cache_set_many,
+    to_dict_cache_key_id,
+    user_profile_by_api_key_cache_key,
     user_profile_by_id_cache_key,
     validate_cache_key,
 )
+from zerver.lib.cache_helpers import (
+    CACHE_WARMER_SENTINEL_KEY,
+    get_recently_active_user_ids,
+    warm_caches,
+)
+from zerver.lib.cache_stats import get_cache_stats, reset_cache_stats
+from zerver.lib.redis_cache import ZstdRedisSerializer, ZulipRedisCache
 from zerver.lib.test_classes import ZulipTestCase
-from zerver.models import UserProfile
+from zerver.models import UserActivityInterval, UserPresence, UserProfile
 from zerver.models.realms import get_realm
 from zerver.models.users import get_system_bot, get_user, get_user_profile_by_id
 
@@ -37,6 +60,168 @@ class AppsTest(ZulipTestCase):
             self.assert_length(m.output, 1)
 
 
+class LocalCacheTest(ZulipTestCase):
+    @override_settings(LOCAL_CACHE_TTLS={"user_profile_by_id": 60})
+    def test_local_cache(self) -> None:
+        self.addCleanup(local_cache.clear)
+        local_cache.next_check = 0
+        hamlet = self.example_user("hamlet")
+        with patch("zerver.lib.cache.LOCAL_CACHE_CHECK_INTERVAL", 3600):
+            get_user_profile_by_id(hamlet.id)
+
+            # The second lookup doesn't touch memcached, and returns a
+            # copy of the user.
+            with patch("zerver.lib.cache.get_cache_backend", wraps=get_cache_backend) as backend:
+                user_profile = get_user_profile_by_id(hamlet.id)
+                self.assertEqual(user_profile, hamlet)
+                self.assertIsNot(user_profile, get_user_profile_by_id(hamlet.id))
+            backend.assert_not_called()
+
+            # Changes in this process evict the key immediately.
+            hamlet.full_name = "Prince Hamlet"
+            hamlet.save(update_fields=["full_name"])
+            self.assertEqual(get_user_profile_by_id(hamlet.id).full_name, "Prince Hamlet")
+
+            # Changes in other processes are only seen once we check
+            # the family's version again, and only evict the keys
+            # which changed.
+            cordelia = self.example_user("cordelia")
+            local_cache.next_check = 0
+            get_user_profile_by_id(cordelia.id)
+            with patch.object(local_cache, "delete_many"):
+                hamlet.full_name = "King Hamlet"
+                hamlet.save(update_fields=["full_name"])
+            LocalCache().delete_many([user_profile_by_id_cache_key(hamlet.id)])
+            self.assertEqual(get_user_profile_by_id(hamlet.id).full_name, "Prince Hamlet")
+            local_cache.next_check = 0
+            self.assertEqual(get_user_profile_by_id(hamlet.id).full_name, "King Hamlet")
+            with patch("zerver.lib.cache.get_cache_backend", wraps=get_cache_backend) as backend:
+                get_user_profile_by_id(cordelia.id)
+            backend.assert_not_called()
+
+            # A process which has fallen too far behind drops all of
+            # the family's entries.
+            version_key = cache.KEY_PREFIX + local_cache_version_cache_key("user_profile_by_id")
+            version = local_cache.versions[version_key]
+            assert version is not None
+            local_cache.versions[version_key] = version - 200
+            local_cache.next_check = 0
+            local_cache.check_versions()
+            self.assertNotIn(
+                cache.KEY_PREFIX + user_profile_by_id_cache_key(cordelia.id), local_cache.entries
+            )
+
+
+class CacheStatsTest(ZulipTestCase):
+    def test_cache_stats(self) -> None:
+        hamlet = self.example_user("hamlet")
+        key = user_profile_by_id_cache_key(hamlet.id)
+        reset_cache_stats()
+
+        cache_delete(key)
+        with patch("zerver.lib.cache_stats.CACHE_STATS_SIZE_SAMPLE_RATE", 1):
+            get_user_profile_by_id(hamlet.id)
+        get_user_profile_by_id(hamlet.id)
+        stats = get_cache_stats()["user_profile_by_id"]
+        self.assertEqual(
+            [stats["hits"], stats["local_hits"], stats["misses"], stats["sets"], stats["deletes"]],
+            [1, 0, 1, 1, 1],
+        )
+        self.assertEqual(stats["sized_sets"], 1)
+        self.assertGreater(stats["set_bytes"], 0)
+
+        with patch("builtins.print") as print_mock:
+            call_command("cache_stats", "--reset")
+        self.assertTrue(
+            any(
+                call.args[0].startswith("user_profile_by_id ") for call in print_mock.call_args_list
+            )
+        )
+        self.assertEqual(get_cache_stats(), {})
+
+        with self.settings(SHARED_SECRET="secret"):
+            result = self.client_post("/api/internal/cache_stats", {"secret": "secret"})
+            self.assertIn("cache_stats", self.assert_json_success(result))
+            result = self.client_post("/api/internal/cache_stats", {"secret": "wrong"})
+            self.assert_json_error(result, "Access denied", status_code=403)
+
+
+class CacheWarmerTest(ZulipTestCase):
+    def test_warm_caches(self) -> None:
+        hamlet = self.example_user("hamlet")
+        iago = self.example_user("iago")
+        now = timezone_now()
+        UserPresence.objects.update(last_active_time=now - timedelta(days=30))
+        UserActivityInterval.objects.all().delete()
+        UserPresence.objects.update_or_create(
+            user_profile=hamlet,
+            defaults=dict(realm=hamlet.realm, last_active_time=now - timedelta(minutes=5)),
+        )
+        UserActivityInterval.objects.create(
+            user_profile=iago, start=now - timedelta(hours=1), end=now - timedelta(minutes=1)
+        )
+        since = now - timedelta(days=1)
+        self.assertEqual(get_recently_active_user_ids(since), [iago.id, hamlet.id])
+
+        message_id = self.send_stream_message(hamlet, "Denmark")
+        bounce_key_prefix_for_testing("test_warm_caches")
+        with self.assertLogs(level="INFO") as info_logs:
+            warm_caches(since=since, messages_per_realm=10, pause=0)
+        self.assertIn("Warmed caches for 2 users in 1 realms, and 10 messages", info_logs.output[0])
+
+        cached = cache_get_many(
+            [
+                user_profile_by_id_cache_key(hamlet.id),
+                user_profile_by_api_key_cache_key(iago.api_key),
+                to_dict_cache_key_id(message_id),
+            ]
+        )
+        self.assert_length(cached, 3)
+        with self.assert_database_query_count(0, keep_cache_warm=True):
+            self.assertEqual(get_user_profile_by_id(hamlet.id), hamlet)
+
+        # A second pass finds everything cached, and so only queries
+        # for the active users and each realm's recent messages.
+        with self.assert_database_query_count(3), self.assertLogs(level="INFO"):
+            warm_caches(since=since, messages_per_realm=10, pause=0)
+
+    def test_watch(self) -> None:
+        with (
+            patch("zerver.management.commands.warm_caches.warm_caches") as warm_mock,
+            patch("time.sleep", side_effect=[None, KeyboardInterrupt]),
+        ):
+            call_command("warm_caches", "--watch")
+        # The caches are only warmed again once they have been emptied.
+        warm_mock.assert_called_once()
+        self.assertTrue(cache_get(CACHE_WARMER_SENTINEL_KEY))
+
+
+class RedisCacheTest(ZulipTestCase):
+    def test_serializer(self) -> None:
+        serializer = ZstdRedisSerializer()
+        # Integers are left alone, so that incr works.
+        self.assertEqual(serializer.dumps(5), 5)
+        self.assertEqual(serializer.loads(b"5"), 5)
+
+        small = {"id": 1}
+        self.assertEqual(serializer.loads(serializer.dumps(small)), small)
+        large = [{"id": i, "full_name": "King Hamlet"} for i in range(100)]
+        data = serializer.dumps(large)
+        assert isinstance(data, bytes)
+        self.assertLess(len(data), len(pickle.dumps(large, protocol=5)))
+        self.assertEqual(serializer.loads(data), large)
+
+    def test_options(self) -> None:
+        backend = ZulipRedisCache("redis://127.0.0.1:6380/0", {"OPTIONS": {"password": "x"}})
+        self.assertEqual(backend._options, {"serializer": ZstdRedisSerializer, "password": "x"})
+
+        backend = ZulipRedisCache(
+            "redis://127.0.0.1:6380/0", {"OPTIONS": {"client_cache_size": 1000}}
+        )
+        self.assertEqual(backend._options["protocol"], 3)
+        self.assertEqual(backend._options["cache_config"].get_max_size(), 1000)
+
+
 class CacheKeyValidationTest(ZulipTestCase):
     def test_validate_cache_key(self) -> None:
         validate_cache_key("nice_Ascii:string!~")
@@ -134,6 +319,61 @@ class CacheWithKeyDecoratorTest(ZulipTestCase):
 
         self.assertEqual(result_two, hamlet)
 
+    def test_cache_with_key_coalesce(self) -> None:
+        def coalesced_cache_key_function(user_id: int) -> str:
+            return f"CacheWithKeyDecoratorTest:coalesced:{user_id}"
+
+        @cache_with_key(coalesced_cache_key_function, timeout=1000, coalesce=True)
+        def get_user_full_name(user_id: int) -> str:
+            return UserProfile.objects.get(id=user_id).full_name
+
+        hamlet = self.example_user("hamlet")
+        key = coalesced_cache_key_function(hamlet.id)
+
+        # Another process is computing the value, so we wait for it;
+        # the polls aren't counted as cache misses.
+        self.assertIsNotNone(acquire_cache_lease(key))
+        polls = 0
+
+        def sleep(seconds: float) -> None:
+            nonlocal polls
+            polls += 1
+            if polls == 3:
+                cache_set(key, "Ham")
+
+        reset_cache_stats()
+        with (
+            patch("zerver.lib.cache.time.sleep", side_effect=sleep),
+            self.assert_database_query_count(0),
+        ):
+            self.assertEqual(get_user_full_name(hamlet.id), "Ham")
+        self.assertEqual(polls, 3)
+        stats = get_cache_stats()["CacheWithKeyDecoratorTest"]
+        self.assertEqual([stats["hits"], stats["misses"]], [0, 1])
+
+        # If it takes too long, we compute it ourselves.
+        cache_delete(key)
+        with (
+            patch("zerver.lib.cache.CACHE_LEASE_WAIT", 0),
+            self.assert_database_query_count(1),
+        ):
+            self.assertEqual(get_user_full_name(hamlet.id), hamlet.full_name)
+
+        # Once the lease has expired, we take it, and release it afterwards.
+        cache_delete(key)
+        cache_delete(cache_lease_key(key))
+        with self.assert_database_query_count(1):
+            self.assertEqual(get_user_full_name(hamlet.id), hamlet.full_name)
+        lease_token = acquire_cache_lease(key)
+        assert lease_token is not None
+
+        # Releasing a lease which has expired and been taken by
+        # another process leaves the other process's lease alone.
+        cache_delete(cache_lease_key(key))
+        self.assertIsNotNone(acquire_cache_lease(key))
+        release_cache_lease(key, lease_token)
+        self.assertIsNone(acquire_cache_lease(key))
+
     def test_cache_with_key_none_values(self) -> None:
         def cache_key_function(user_id: int) -> str:
             return f"CacheWithKeyDecoratorTest:test_cache_with_key_none_values:{user_id}"
@@ -12,11 +12,14 @@ from django.utils.timezone import now as timezone_now
 from typing_extensions import override
 
 from zerver.actions.channel_folders import check_add_channel_folder
-from zerver.actions.custom_profile_fields import try_update_realm_custom_profile_field
+from zerver.actions.custom_profile_fields import (
+    do_update_user_custom_profile_data_if_changed,
+    try_update_realm_custom_profile_field,
+)
 from zerver.actions.message_send import check_send_message
 from zerver.actions.presence import do_update_user_presence
 from zerver.actions.streams import do_change_stream_folder
-from zerver.actions.user_settings import do_change_user_setting
+from zerver.actions.user_settings import do_change_full_name, do_change_user_setting
 from zerver.actions.users import do_change_user_role
 from zerver.lib.event_schema import check_web_reload_client_event
 from zerver.lib.events import fetch_initial_state_data, post_process_state
@@ -200,6 +203,143 @@ class EventsEndpointTest(ZulipTestCase):
             status_code=400,
         )
 
+    def test_events_register_section_versions(self) -> None:
+        user = self.example_user("hamlet")
+        fetch_event_types = orjson.dumps(["realm_user", "realm_emoji", "alert_words"]).decode()
+
+        def register(section_versions: dict[str, str] | None) -> dict[str, Any]:
+            params = dict(fetch_event_types=fetch_event_types)
+            if section_versions is not None:
+                params["section_versions"] = orjson.dumps(section_versions).decode()
+            with stub_event_queue_user_events("15:11", []):
+                result = self.api_post(user, "/api/v1/register", params)
+            return self.assert_json_success(result)
+
+        result_dict = register(None)
+        self.assertNotIn("section_versions", result_dict)
+        self.assertNotIn("unchanged_sections", result_dict)
+        full_state = result_dict
+
+        # An empty object fetches every section, with its version.
+        result_dict = register({})
+        versions = result_dict["section_versions"]
+        self.assertEqual(set(versions), {"realm_user", "realm_emoji"})
+        self.assertEqual(result_dict["unchanged_sections"], [])
+        self.assertEqual(result_dict["realm_users"], full_state["realm_users"])
+
+        # Sections the client already has are left out.
+        result_dict = register(versions)
+        self.assertEqual(result_dict["section_versions"], versions)
+        self.assertEqual(result_dict["unchanged_sections"], ["realm_emoji", "realm_user"])
+        for key in ["realm_users", "realm_non_active_users", "cross_realm_bots", "realm_emoji"]:
+            self.assertNotIn(key, result_dict)
+        self.assertEqual(result_dict["alert_words"], full_state["alert_words"])
+
+        # A change to a section changes its version.
+        do_change_full_name(self.example_user("cordelia"), "New name", acting_user=None)
+        result_dict = register(versions)
+        self.assertNotEqual(result_dict["section_versions"]["realm_user"], versions["realm_user"])
+        self.assertEqual(result_dict["unchanged_sections"], ["realm_emoji"])
+        self.assertIn(
+            "New name", [user_dict["full_name"] for user_dict in result_dict["realm_users"]]
+        )
+        self.assertNotIn("realm_emoji", result_dict)
+
+    def test_events_register_realm_users_snapshot(self) -> None:
+        hamlet = self.example_user("hamlet")
+        iago = self.example_user("iago")
+        cordelia = self.example_user("cordelia")
+        for user in [hamlet, cordelia]:
+            do_change_user_setting(
+                user,
+                "email_address_visibility",
+                UserProfile.EMAIL_ADDRESS_VISIBILITY_ADMINS,
+                acting_user=None,
+            )
+
+        def register(
+            user: UserProfile, events: list[dict[str, Any]] | None = None
+        ) -> dict[str, Any]:
+            with stub_event_queue_user_events("15:11", events or []):
+                result = self.api_post(
+                    user,
+                    "/api/v1/register",
+                    dict(fetch_event_types=orjson.dumps(["realm_user"]).decode()),
+                )
+            return self.assert_json_success(result)
+
+        def fetch_users(user: UserProfile) -> dict[int, dict[str, Any]]:
+            state = fetch_initial_state_data(
+                user, realm=user.realm, event_types=["realm_user"], client_gravatar=True
+            )
+            post_process_state(
+                user, state, notification_settings_null=False, allow_empty_topic_name=True
+            )
+            users = state["realm_users"] + state["realm_non_active_users"]
+            return {user_dict["user_id"]: user_dict for user_dict in users}
+
+        def registered_users(result_dict: dict[str, Any]) -> dict[int, dict[str, Any]]:
+            users = result_dict["realm_users"] + result_dict["realm_non_active_users"]
+            return {user_dict["user_id"]: user_dict for user_dict in users}
+
+        # The snapshot for each role matches what the user would get
+        # otherwise, including their own delivery_email.
+        for user in [hamlet, iago, cordelia]:
+            users = registered_users(register(user))
+            self.assertEqual(users, fetch_users(user))
+            self.assertEqual(users[user.id]["delivery_email"], user.delivery_email)
+        self.assertIsNone(registered_users(register(hamlet))[cordelia.id]["delivery_email"])
+
+        # Later registers reuse the snapshot.
+        with mock.patch(
+            "zerver.lib.users.get_users_for_api", wraps=get_users_for_api
+        ) as build_users:
+            register(hamlet)
+            register(self.example_user("othello"))
+        build_users.assert_not_called()
+
+        # Changes to users and their custom profile fields start a new
+        # snapshot.
+        do_change_full_name(cordelia, "New name", acting_user=None)
+        users = registered_users(register(hamlet))
+        self.assertEqual(users[cordelia.id]["full_name"], "New name")
+
+        # The snapshot is started again once the change is committed,
+        # in case a concurrent /register built one from before it.
+        field = CustomProfileField.objects.get(realm=hamlet.realm, name="Phone number")
+        with self.captureOnCommitCallbacks(execute=True):
+            do_update_user_custom_profile_data_if_changed(
+                cordelia, [{"id": field.id, "value": "+1-234-567-8901"}]
+            )
+            register(hamlet)
+        with mock.patch(
+            "zerver.lib.users.get_users_for_api", wraps=get_users_for_api
+        ) as build_users:
+            users = registered_users(register(hamlet))
+        build_users.assert_called_once()
+        self.assertEqual(users, fetch_users(hamlet))
+        self.assertEqual(
+            users[cordelia.id]["profile_data"][str(field.id)]["value"], "+1-234-567-8901"
+        )
+
+        # Events that arrived while fetching the state are applied to it.
+        event = dict(
+            id=3,
+            type="realm_user",
+            op="update",
+            person=dict(user_id=cordelia.id, full_name="Edited"),
+        )
+        result_dict = register(hamlet, [event])
+        self.assertEqual(result_dict["last_event_id"], 3)
+        self.assertEqual(registered_users(result_dict)[cordelia.id]["full_name"], "Edited")
+
+        # Guests may not be able to see everyone, so they don't use it.
+        with mock.patch(
+            "zerver.lib.events.get_users_for_api", wraps=get_users_for_api
+        ) as build_users:
+            register(self.example_user("polonius"))
+        build_users.assert_called_once()
+
     def test_channel_folders_for_spectators(self) -> None:
         realm = get_realm("zulip")
         iago = self.example_user("iago")
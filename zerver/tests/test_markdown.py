@@ -39,11 +39,15 @@ from zerver.lib.markdown import (
     MarkdownListPreprocessor,
     MessageRenderingResult,
     clear_web_link_regex_for_testing,
+    compute_topic_links,
     content_has_emoji_syntax,
     image_preview_enabled,
     markdown_convert,
     maybe_update_markdown_engines,
     possible_linked_stream_names,
+    possible_linked_topics,
+    possible_tex_expressions,
+    prefetch_mention_data,
     render_message_markdown,
     topic_links,
     url_embed_preview_enabled,
@@ -65,7 +69,8 @@ from zerver.lib.mention import (
 from zerver.lib.per_request_cache import flush_per_request_caches
 from zerver.lib.streams import user_has_content_access, user_has_metadata_access
 from zerver.lib.test_classes import ZulipTestCase
-from zerver.lib.tex import render_tex
+from zerver.lib.tex import KatexSession, render_tex, render_tex_batch
+from zerver.lib.timeout import TimeoutExpiredError
 from zerver.lib.types import UserGroupMembersData
 from zerver.lib.upload import upload_message_attachment
 from zerver.lib.user_groups import UserGroupMembershipDetails
@@ -395,6 +400,52 @@ class MarkdownMiscTest(ZulipTestCase):
         mention_data = MentionData(mention_backend, content, message_sender=None)
         self.assertEqual(mention_data.get_group_members(hamlet_group.id), {hamlet.id, cordelia.id})
 
+    def test_prefetch_mention_data(self) -> None:
+        realm = get_realm("zulip")
+        hamlet = self.example_user("hamlet")
+        cordelia = self.example_user("cordelia")
+        othello = self.example_user("othello")
+        hamlet_group = NamedUserGroup.objects.get(realm=realm, name="hamletcharacters")
+        contents = [
+            "@**King Hamlet** in #**Denmark**",
+            "@**cordelia, LEAR's daughter** and @*hamletcharacters* in #**Denmark>some topic**",
+            f"@_**Othello, the Moor of Venice|{othello.id}** @_*hamletcharacters* #**Nonexistent**",
+        ]
+
+        mention_backend = MentionBackend(realm.id)
+        mention_data = prefetch_mention_data(mention_backend, contents, message_sender=hamlet)
+        self.assert_length(mention_data, 3)
+
+        # Everything that rendering these messages needs from the
+        # database has been fetched already.
+        with self.assert_database_query_count(0):
+            for content in contents:
+                data = MentionData(mention_backend, content, message_sender=hamlet)
+                data.get_stream_name_map(possible_linked_stream_names(content), acting_user=hamlet)
+                data.get_topic_info_map(possible_linked_topics(content), acting_user=hamlet)
+
+        self.assertEqual(mention_data[0].get_user_ids(), {hamlet.id})
+        self.assertEqual(mention_data[1].get_user_ids(), {cordelia.id})
+        self.assertEqual(
+            mention_data[1].get_group_members(hamlet_group.id), {hamlet.id, cordelia.id}
+        )
+        self.assertEqual(mention_data[2].get_user_ids(), {othello.id})
+        # Silent group mentions don't fetch membership.
+        self.assertEqual(mention_data[2].get_group_members(hamlet_group.id), set())
+
+        # The rendered content is the same as without prefetching.
+        message = Message(sender=hamlet, sending_client=get_client("test"), realm=realm)
+        for content, data in zip(contents, mention_data, strict=True):
+            self.assertEqual(
+                render_message_markdown(message, content, mention_data=data).rendered_content,
+                render_message_markdown(message, content).rendered_content,
+            )
+
+        # We don't cache negative results for user mentions.
+        mention_backend = MentionBackend(realm.id)
+        prefetch_mention_data(mention_backend, ["@**Not A User**"], message_sender=hamlet)
+        self.assertEqual(mention_backend.user_filter_cache, {})
+
     def test_invalid_katex_path(self) -> None:
         with self.settings(DEPLOY_ROOT="/nonexistent"):
             with self.assertLogs(level="ERROR") as m:
@@ -472,7 +523,161 @@ class MarkdownMiscTest(ZulipTestCase):
                 body="<i>html</i>",
                 content_type="text/html; charset=utf-8",
             )
-            self.assertEqual(render_tex("foo"), "<i>html</i>")
+            # "foo" is cached by now, so render something else.
+            self.assertEqual(render_tex("bar"), "<i>html</i>")
+
+    @responses.activate
+    @override_settings(KATEX_SERVER=True, SHARED_SECRET="foo")
+    def test_render_tex_batch(self) -> None:
+        self.assertEqual(render_tex_batch([]), {})
+
+        responses.post(
+            "http://localhost:9700/batch",
+            match=[
+                matchers.json_params_matcher(
+                    {
+                        "expressions": [
+                            {"content": "batch_a", "is_display": False},
+                            {"content": "batch_b", "is_display": True},
+                            {"content": "batch_bad", "is_display": False},
+                        ],
+                        "shared_secret": "foo",
+                    }
+                )
+            ],
+            json=["<i>a</i>\n", "<i>b</i>", None],
+        )
+        expected = {
+            ("batch_a", True): "<i>a</i>",
+            ("batch_b", False): "<i>b</i>",
+            ("batch_bad", True): None,
+        }
+        self.assertEqual(
+            render_tex_batch([("batch_a", True), ("batch_b", False), ("batch_bad", True)]),
+            expected,
+        )
+        self.assertEqual(len(responses.calls), 1)
+
+        # Successful renders are cached, and used by render_tex too.
+        self.assertEqual(
+            render_tex_batch([("batch_a", True), ("batch_b", False)]),
+            {("batch_a", True): "<i>a</i>", ("batch_b", False): "<i>b</i>"},
+        )
+        self.assertEqual(render_tex("batch_a"), "<i>a</i>")
+        self.assertEqual(len(responses.calls), 1)
+
+        # If the batch request fails, expressions are left out, to be
+        # rendered on their own.
+        responses.post("http://localhost:9700/batch", status=500, body="")
+        with self.assertLogs(level="WARNING") as m:
+            self.assertEqual(render_tex_batch([("batch_bad", True)]), {})
+        self.assertEqual(m.output, ["WARNING:root:KaTeX rendering service failed: (500) "])
+
+        responses.post("http://localhost:9700/batch", body=requests.exceptions.Timeout())
+        with self.assertLogs(level="WARNING") as m:
+            self.assertEqual(render_tex_batch([("batch_bad", True)]), {})
+        self.assertEqual(
+            m.output,
+            ["WARNING:root:KaTeX rendering service timed out with a batch of 1 expressions"],
+        )
+
+        responses.post("http://localhost:9700/batch", body=requests.exceptions.ConnectionError())
+        with self.assertLogs(level="WARNING") as m:
+            self.assertEqual(render_tex_batch([("batch_bad", True)]), {})
+        self.assertEqual(m.output, ["WARNING:root:KaTeX rendering service failed: ConnectionError"])
+
+        responses.post("http://localhost:9700/batch", json=["<i>too few</i>"])
+        with self.assertLogs(level="WARNING") as m:
+            self.assertEqual(render_tex_batch([("batch_bad", True), ("batch_c", True)]), {})
+        self.assertEqual(
+            m.output, ["WARNING:root:KaTeX rendering service returned an invalid batch response"]
+        )
+
+        # E.g. a KaTeX server which hasn't been restarted since
+        # upgrading, so doesn't have the batch endpoint yet.
+        responses.post("http://localhost:9700/batch", status=404, body="")
+        responses.post(
+            "http://localhost:9700/",
+            body="<i>fallback</i>",
+            content_type="text/html; charset=utf-8",
+        )
+        with self.assertLogs(level="WARNING") as m:
+            self.assertEqual(
+                markdown_convert_wrapper("$$batch_fallback$$"), "<p><i>fallback</i></p>"
+            )
+        self.assertEqual(m.output, ["WARNING:root:KaTeX rendering service failed: (404) "])
+
+        # The batch request's timeout grows with the number of expressions.
+        responses.post("http://localhost:9700/batch", json=["<i>c</i>", "<i>d</i>"])
+        with mock.patch("zerver.lib.tex.KatexSession", wraps=KatexSession) as session:
+            render_tex_batch([("batch_c", True), ("batch_d", True)])
+        session.assert_called_once_with(timeout=1.0)
+
+        # Up to the time the caller has left.
+        responses.post("http://localhost:9700/batch", json=["<i>e</i>", "<i>f</i>"])
+        with mock.patch("zerver.lib.tex.KatexSession", wraps=KatexSession) as session:
+            render_tex_batch([("batch_e", True), ("batch_f", True)], timeout=0.75)
+        session.assert_called_once_with(timeout=0.75)
+
+        # A batch which takes up the whole time limit for rendering
+        # the message is a rendering error, rather than being
+        # followed by rendering each expression.
+        with (
+            mock.patch("zerver.lib.markdown.render_tex_batch", side_effect=TimeoutExpiredError),
+            mock.patch("zerver.lib.markdown.render_tex") as single,
+            self.assertLogs(level="ERROR"),
+            self.assertRaises(MarkdownRenderingError),
+        ):
+            markdown_convert_wrapper("$$batch_slow$$")
+        single.assert_not_called()
+
+    def test_render_tex_batch_with_cli(self) -> None:
+        with mock.patch("zerver.lib.tex.render_tex_with_cli", return_value="<i>cli</i>") as m:
+            self.assertEqual(
+                render_tex_batch([("cli_a", True), ("cli_a", False)]),
+                {("cli_a", True): "<i>cli</i>", ("cli_a", False): "<i>cli</i>"},
+            )
+            self.assertEqual(render_tex_batch([("cli_a", True)]), {("cli_a", True): "<i>cli</i>"})
+        self.assertEqual(m.call_count, 2)
+
+    def test_possible_tex_expressions(self) -> None:
+        content = (
+            "Inline $$a^2$$ and $$b_1$$, not $5.\n"
+            "```math\nx = 1\n\ny = 2\n```\n"
+            "```python\n$$c$$\n```\n"
+            "~~~ math\nz"
+        )
+        self.assertEqual(
+            possible_tex_expressions(content),
+            {
+                ("a^2", True),
+                ("b_1", True),
+                ("c", True),
+                ("x = 1", False),
+                ("y = 2", False),
+                ("z", False),
+            },
+        )
+
+    def test_markdown_tex_batch(self) -> None:
+        content = "$$a^2$$ and $$a^2$$\n```math\nx = 1\n\ny = 2\n```"
+        prerendered = {
+            ("a^2", True): "<span>a</span>",
+            ("x = 1", False): "<span>x</span>",
+            ("y = 2", False): None,
+        }
+        with (
+            mock.patch("zerver.lib.markdown.render_tex_batch", return_value=prerendered) as batch,
+            mock.patch("zerver.lib.markdown.render_tex") as single,
+        ):
+            rendered = markdown_convert_wrapper(content)
+        batch.assert_called_once_with(
+            {("a^2", True), ("x = 1", False), ("y = 2", False)}, timeout=5
+        )
+        single.assert_not_called()
+        self.assertIn("<span>a</span> and <span>a</span>", rendered)
+        self.assertIn("<span>x</span>", rendered)
+        self.assertIn('<span class="tex-error">y = 2</span>', rendered)
 
 
 class MarkdownListPreprocessorTest(ZulipTestCase):
@@ -1443,6 +1648,36 @@ class MarkdownLinkifierTest(ZulipTestCase):
             ],
         )
 
+    def test_topic_links_cache(self) -> None:
+        realm = get_realm("zulip")
+        self.assertEqual(topic_links(realm.id, ""), [])
+
+        with mock.patch(
+            "zerver.lib.markdown.compute_topic_links", wraps=compute_topic_links
+        ) as compute:
+            links = topic_links(realm.id, "#4444 at https://example.com")
+            links[0]["text"] = "modified"
+            self.assertEqual(
+                topic_links(realm.id, "#4444 at https://example.com"),
+                [{"url": "https://example.com", "text": "https://example.com"}],
+            )
+            self.assertEqual(compute.call_count, 1)
+
+            # Adding a linkifier invalidates the cache.
+            RealmFilter(
+                realm=realm,
+                pattern=r"#(?P<id>[0-9]{2,8})",
+                url_template=r"https://trac.example.com/ticket/{id}",
+            ).save()
+            self.assertEqual(
+                topic_links(realm.id, "#4444 at https://example.com"),
+                [
+                    {"url": "https://trac.example.com/ticket/4444", "text": "#4444"},
+                    {"url": "https://example.com", "text": "https://example.com"},
+                ],
+            )
+            self.assertEqual(compute.call_count, 2)
+
     def check_add_linkifiers(
         self, linkifiers: list[RealmFilter], expected_linkifier_reprs: list[str]
     ) -> None:
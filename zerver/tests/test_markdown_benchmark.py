@@ -0,0 +1,113 @@
+from unittest import mock
+
+from zerver.lib.markdown import maybe_update_markdown_engines, md_engines
+from zerver.lib.markdown.benchmark import (
+    Baseline,
+    BaselineEntry,
+    ProcessorStats,
+    build_benchmark_corpus,
+    find_regressions,
+    instrument_markdown_engine,
+    result_to_baseline,
+    run_markdown_benchmark,
+)
+from zerver.lib.test_classes import ZulipTestCase
+from zerver.models.realms import get_realm
+
+
+class MarkdownBenchmarkTest(ZulipTestCase):
+    def test_corpus(self) -> None:
+        corpus = build_benchmark_corpus(["King Hamlet", "Cordelia, Lear's daughter"], ["Denmark"])
+        self.assertEqual(
+            [case.name for case in corpus],
+            ["long_code_block", "heavy_mentions", "many_links", "large_table", "latex", "mixed"],
+        )
+        contents = {case.name: case.content for case in corpus}
+        self.assertIn("@**Cordelia, Lear's daughter**", contents["heavy_mentions"])
+        self.assertIn("#**Denmark>topic 0**", contents["many_links"])
+
+        # The corpus is deterministic.
+        self.assertEqual(
+            corpus,
+            build_benchmark_corpus(["King Hamlet", "Cordelia, Lear's daughter"], ["Denmark"]),
+        )
+
+        fallback_corpus = build_benchmark_corpus([], [])
+        contents = {case.name: case.content for case in fallback_corpus}
+        self.assertIn("@**Iago**", contents["heavy_mentions"])
+        self.assertIn("#**Verona>topic 0**", contents["many_links"])
+
+    def test_instrument_markdown_engine(self) -> None:
+        realm = get_realm("zulip")
+        maybe_update_markdown_engines(realm.id, False)
+        engine = md_engines[(realm.id, False)]
+
+        stats: dict[str, ProcessorStats] = {}
+        with instrument_markdown_engine(engine, stats):
+            self.assertIn("handleMatch", vars(engine.inlinePatterns["usermention"]))
+            engine.reset()
+            engine.convert("**bold** text")
+        self.assertNotIn("handleMatch", vars(engine.inlinePatterns["usermention"]))
+        self.assertNotIn("run", vars(engine.treeprocessors["inline"]))
+
+        self.assertEqual(stats["inlinepattern/SimpleTagPattern"].calls, 1)
+        self.assertEqual(stats["treeprocessor/InlineProcessor"].calls, 1)
+        self.assertNotIn("inlinepattern/UserMentionPattern", stats)
+
+    def test_run_markdown_benchmark(self) -> None:
+        realm = get_realm("zulip")
+        hamlet = self.example_user("hamlet")
+        corpus = [
+            case
+            for case in build_benchmark_corpus([hamlet.full_name], ["Denmark"])
+            if case.name in ("heavy_mentions", "large_table", "latex")
+        ]
+        with (
+            mock.patch("zerver.lib.markdown.render_tex_batch", return_value={}),
+            mock.patch("zerver.lib.markdown.render_tex", return_value="<span>tex</span>"),
+            mock.patch("zerver.lib.markdown.fenced_code.render_tex", return_value="<div>tex</div>"),
+        ):
+            result = run_markdown_benchmark(realm, hamlet, corpus, iterations=2)
+
+        self.assertEqual(set(result.cases), {"heavy_mentions", "large_table", "latex"})
+        for case in result.cases.values():
+            self.assertEqual(len(case.times), 2)
+            self.assertGreater(case.peak_bytes, 0)
+        self.assertIn("inlinepattern/UserMentionPattern", result.processors)
+        self.assertIn("inlinepattern/Tex", result.processors)
+        self.assertIn("blockprocessor/TableProcessor", result.processors)
+
+        baseline = result_to_baseline(result)
+        self.assertEqual(set(baseline["cases"]), set(result.cases))
+        self.assertEqual(set(baseline["processors"]), set(result.processors))
+
+    def test_find_regressions(self) -> None:
+        baseline = Baseline(
+            cases={
+                "fast": BaselineEntry(time_ms=10.0, allocated_bytes=100),
+                "noisy": BaselineEntry(time_ms=0.1, allocated_bytes=100),
+            },
+            processors={
+                "treeprocessor/InlineProcessor": BaselineEntry(time_ms=5, allocated_bytes=0)
+            },
+        )
+        current = Baseline(
+            cases={
+                "fast": BaselineEntry(time_ms=13.0, allocated_bytes=100),
+                "noisy": BaselineEntry(time_ms=0.5, allocated_bytes=100),
+                "new": BaselineEntry(time_ms=50.0, allocated_bytes=100),
+            },
+            processors={
+                "treeprocessor/InlineProcessor": BaselineEntry(time_ms=5.5, allocated_bytes=0)
+            },
+        )
+        self.assertEqual(find_regressions(current, baseline), ["fast: 10.00ms -> 13.00ms"])
+        self.assertEqual(find_regressions(current, baseline, threshold=0.5), [])
+        self.assertEqual(
+            find_regressions(current, baseline, threshold=0.05, min_time_ms=0.1),
+            [
+                "fast: 10.00ms -> 13.00ms",
+                "noisy: 0.10ms -> 0.50ms",
+                "treeprocessor/InlineProcessor: 5.00ms -> 5.50ms",
+            ],
+        )
@@ -1,13 +1,30 @@
 from typing import Any
 from unittest import mock
 
+import orjson
 from django.utils.timezone import now as timezone_now
 
-from zerver.lib.cache import cache_delete, to_dict_cache_key_id
-from zerver.lib.display_recipient import get_display_recipient
+from zerver.actions.streams import do_rename_stream
+from zerver.actions.user_settings import do_change_full_name
+from zerver.lib import cache
+from zerver.lib.cache import (
+    LocalCache,
+    cache_delete,
+    cache_get,
+    cache_set,
+    get_cache_backend,
+    local_cache_version_cache_key,
+    to_dict_cache_key_id,
+)
+from zerver.lib.display_recipient import bulk_fetch_display_recipients, get_display_recipient
 from zerver.lib.markdown import version as markdown_version
 from zerver.lib.message import messages_for_ids
-from zerver.lib.message_cache import MessageDict, sew_messages_and_reactions
+from zerver.lib.message_cache import (
+    MessageDict,
+    extract_message_dict,
+    sew_messages_and_reactions,
+    stringify_message_dict,
+)
 from zerver.lib.per_request_cache import flush_per_request_caches
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import make_client
@@ -440,6 +457,80 @@ class MessageHydrationTest(ZulipTestCase):
         self.assertIn('class="user-mention"', new_message["content"])
         self.assertEqual(new_message["flags"], ["mentioned"])
 
+    def test_messages_for_ids_raw_content(self) -> None:
+        cordelia = self.example_user("cordelia")
+        message_id = self.send_stream_message(cordelia, "Verona", content="**raw**\nnewline")
+
+        def get_message(apply_markdown: bool) -> dict[str, Any]:
+            (message,) = messages_for_ids(
+                message_ids=[message_id],
+                user_message_flags={message_id: []},
+                search_fields={},
+                apply_markdown=apply_markdown,
+                client_gravatar=True,
+                allow_empty_topic_name=True,
+                message_edit_history_visibility_policy=MessageEditHistoryVisibilityPolicyEnum.all.value,
+                user_profile=cordelia,
+                realm=cordelia.realm,
+                raw_content=True,
+            )
+            return message
+
+        # The message is cached when sent, so its content isn't decoded.
+        message = get_message(apply_markdown=True)
+        self.assertIsInstance(message["content"], orjson.Fragment)
+        self.assertNotIn("rendered_content", message)
+        self.assertEqual(
+            orjson.loads(orjson.dumps(message))["content"],
+            "<p><strong>raw</strong><br>\nnewline</p>",
+        )
+
+        message = get_message(apply_markdown=False)
+        self.assertEqual(orjson.loads(orjson.dumps(message))["content"], "**raw**\nnewline")
+
+        # Messages fetched from the database have plain content.
+        cache_delete(to_dict_cache_key_id(message_id))
+        self.assertEqual(get_message(apply_markdown=False)["content"], "**raw**\nnewline")
+
+        # Entries in the old single-line format are treated as cache
+        # misses, and replaced.
+        old_format_entry = orjson.dumps(MessageDict.ids_to_dict([message_id])[0])
+        self.assertIsNone(extract_message_dict(old_format_entry))
+        cache_set(to_dict_cache_key_id(message_id), old_format_entry, pickled_tupled=False)
+        self.assertEqual(get_message(apply_markdown=False)["content"], "**raw**\nnewline")
+        self.assertNotEqual(cache_get(to_dict_cache_key_id(message_id)), old_format_entry)
+
+    def test_message_cache_encoding(self) -> None:
+        message_dict = {
+            "id": 1,
+            "content": "line\none \u2603",
+            "rendered_content": None,
+            "edit_history": [{"prev_content": "a\nb"}],
+        }
+        message_bytes = stringify_message_dict(message_dict)
+        self.assertEqual(message_bytes.count(b"\n"), 2)
+        self.assertEqual(extract_message_dict(message_bytes), message_dict)
+
+        raw_dict = extract_message_dict(message_bytes, raw_content=True)
+        self.assertEqual(orjson.loads(orjson.dumps(raw_dict)), message_dict)
+
+        # Real message dicts are stored without their field names.
+        hamlet = self.example_user("hamlet")
+        message_id = self.send_stream_message(hamlet, "Denmark", "**hello**")
+        result = self.api_post(
+            hamlet, f"/api/v1/messages/{message_id}/reactions", {"emoji_name": "smile"}
+        )
+        self.assert_json_success(result)
+        result = self.api_patch(hamlet, f"/api/v1/messages/{message_id}", {"content": "**edited**"})
+        self.assert_json_success(result)
+        message_dict = MessageDict.ids_to_dict([message_id])[0]
+        self.assertIn("edit_history", message_dict)
+        self.assert_length(message_dict["reactions"], 1)
+        message_bytes = stringify_message_dict(message_dict)
+        self.assertTrue(message_bytes.startswith(f"[{message_id},{hamlet.id},".encode()))
+        self.assertNotIn(b"sender_realm_id", message_bytes)
+        self.assertEqual(extract_message_dict(message_bytes), message_dict)
+
     def test_message_for_ids_for_restricted_user_access(self) -> None:
         self.set_up_db_for_testing_user_access()
         hamlet = self.example_user("hamlet")
@@ -702,6 +793,86 @@ class TestMessageForIdsDisplayRecipientFetching(ZulipTestCase):
         self.assertEqual(messages[3][TOPIC_NAME], "test")
 
 
+class DisplayRecipientCacheTest(ZulipTestCase):
+    def test_invalidation_across_processes(self) -> None:
+        hamlet = self.example_user("hamlet")
+        cordelia = self.example_user("cordelia")
+        stream = get_stream("Denmark", hamlet.realm)
+        verona = get_stream("Verona", hamlet.realm)
+        assert stream.recipient_id is not None
+        assert verona.recipient_id is not None
+        assert cordelia.recipient_id is not None
+        recipient_tuples = {
+            (stream.recipient_id, Recipient.STREAM, stream.id),
+            (verona.recipient_id, Recipient.STREAM, verona.id),
+            (cordelia.recipient_id, Recipient.PERSONAL, cordelia.id),
+        }
+
+        # On a running server, these families have long had versions
+        # for processes to start from.
+        for family in ["display_recipient_dict", "single_user_display_recipient"]:
+            cache_set(local_cache_version_cache_key(family), 0, pickled_tupled=False)
+
+        # Another process, with its own LocalCache.
+        other_process_cache = LocalCache()
+
+        def fetch_in_other_process() -> dict[int, DisplayRecipientT]:
+            with mock.patch("zerver.lib.cache.local_cache", other_process_cache):
+                return bulk_fetch_display_recipients(recipient_tuples)
+
+        def cordelia_full_name(display_recipients: dict[int, DisplayRecipientT]) -> str:
+            display_recipient = display_recipients[cordelia.recipient_id]
+            assert not isinstance(display_recipient, str)
+            return display_recipient[0]["full_name"]
+
+        display_recipients = fetch_in_other_process()
+        self.assertEqual(display_recipients[stream.recipient_id], "Denmark")
+        self.assertEqual(cordelia_full_name(display_recipients), "Cordelia, Lear's daughter")
+
+        # Until the process next checks for invalidations, later
+        # fetches don't touch memcached or the database.
+        with (
+            mock.patch("zerver.lib.cache.LOCAL_CACHE_CHECK_INTERVAL", 3600),
+            mock.patch("zerver.lib.cache.get_cache_backend", wraps=get_cache_backend) as backend,
+            self.assert_database_query_count(0, keep_cache_warm=True),
+        ):
+            other_process_cache.next_check = 0
+            fetch_in_other_process()
+            backend.reset_mock()
+            self.assertEqual(fetch_in_other_process(), display_recipients)
+        backend.assert_not_called()
+
+        # Renaming the stream only evicts that stream, once the other
+        # process next checks for invalidations.
+        do_rename_stream(stream, "Denmark2", hamlet)
+        self.assertEqual(fetch_in_other_process()[stream.recipient_id], "Denmark")
+        other_process_cache.next_check = 0
+        with self.assert_database_query_count(0, keep_cache_warm=True):
+            display_recipients = fetch_in_other_process()
+        self.assertEqual(display_recipients[stream.recipient_id], "Denmark2")
+        self.assertEqual(cordelia_full_name(display_recipients), "Cordelia, Lear's daughter")
+        self.assertIn(
+            cache.KEY_PREFIX + cache.display_recipient_cache_key(verona.recipient_id),
+            other_process_cache.entries,
+        )
+
+        do_change_full_name(cordelia, "Cordelia Lear", acting_user=None)
+        other_process_cache.next_check = 0
+        self.assertEqual(cordelia_full_name(fetch_in_other_process()), "Cordelia Lear")
+
+        # A process which has fallen too far behind drops everything.
+        version_key = cache.KEY_PREFIX + local_cache_version_cache_key("display_recipient_dict")
+        version = other_process_cache.versions[version_key]
+        assert version is not None
+        other_process_cache.versions[version_key] = version - 200
+        other_process_cache.next_check = 0
+        other_process_cache.check_versions()
+        self.assertNotIn(
+            cache.KEY_PREFIX + cache.display_recipient_cache_key(stream.recipient_id),
+            other_process_cache.entries,
+        )
+
+
 class SewMessageAndReactionTest(ZulipTestCase):
     def test_sew_messages_and_reaction(self) -> None:
         sender = self.example_user("othello")
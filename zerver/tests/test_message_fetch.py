@@ -14,13 +14,16 @@ from typing_extensions import override
 
 from analytics.lib.counts import COUNT_STATS
 from analytics.models import RealmCount
+from zerver.actions.message_delete import do_delete_messages
 from zerver.actions.message_edit import build_message_edit_request, do_update_message
+from zerver.actions.message_flags import do_update_message_flags
 from zerver.actions.reactions import check_add_reaction
 from zerver.actions.realm_settings import do_set_realm_property
 from zerver.actions.uploads import do_claim_attachments
 from zerver.actions.user_settings import do_change_user_setting
 from zerver.actions.users import do_deactivate_user
 from zerver.lib.avatar import avatar_url
+from zerver.lib.cache import cache_get, unread_watermark_cache_key
 from zerver.lib.display_recipient import get_display_recipient
 from zerver.lib.exceptions import JsonableError
 from zerver.lib.markdown import render_message_markdown
@@ -36,24 +39,32 @@ from zerver.lib.narrow import (
     BadNarrowOperatorError,
     NarrowBuilder,
     NarrowParameter,
+    build_narrow_conditions,
+    build_narrow_query,
+    can_cache_narrow_conditions,
     exclude_muting_conditions,
     find_first_unread_anchor,
+    get_channel_narrow_recipient_id,
+    get_narrow_query,
     is_spectator_compatible,
+    narrow_conditions_cache,
     ok_to_include_history,
     post_process_limited_query,
 )
 from zerver.lib.narrow_helpers import NeverNegatedNarrowTerm
-from zerver.lib.narrow_predicate import build_narrow_predicate
+from zerver.lib.narrow_predicate import build_narrow_predicate, get_narrow_predicate
+from zerver.lib.retention import move_messages_to_archive
 from zerver.lib.sqlalchemy_utils import get_sqlalchemy_connection
 from zerver.lib.streams import StreamDict, create_streams_if_needed, get_public_streams_queryset
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import HostRequestMock, get_user_messages, queries_captured
 from zerver.lib.topic import MATCH_TOPIC, RESOLVED_TOPIC_PREFIX, TOPIC_NAME, messages_for_topic
 from zerver.lib.types import UserDisplayRecipient
+from zerver.lib.unread_watermarks import get_unread_watermark
 from zerver.lib.upload import create_attachment
 from zerver.lib.url_encoding import message_link_url
 from zerver.lib.user_groups import get_recursive_membership_groups
-from zerver.lib.user_topics import set_topic_visibility_policy
+from zerver.lib.user_topics import exclude_stream_and_topic_mutes, set_topic_visibility_policy
 from zerver.models import (
     Attachment,
     Message,
@@ -1041,6 +1052,39 @@ class NarrowLibraryTest(ZulipTestCase):
             )
         )
 
+    def test_narrow_predicate_combined_terms(self) -> None:
+        narrow_predicate = build_narrow_predicate(
+            [
+                NeverNegatedNarrowTerm(operator="stream", operand="Devel"),
+                NeverNegatedNarrowTerm(operator="topic", operand="Bark"),
+                NeverNegatedNarrowTerm(operator="is", operand="unread"),
+            ]
+        )
+        message = {"type": "stream", "display_recipient": "devel", "subject": "bark"}
+        self.assertTrue(narrow_predicate(message=message, flags=[]))
+        self.assertFalse(narrow_predicate(message=message, flags=["read"]))
+        self.assertFalse(narrow_predicate(message={**message, "subject": "meow"}, flags=[]))
+
+        # Every message matches the empty narrow, and "is" operands
+        # that only make sense for fetching messages.
+        for narrow in [[], [NeverNegatedNarrowTerm(operator="is", operand="home")]]:
+            narrow_predicate = build_narrow_predicate(narrow)
+            self.assertTrue(narrow_predicate(message={"type": "private"}, flags=[]))
+
+    def test_get_narrow_predicate(self) -> None:
+        narrow_predicate = get_narrow_predicate([["channel", "devel"], ["is", "mentioned"]])
+        self.assertIs(
+            get_narrow_predicate((("channel", "devel"), ("is", "mentioned"))), narrow_predicate
+        )
+        self.assertIsNot(get_narrow_predicate([["channel", "devel"]]), narrow_predicate)
+
+        message = {"type": "stream", "display_recipient": "devel"}
+        self.assertTrue(narrow_predicate(message=message, flags=["mentioned"]))
+        self.assertFalse(narrow_predicate(message=message, flags=[]))
+
+        with self.assertRaises(JsonableError):
+            get_narrow_predicate([["search", "magic"]])
+
     def test_build_narrow_predicate_invalid(self) -> None:
         with self.assertRaises(JsonableError):
             build_narrow_predicate(
@@ -2357,6 +2401,89 @@ class GetOldMessagesTest(ZulipTestCase):
         # they are the most recent.
         self.verify_web_public_query_result_success(result, 5)
 
+    def test_web_public_narrow_results_cache(self) -> None:
+        self.setup_web_public_test(num_web_public_message=3)
+        iago = self.example_user("iago")
+        channel = get_stream("web-public-channel", iago.realm)
+        get_params = {
+            "anchor": "newest",
+            "num_before": 10,
+            "num_after": 0,
+            "narrow": orjson.dumps(
+                [
+                    dict(operator="channel", operand=channel.id),
+                    dict(operator="topic", operand="test"),
+                ]
+            ).decode(),
+        }
+
+        def get_web_public_message_ids() -> list[int]:
+            result = self.client_get("/json/messages", dict(get_params))
+            return [message["id"] for message in self.assert_json_success(result)["messages"]]
+
+        with mock.patch("zerver.lib.narrow.build_narrow_query", wraps=build_narrow_query) as build:
+            message_ids = get_web_public_message_ids()
+            self.assert_length(message_ids, 3)
+            self.assertEqual(get_web_public_message_ids(), message_ids)
+            self.assertEqual(build.call_count, 1)
+
+            # Sending a message invalidates the cache.
+            message_ids.append(self.send_stream_message(iago, channel.name, "new message"))
+            self.assertEqual(get_web_public_message_ids(), message_ids)
+            self.assertEqual(build.call_count, 2)
+
+            # As do edits and moves.
+            self.login_user(iago)
+            with self.captureOnCommitCallbacks(execute=True):
+                result = self.client_patch(
+                    f"/json/messages/{message_ids[0]}",
+                    {"topic": "moved", "propagate_mode": "change_one"},
+                )
+            self.assert_json_success(result)
+            self.logout()
+            message_ids.pop(0)
+            self.assertEqual(get_web_public_message_ids(), message_ids)
+            self.assertEqual(build.call_count, 3)
+
+            # And deletions.
+            with self.captureOnCommitCallbacks(execute=True):
+                do_delete_messages(
+                    iago.realm, [Message.objects.get(id=message_ids[-1])], acting_user=None
+                )
+            message_ids.pop()
+            self.assertEqual(get_web_public_message_ids(), message_ids)
+            self.assertEqual(build.call_count, 4)
+
+            # And archiving, such as by the retention policy.
+            with self.captureOnCommitCallbacks(execute=True):
+                move_messages_to_archive([message_ids[-1]])
+            message_ids.pop()
+            self.assertEqual(get_web_public_message_ids(), message_ids)
+            self.assertEqual(build.call_count, 5)
+
+            # And changes to channels.
+            with self.captureOnCommitCallbacks(execute=True):
+                channel.name = "renamed web-public channel"
+                channel.save(update_fields=["name"])
+            self.assertEqual(get_web_public_message_ids(), message_ids)
+            self.assertEqual(build.call_count, 6)
+
+            # Messages and channels which aren't web-public don't.
+            verona = get_stream("Verona", iago.realm)
+            message_id = self.send_stream_message(iago, verona.name, "private message")
+            self.login_user(iago)
+            with self.captureOnCommitCallbacks(execute=True):
+                result = self.client_patch(f"/json/messages/{message_id}", {"content": "edited"})
+            self.assert_json_success(result)
+            self.logout()
+            with self.captureOnCommitCallbacks(execute=True):
+                verona.name = "renamed Verona"
+                verona.save(update_fields=["name"])
+            with self.captureOnCommitCallbacks(execute=True):
+                move_messages_to_archive([message_id])
+            self.assertEqual(get_web_public_message_ids(), message_ids)
+            self.assertEqual(build.call_count, 6)
+
     def test_client_avatar(self) -> None:
         """
         The client_gravatar flag determines whether we send avatar_url.
@@ -3358,6 +3485,38 @@ class GetOldMessagesTest(ZulipTestCase):
             '<p>James\' <span class="highlight">burger</span></p>',
         )
 
+        # Matches are highlighted in one query over just the returned
+        # messages, which clients can skip entirely.
+        narrow = [dict(operator="search", operand="lunch")]
+        with queries_captured() as queries:
+            result = self.get_and_check_messages(
+                dict(
+                    narrow=orjson.dumps(narrow).decode(),
+                    anchor=next_message_id,
+                    num_after=1,
+                    num_before=0,
+                )
+            )
+        self.assert_length(result["messages"], 1)
+        self.assertIn("match_content", result["messages"][0])
+        highlight_queries = [query.sql for query in queries if "ts_headline" in query.sql]
+        self.assert_length(highlight_queries, 1)
+        self.assertIn(f"id IN ({result['messages'][0]['id']})", highlight_queries[0])
+
+        with queries_captured() as queries:
+            result = self.get_and_check_messages(
+                dict(
+                    narrow=orjson.dumps(narrow).decode(),
+                    anchor=next_message_id,
+                    num_after=1,
+                    num_before=0,
+                    include_search_highlights="false",
+                )
+            )
+        self.assert_length(result["messages"], 1)
+        self.assertNotIn("match_content", result["messages"][0])
+        self.assertFalse(any("ts_headline" in query.sql for query in queries))
+
     @override_settings(USING_PGROONGA=False)
     def test_get_visible_messages_with_search(self) -> None:
         self.login("hamlet")
@@ -4358,6 +4517,122 @@ class GetOldMessagesTest(ZulipTestCase):
             {unsub_message_id, muted_message_id, first_message_id, extra_message_id},
         )
 
+    def test_unread_watermarks(self) -> None:
+        hamlet = self.example_user("hamlet")
+        cordelia = self.example_user("cordelia")
+        realm = hamlet.realm
+
+        england = self.make_stream("England")
+        self.subscribe(hamlet, "England")
+        self.subscribe(cordelia, "England")
+        assert england.recipient_id is not None
+        # An older unread message elsewhere, which the channel narrow skips.
+        self.send_personal_message(cordelia, hamlet)
+        first_message_id = self.send_stream_message(cordelia, "England", topic_name="a")
+        second_message_id = self.send_stream_message(cordelia, "England", topic_name="b")
+
+        def get_anchor(narrow: list[NarrowParameter]) -> int:
+            with (
+                self.captureOnCommitCallbacks(execute=True),
+                get_sqlalchemy_connection() as sa_conn,
+            ):
+                return find_first_unread_anchor(sa_conn, hamlet, narrow)
+
+        def get_cached_watermark(recipient_id: int) -> int | None:
+            cached = cache_get(unread_watermark_cache_key(hamlet.id, recipient_id))
+            return None if cached is None else cached[0][0]
+
+        # Without a watermark, the anchor query itself finds the first
+        # unread message in the channel, which becomes the watermark.
+        channel_narrow = [NarrowParameter(operator="channel", operand="England")]
+        with queries_captured() as queries:
+            self.assertEqual(get_anchor(channel_narrow), first_message_id)
+        self.assert_length([query for query in queries if "zerver_usermessage" in query.sql], 1)
+        self.assertEqual(get_cached_watermark(england.recipient_id), first_message_id)
+
+        with queries_captured() as queries:
+            self.assertEqual(get_anchor(channel_narrow), first_message_id)
+        self.assertIn(f"message_id >= {first_message_id}", queries[-1].sql)
+
+        # Messages in muted topics are skipped, but still hold the
+        # watermark back, since other narrows may include them.
+        set_topic_visibility_policy(hamlet, [["England", "a"]], UserTopic.VisibilityPolicy.MUTED)
+        self.assertEqual(get_anchor(channel_narrow), second_message_id)
+        self.assertEqual(get_cached_watermark(england.recipient_id), first_message_id)
+
+        # Narrows within the channel move the watermark forward too.
+        do_update_message_flags(hamlet, "add", "read", [first_message_id])
+        topic_narrow = [*channel_narrow, NarrowParameter(operator="topic", operand="b")]
+        self.assertEqual(get_anchor(topic_narrow), second_message_id)
+        self.assertEqual(get_cached_watermark(england.recipient_id), second_message_id)
+
+        # With everything read, the watermark is past the last message.
+        do_update_message_flags(hamlet, "add", "read", [second_message_id])
+        self.assertEqual(get_anchor(channel_narrow), LARGER_THAN_MAX_MESSAGE_ID)
+        self.assertEqual(get_cached_watermark(england.recipient_id), LARGER_THAN_MAX_MESSAGE_ID)
+
+        # Sending a message lowers the watermarks for its recipient.
+        with self.captureOnCommitCallbacks(execute=True):
+            third_message_id = self.send_stream_message(cordelia, "England", topic_name="b")
+        self.assertLessEqual(
+            get_unread_watermark(hamlet.id, england.recipient_id), third_message_id
+        )
+        self.assertEqual(get_anchor(channel_narrow), third_message_id)
+        self.assertEqual(get_cached_watermark(england.recipient_id), third_message_id)
+        do_update_message_flags(hamlet, "add", "read", [third_message_id])
+
+        # Moving unread messages into the channel lowers the watermarks
+        # of the users who have them.
+        self.subscribe(hamlet, "Denmark")
+        moved_message_id = self.send_stream_message(cordelia, "Denmark")
+        self.assertEqual(get_anchor(channel_narrow), LARGER_THAN_MAX_MESSAGE_ID)
+        self.login("iago")
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.client_patch(
+                f"/json/messages/{moved_message_id}",
+                {"stream_id": england.id, "propagate_mode": "change_one"},
+            )
+        self.assert_json_success(result)
+        self.assertLessEqual(
+            get_unread_watermark(hamlet.id, england.recipient_id), moved_message_id
+        )
+        self.assertEqual(get_anchor(channel_narrow), moved_message_id)
+
+        # So does marking messages as unread.
+        set_topic_visibility_policy(hamlet, [["England", "a"]], UserTopic.VisibilityPolicy.INHERIT)
+        with self.captureOnCommitCallbacks(execute=True):
+            do_update_message_flags(hamlet, "remove", "read", [first_message_id])
+        self.assertLessEqual(
+            get_unread_watermark(hamlet.id, england.recipient_id), first_message_id
+        )
+        self.assertEqual(get_anchor(channel_narrow), first_message_id)
+
+        # A channel with no messages at all.
+        empty_channel = self.make_stream("Empty")
+        self.subscribe(hamlet, "Empty")
+        assert empty_channel.recipient_id is not None
+        self.assertEqual(
+            get_anchor([NarrowParameter(operator="channel", operand=empty_channel.id)]),
+            LARGER_THAN_MAX_MESSAGE_ID,
+        )
+        self.assertEqual(
+            get_cached_watermark(empty_channel.recipient_id), LARGER_THAN_MAX_MESSAGE_ID
+        )
+
+        # Narrows that aren't limited to one channel don't use watermarks.
+        self.assertIsNone(get_channel_narrow_recipient_id(realm, None))
+        self.assertIsNone(
+            get_channel_narrow_recipient_id(
+                realm, [NarrowParameter(operator="channel", operand="England", negated=True)]
+            )
+        )
+        self.assertIsNone(
+            get_channel_narrow_recipient_id(
+                realm, [NarrowParameter(operator="channel", operand="nonexistent")]
+            )
+        )
+        self.assertIsNone(get_channel_narrow_recipient_id(get_realm("zephyr"), channel_narrow))
+
     def test_parse_anchor_value(self) -> None:
         hamlet = self.example_user("hamlet")
         cordelia = self.example_user("cordelia")
@@ -5116,12 +5391,8 @@ WHERE zerver_subscription.user_profile_id = {hamlet_id} AND zerver_subscription.
         query_ids = self.get_query_ids()
 
         sql_template = """\
-SELECT anon_1.message_id, anon_1.flags, anon_1.escaped_topic_name, anon_1.rendered_content, anon_1.content_matches, anon_1.topic_matches \n\
-FROM (SELECT message_id, flags, escape_html(subject) AS escaped_topic_name, rendered_content, array((SELECT ARRAY[sum(length(anon_3) - 11) OVER (ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) + 11, strpos(anon_3, '</ts-match>') - 1] AS anon_2 \n\
-FROM unnest(string_to_array(ts_headline('zulip.english_us_search', rendered_content, plainto_tsquery('zulip.english_us_search', 'jumping'), 'HighlightAll = TRUE, StartSel = <ts-match>, StopSel = </ts-match>'), '<ts-match>')) AS anon_3\n\
- LIMIT ALL OFFSET 1)) AS content_matches, array((SELECT ARRAY[sum(length(anon_5) - 11) OVER (ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) + 11, strpos(anon_5, '</ts-match>') - 1] AS anon_4 \n\
-FROM unnest(string_to_array(ts_headline('zulip.english_us_search', escape_html(subject), plainto_tsquery('zulip.english_us_search', 'jumping'), 'HighlightAll = TRUE, StartSel = <ts-match>, StopSel = </ts-match>'), '<ts-match>')) AS anon_5\n\
- LIMIT ALL OFFSET 1)) AS topic_matches \n\
+SELECT anon_1.message_id, anon_1.flags \n\
+FROM (SELECT message_id, flags \n\
 FROM zerver_usermessage JOIN zerver_message ON zerver_usermessage.message_id = zerver_message.id JOIN zerver_recipient ON zerver_message.recipient_id = zerver_recipient.id \n\
 WHERE user_profile_id = {hamlet_id} AND (zerver_recipient.type != 2 OR (EXISTS (SELECT  \n\
 FROM zerver_stream \n\
@@ -5136,12 +5407,8 @@ WHERE zerver_subscription.user_profile_id = {hamlet_id} AND zerver_subscription.
         )
 
         sql_template = """\
-SELECT anon_1.message_id, anon_1.escaped_topic_name, anon_1.rendered_content, anon_1.content_matches, anon_1.topic_matches \n\
-FROM (SELECT id AS message_id, escape_html(subject) AS escaped_topic_name, rendered_content, array((SELECT ARRAY[sum(length(anon_3) - 11) OVER (ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) + 11, strpos(anon_3, '</ts-match>') - 1] AS anon_2 \n\
-FROM unnest(string_to_array(ts_headline('zulip.english_us_search', rendered_content, plainto_tsquery('zulip.english_us_search', 'jumping'), 'HighlightAll = TRUE, StartSel = <ts-match>, StopSel = </ts-match>'), '<ts-match>')) AS anon_3\n\
- LIMIT ALL OFFSET 1)) AS content_matches, array((SELECT ARRAY[sum(length(anon_5) - 11) OVER (ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) + 11, strpos(anon_5, '</ts-match>') - 1] AS anon_4 \n\
-FROM unnest(string_to_array(ts_headline('zulip.english_us_search', escape_html(subject), plainto_tsquery('zulip.english_us_search', 'jumping'), 'HighlightAll = TRUE, StartSel = <ts-match>, StopSel = </ts-match>'), '<ts-match>')) AS anon_5\n\
- LIMIT ALL OFFSET 1)) AS topic_matches \n\
+SELECT anon_1.message_id \n\
+FROM (SELECT id AS message_id \n\
 FROM zerver_message \n\
 WHERE realm_id = 2 AND recipient_id = {scotland_recipient} AND (search_tsvector @@ plainto_tsquery('zulip.english_us_search', 'jumping')) ORDER BY zerver_message.id ASC \n\
  LIMIT 10) AS anon_1 ORDER BY message_id ASC\
@@ -5158,12 +5425,8 @@ WHERE realm_id = 2 AND recipient_id = {scotland_recipient} AND (search_tsvector
         )
 
         sql_template = """\
-SELECT anon_1.message_id, anon_1.flags, anon_1.escaped_topic_name, anon_1.rendered_content, anon_1.content_matches, anon_1.topic_matches \n\
-FROM (SELECT message_id, flags, escape_html(subject) AS escaped_topic_name, rendered_content, array((SELECT ARRAY[sum(length(anon_3) - 11) OVER (ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) + 11, strpos(anon_3, '</ts-match>') - 1] AS anon_2 \n\
-FROM unnest(string_to_array(ts_headline('zulip.english_us_search', rendered_content, plainto_tsquery('zulip.english_us_search', '"jumping" quickly'), 'HighlightAll = TRUE, StartSel = <ts-match>, StopSel = </ts-match>'), '<ts-match>')) AS anon_3\n\
- LIMIT ALL OFFSET 1)) AS content_matches, array((SELECT ARRAY[sum(length(anon_5) - 11) OVER (ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) + 11, strpos(anon_5, '</ts-match>') - 1] AS anon_4 \n\
-FROM unnest(string_to_array(ts_headline('zulip.english_us_search', escape_html(subject), plainto_tsquery('zulip.english_us_search', '"jumping" quickly'), 'HighlightAll = TRUE, StartSel = <ts-match>, StopSel = </ts-match>'), '<ts-match>')) AS anon_5\n\
- LIMIT ALL OFFSET 1)) AS topic_matches \n\
+SELECT anon_1.message_id, anon_1.flags \n\
+FROM (SELECT message_id, flags \n\
 FROM zerver_usermessage JOIN zerver_message ON zerver_usermessage.message_id = zerver_message.id JOIN zerver_recipient ON zerver_message.recipient_id = zerver_recipient.id \n\
 WHERE user_profile_id = {hamlet_id} AND (zerver_recipient.type != 2 OR (EXISTS (SELECT  \n\
 FROM zerver_stream \n\
@@ -5259,6 +5522,236 @@ WHERE zerver_subscription.user_profile_id = {hamlet_id} AND zerver_subscription.
         # Incoming DMs show the recipient_id that outgoing DMs would.
         self.assertEqual(result["messages"][1]["recipient_id"], othello.recipient_id)
 
+    @mock.patch.dict("zerver.lib.narrow.narrow_conditions_cache", clear=True)
+    def test_get_messages_with_cursor(self) -> None:
+        hamlet = self.example_user("hamlet")
+        self.login_user(hamlet)
+        self.subscribe(hamlet, "Scotland")
+        message_ids = [
+            self.send_stream_message(hamlet, "Scotland", f"message {i}", topic_name="cursors")
+            for i in range(7)
+        ]
+        narrow = orjson.dumps([dict(operator="topic", operand="cursors")]).decode()
+
+        result = self.get_and_check_messages(
+            dict(anchor=message_ids[3], num_before=2, num_after=0, narrow=narrow)
+        )
+        self.assertNotIn("older_cursor", result)
+
+        result = self.get_and_check_messages(
+            dict(
+                anchor=message_ids[3],
+                num_before=2,
+                num_after=1,
+                narrow=narrow,
+                include_cursors="true",
+            )
+        )
+        self.assertEqual([m["id"] for m in result["messages"]], message_ids[1:5])
+        older_cursor = result["older_cursor"]
+        newer_cursor = result["newer_cursor"]
+
+        def get_with_cursor(cursor: str, num_before: int, num_after: int) -> dict[str, Any]:
+            result = self.client_get(
+                "/json/messages",
+                dict(cursor=cursor, num_before=num_before, num_after=num_after),
+            )
+            return self.assert_json_success(result)
+
+        with mock.patch(
+            "zerver.lib.narrow.build_narrow_conditions", wraps=build_narrow_conditions
+        ) as build:
+            result = get_with_cursor(older_cursor, 5, 0)
+            self.assertEqual([m["id"] for m in result["messages"]], message_ids[:1])
+            self.assertTrue(result["found_oldest"])
+            self.assertNotIn("older_cursor", result)
+
+            result = get_with_cursor(newer_cursor, 0, 1)
+            self.assertEqual([m["id"] for m in result["messages"]], message_ids[5:6])
+            self.assertFalse(result["found_newest"])
+
+            result = get_with_cursor(result["newer_cursor"], 0, 5)
+            self.assertEqual([m["id"] for m in result["messages"]], message_ids[6:])
+            self.assertTrue(result["found_newest"])
+            self.assertNotIn("newer_cursor", result)
+        # The narrow's conditions were reused from the first batch.
+        build.assert_not_called()
+
+        # A cursor only goes in one direction.
+        result = self.client_get(
+            "/json/messages", dict(cursor=older_cursor, num_before=1, num_after=1)
+        )
+        self.assert_json_error(result, "This cursor can only fetch messages in one direction")
+
+        result = self.client_get(
+            "/json/messages", dict(cursor=older_cursor, anchor="newest", num_before=1)
+        )
+        self.assert_json_error(
+            result,
+            "Unsupported parameter combination: cursor, anchor, use_first_unread_anchor, narrow, message_ids",
+        )
+
+        result = self.client_get("/json/messages", dict(cursor="invalid", num_before=1))
+        self.assert_json_error(result, "Invalid cursor")
+
+        # Cursors can't be used by other users.
+        self.login("cordelia")
+        result = self.client_get("/json/messages", dict(cursor=older_cursor, num_before=1))
+        self.assert_json_error(result, "Invalid cursor")
+
+        # Or after they expire.
+        self.login_user(hamlet)
+        with mock.patch("zerver.lib.narrow.NARROW_CURSOR_MAX_AGE", -1):
+            result = self.client_get("/json/messages", dict(cursor=older_cursor, num_before=1))
+        self.assert_json_error(result, "Invalid cursor")
+
+    @mock.patch.dict("zerver.lib.narrow.narrow_conditions_cache", clear=True)
+    def test_cursor_access_rechecked(self) -> None:
+        iago = self.example_user("iago")
+        hamlet = self.example_user("hamlet")
+        self.make_stream("secret", invite_only=True, history_public_to_subscribers=True)
+        self.subscribe(iago, "secret")
+        message_ids = [self.send_stream_message(iago, "secret", f"old {i}") for i in range(3)]
+        self.subscribe(hamlet, "secret")
+
+        self.login_user(hamlet)
+        narrow = orjson.dumps([dict(operator="channel", operand="secret")]).decode()
+        result = self.get_and_check_messages(
+            dict(anchor="newest", num_before=1, num_after=0, narrow=narrow, include_cursors="true")
+        )
+        self.assertEqual([m["id"] for m in result["messages"]], message_ids[2:])
+        older_cursor = result["older_cursor"]
+
+        # Once hamlet loses access to the channel, the cursor no
+        # longer returns its history.
+        self.unsubscribe(hamlet, "secret")
+        result = self.client_get("/json/messages", dict(cursor=older_cursor, num_before=5))
+        self.assertEqual(self.assert_json_success(result)["messages"], [])
+
+    def test_narrow_conditions_cache(self) -> None:
+        hamlet = self.example_user("hamlet")
+        realm = hamlet.realm
+        narrow = [NarrowParameter(operator="channel", operand="Verona")]
+        with (
+            mock.patch.dict("zerver.lib.narrow.narrow_conditions_cache", clear=True),
+            mock.patch("zerver.lib.narrow.NARROW_CONDITIONS_CACHE_SIZE", 1),
+            mock.patch(
+                "zerver.lib.narrow.build_narrow_conditions", wraps=build_narrow_conditions
+            ) as build,
+        ):
+            narrow_query = get_narrow_query(narrow, hamlet, realm, False)
+            self.assertEqual(
+                str(get_narrow_query(narrow, hamlet, realm, False).query), str(narrow_query.query)
+            )
+            self.assertEqual(build.call_count, 1)
+
+            # Entries expire.
+            with mock.patch("zerver.lib.narrow.NARROW_CONDITIONS_CACHE_SECONDS", 0):
+                get_narrow_query(narrow, hamlet, realm, False)
+            self.assertEqual(build.call_count, 2)
+
+            # And are evicted when the cache is full.
+            get_narrow_query(None, hamlet, realm, False)
+            self.assertEqual(len(narrow_conditions_cache), 1)
+            get_narrow_query(narrow, hamlet, realm, False)
+            self.assertEqual(build.call_count, 4)
+
+            # Conditions listing the public channels aren't cached.
+            public_narrow = [NarrowParameter(operator="channels", operand="public")]
+            get_narrow_query(public_narrow, hamlet, realm, False)
+            get_narrow_query(public_narrow, hamlet, realm, False)
+            self.assertEqual(build.call_count, 6)
+
+            # Nor are those listing muted channels and topics.
+            home_narrow = [NarrowParameter(operator="in", operand="home")]
+            get_narrow_query(home_narrow, hamlet, realm, False)
+            get_narrow_query(home_narrow, hamlet, realm, False)
+            self.assertEqual(build.call_count, 8)
+
+            # Nor, with a search index, those listing its matches.
+            search_narrow = [NarrowParameter(operator="search", operand="lunch")]
+            get_narrow_query(search_narrow, hamlet, realm, False)
+            get_narrow_query(search_narrow, hamlet, realm, False)
+            self.assertEqual(build.call_count, 9)
+            with override_settings(SEARCH_INDEX_PATH="/var/lib/zulip/search-index"):
+                self.assertFalse(can_cache_narrow_conditions(search_narrow))
+
+    def test_get_messages_for_narrows(self) -> None:
+        hamlet = self.example_user("hamlet")
+        cordelia = self.example_user("cordelia")
+        self.login_user(hamlet)
+        muted_id = self.send_stream_message(cordelia, "Verona", "lunch plans", topic_name="lunch")
+        mention_id = self.send_stream_message(cordelia, "Verona", "@**King Hamlet** lunch?")
+        self.send_personal_message(cordelia, hamlet, "hi")
+        set_topic_visibility_policy(hamlet, [["Verona", "lunch"]], UserTopic.VisibilityPolicy.MUTED)
+
+        narrows: list[dict[str, Any]] = [
+            dict(narrow=[dict(operator="in", operand="home")], anchor="newest", num_before=5),
+            dict(narrow=[dict(operator="is", operand="mentioned")], anchor="newest", num_before=5),
+            dict(narrow=[dict(operator="is", operand="dm")], anchor="newest", num_before=5),
+            dict(narrow=[dict(operator="search", operand="lunch")], anchor="newest", num_before=5),
+        ]
+        muting_narrows = [
+            narrows[0],
+            dict(narrows[0], anchor="first_unread", num_after=5),
+            dict(narrows[0], narrow=[dict(operator="is", operand="muted")]),
+        ]
+        with mock.patch(
+            "zerver.lib.narrow.exclude_stream_and_topic_mutes",
+            wraps=exclude_stream_and_topic_mutes,
+        ) as exclude_mutes:
+            result = self.client_get(
+                "/json/messages/narrows", dict(narrows=orjson.dumps(muting_narrows).decode())
+            )
+        # The muting conditions were only computed once.
+        exclude_mutes.assert_called_once()
+        results = self.assert_json_success(result)["results"]
+        self.assert_length(results, 3)
+        self.assertNotIn(muted_id, [message["id"] for message in results[0]["messages"]])
+        self.assertEqual(results[2]["messages"][-1]["id"], muted_id)
+
+        # Each result is what GET /messages would have returned.
+        result = self.client_get(
+            "/json/messages/narrows", dict(narrows=orjson.dumps(narrows).decode())
+        )
+        results = self.assert_json_success(result)["results"]
+        for narrow, narrow_result in zip(narrows, results, strict=True):
+            expected = self.get_and_check_messages(
+                dict(narrow, narrow=orjson.dumps(narrow["narrow"]).decode())
+            )
+            for key in ["messages", "anchor", "found_anchor", "found_oldest", "found_newest"]:
+                self.assertEqual(narrow_result[key], expected[key])
+        self.assertIn(mention_id, [message["id"] for message in results[1]["messages"]])
+        self.assertIn("match_content", results[3]["messages"][-1])
+        self.assertNotIn("match_content", results[1]["messages"][-1])
+
+        result = self.client_get(
+            "/json/messages/narrows",
+            dict(narrows=orjson.dumps([dict(anchor="newest")] * 11).decode()),
+        )
+        self.assert_json_error(result, "Too many narrows requested (maximum 10).")
+
+        result = self.client_get(
+            "/json/messages/narrows",
+            dict(narrows=orjson.dumps([dict(anchor="newest", num_before=3000)] * 2).decode()),
+        )
+        self.assert_json_error(result, "Too many messages requested (maximum 5000).")
+
+        result = self.client_get(
+            "/json/messages/narrows",
+            dict(
+                narrows=orjson.dumps(
+                    [dict(anchor="newest", num_before=1, num_after=1, include_anchor=False)]
+                ).decode()
+            ),
+        )
+        self.assert_json_error(result, "The anchor can only be excluded at an end of the range")
+
+        result = self.client_get(
+            "/json/messages/narrows", dict(narrows=orjson.dumps([{}]).decode())
+        )
+        self.assert_json_error(result, "Missing 'anchor' argument.")
+
 
 class MessageHasKeywordsTest(ZulipTestCase):
     """Test for keywords like has_link, has_image, has_attachment."""
@@ -4,12 +4,15 @@ from unittest import mock
 import orjson
 from django.utils.timezone import now as timezone_now
 
+from zerver.actions.message_delete import do_delete_messages
+from zerver.actions.message_edit import check_update_message
 from zerver.actions.streams import do_change_stream_permission
 from zerver.actions.user_topics import do_set_user_topic_visibility_policy
 from zerver.lib.events import ClientCapabilities, do_events_register
+from zerver.lib.stream_topic import add_messages_to_stream_topics, rebuild_stream_topics
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.user_topics import set_topic_visibility_policy, topic_has_visibility_policy
-from zerver.models import Message, UserMessage, UserTopic
+from zerver.models import Message, StreamTopic, UserMessage, UserTopic
 from zerver.models.clients import get_client
 from zerver.models.realms import get_realm
 from zerver.models.streams import get_stream
@@ -58,6 +61,7 @@ class TopicHistoryTest(ZulipTestCase):
             )
             message.set_topic_name(topic_name)
             message.save()
+            add_messages_to_stream_topics([message.id])
 
             UserMessage.objects.create(
                 user_profile=user_profile,
@@ -160,6 +164,54 @@ class TopicHistoryTest(ZulipTestCase):
         self.assertNotIn("topic1", [topic["name"] for topic in history])
         self.assertNotIn("topic2", [topic["name"] for topic in history])
 
+    def test_stream_topic_summaries(self) -> None:
+        hamlet = self.example_user("hamlet")
+        stream = self.make_stream("summaries")
+        self.subscribe(hamlet, stream.name)
+
+        def get_summaries() -> list[tuple[str, int, int]]:
+            return list(
+                StreamTopic.objects.filter(recipient_id=stream.recipient_id)
+                .order_by("-last_message_id")
+                .values_list("topic_name", "last_message_id", "message_count")
+            )
+
+        first_id = self.send_stream_message(hamlet, stream.name, topic_name="lunch")
+        lunch_id = self.send_stream_message(hamlet, stream.name, topic_name="LUNCH")
+        dinner_id = self.send_stream_message(hamlet, stream.name, topic_name="dinner")
+        self.assertEqual(get_summaries(), [("dinner", dinner_id, 1), ("LUNCH", lunch_id, 2)])
+
+        # Moving a message recomputes both topics.
+        check_update_message(
+            hamlet,
+            lunch_id,
+            topic_name="dinner",
+            propagate_mode="change_one",
+            send_notification_to_old_thread=False,
+            send_notification_to_new_thread=False,
+        )
+        self.assertEqual(get_summaries(), [("dinner", dinner_id, 2), ("lunch", first_id, 1)])
+
+        # As does deleting them.
+        do_delete_messages(hamlet.realm, [Message.objects.get(id=first_id)], acting_user=None)
+        self.assertEqual(get_summaries(), [("dinner", dinner_id, 2)])
+
+        StreamTopic.objects.filter(recipient_id=stream.recipient_id).delete()
+        rebuild_stream_topics(hamlet.realm_id, [stream.recipient_id])
+        self.assertEqual(get_summaries(), [("dinner", dinner_id, 2)])
+
+        # Resolving a topic renames it.
+        check_update_message(
+            hamlet,
+            dinner_id,
+            topic_name="✔ dinner",
+            propagate_mode="change_all",
+            send_notification_to_old_thread=False,
+            send_notification_to_new_thread=False,
+        )
+        stream_topic = StreamTopic.objects.get(recipient_id=stream.recipient_id)
+        self.assertTrue(stream_topic.is_resolved)
+
     def test_bad_stream_id(self) -> None:
         self.login("iago")
 
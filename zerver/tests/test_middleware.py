@@ -3,7 +3,9 @@ from unittest.mock import patch
 
 from bs4 import BeautifulSoup
 from django.http import HttpResponse
+from psycopg2.sql import SQL
 
+from zerver.lib.db import QUERY_FINGERPRINT_MAX_PARAMS, query_fingerprint
 from zerver.lib.realm_icon import get_realm_icon_url
 from zerver.lib.request import RequestNotes
 from zerver.lib.test_classes import ZulipTestCase
@@ -57,6 +59,42 @@ class SlowQueryTest(ZulipTestCase):
                 r"123\.456\.789\.012 GET     200 10\.\ds .* \(unknown via \?\)",
             )
 
+    def test_duplicate_queries(self) -> None:
+        self.log_data["time_started"] = time.time()
+        queries = [
+            {"time": "0.001", "fingerprint": "1"},
+            {"time": "0.001", "fingerprint": "2"},
+            {"time": "0.001", "fingerprint": "1"},
+            {"time": "0.001"},
+            {"time": "0.001"},
+        ]
+        with (
+            patch("zerver.middleware.connection") as connection_mock,
+            self.assertLogs("zulip.requests", level="INFO") as middleware_normal_logger,
+        ):
+            connection_mock.connection.queries = queries
+            write_log_line(
+                self.log_data,
+                path="/some/endpoint/",
+                method="GET",
+                remote_ip="123.456.789.012",
+                requester_for_logs="unknown",
+                client_name="?",
+            )
+        self.assertIn("/5q, 1 dup)", middleware_normal_logger.output[0])
+
+    def test_query_fingerprint(self) -> None:
+        sql = "SELECT * FROM zerver_message WHERE id = %s"
+        self.assertEqual(query_fingerprint(sql, [1]), query_fingerprint(sql, (1,)))
+        self.assertNotEqual(query_fingerprint(sql, [1]), query_fingerprint(sql, [2]))
+        self.assertEqual(query_fingerprint(sql, {"id": 1}), query_fingerprint(sql, {"id": 1}))
+        self.assertIsNotNone(query_fingerprint(sql, None))
+
+        # Queries which can't be hashed cheaply aren't fingerprinted.
+        self.assertIsNone(query_fingerprint(sql, [[1, 2]]))
+        self.assertIsNone(query_fingerprint(SQL("SELECT 1"), None))
+        self.assertIsNone(query_fingerprint(sql, list(range(QUERY_FINGERPRINT_MAX_PARAMS + 1))))
+
 
 class OpenGraphTest(ZulipTestCase):
     def check_title_and_description(
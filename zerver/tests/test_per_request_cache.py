@@ -0,0 +1,41 @@
+from zerver.lib.per_request_cache import flush_per_request_caches, per_request_cache
+from zerver.lib.test_classes import ZulipTestCase
+from zerver.models import RealmFilter
+from zerver.models.realms import get_realm
+
+calls: list[tuple[int, str]] = []
+
+
+@per_request_cache(depends_on=[RealmFilter])
+def count_realm_linkifiers(realm_id: int, prefix: str = "") -> int:
+    calls.append((realm_id, prefix))
+    return RealmFilter.objects.filter(realm_id=realm_id, pattern__startswith=prefix).count()
+
+
+class PerRequestCacheTest(ZulipTestCase):
+    def test_keys_and_dependencies(self) -> None:
+        realm = get_realm("zulip")
+        RealmFilter.objects.filter(realm=realm).delete()
+        flush_per_request_caches()
+        calls.clear()
+
+        self.assertEqual(count_realm_linkifiers(realm.id), 0)
+        self.assertEqual(count_realm_linkifiers(realm.id, prefix="ticket"), 0)
+        self.assertEqual(count_realm_linkifiers(realm.id, "ticket"), 0)
+        with self.assert_database_query_count(0):
+            self.assertEqual(count_realm_linkifiers(realm.id), 0)
+            self.assertEqual(count_realm_linkifiers(realm.id, prefix="ticket"), 0)
+        # Keyword and positional arguments are cached separately.
+        self.assertEqual(calls, [(realm.id, ""), (realm.id, "ticket"), (realm.id, "ticket")])
+
+        # Saving a RealmFilter flushes the function's results, without
+        # waiting for the next request.
+        RealmFilter.objects.create(
+            realm=realm, pattern=r"ticket(?P<id>[0-9]+)", url_template="https://x/{id}"
+        )
+        self.assertEqual(count_realm_linkifiers(realm.id), 1)
+        self.assertEqual(count_realm_linkifiers(realm.id, prefix="ticket"), 1)
+
+        # As does deleting one, even in bulk.
+        RealmFilter.objects.filter(realm=realm).delete()
+        self.assertEqual(count_realm_linkifiers(realm.id), 0)
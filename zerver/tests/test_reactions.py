@@ -109,6 +109,7 @@ class ReactionEmojiTest(ZulipTestCase):
 
         key = to_dict_cache_key_id(1)
         message = extract_message_dict(cache_get(key))
+        assert message is not None
 
         expected_reaction_data = [
             {
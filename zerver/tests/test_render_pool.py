@@ -0,0 +1,320 @@
+import multiprocessing
+import pickle
+import resource
+from unittest import mock
+
+from django.test import override_settings
+from typing_extensions import override
+
+from zerver.lib.exceptions import MarkdownRenderingError
+from zerver.lib.markdown import MessageRenderingResult, render_message_markdown
+from zerver.lib.render_pool import (
+    RENDER_POOL_STATS_INTERVAL,
+    RenderJob,
+    RenderJobError,
+    RenderJobResult,
+    RenderPool,
+    RenderWorker,
+    RenderWorkerError,
+    get_render_pool,
+    limit_cpu_time,
+    run_render_job,
+)
+from zerver.lib.test_classes import ZulipTestCase
+from zerver.lib.timeout import TimeoutExpiredError
+from zerver.models import Message
+from zerver.models.clients import get_client
+
+
+class FakeRenderWorker:
+    """Runs jobs in this process, pickling them as a real worker would."""
+
+    def __init__(self, cpu_limit: int) -> None:
+        self.killed = False
+
+    def is_ready(self) -> bool:
+        return True
+
+    def render(self, job: RenderJob, timeout: float) -> RenderJobResult:
+        return run_render_job(pickle.loads(pickle.dumps(job)))  # noqa: S301
+
+    def kill(self) -> None:
+        self.killed = True
+
+
+def get_fake_worker(pool: RenderPool) -> FakeRenderWorker:
+    worker = pool.idle_workers[0]
+    assert isinstance(worker, FakeRenderWorker)
+    return worker
+
+
+def make_rendering_result() -> MessageRenderingResult:
+    return MessageRenderingResult(
+        rendered_content="",
+        mentions_topic_wildcard=False,
+        mentions_stream_wildcard=False,
+        mentions_user_ids=set(),
+        mentions_user_group_ids=set(),
+        alert_words=set(),
+        links_for_preview=set(),
+        user_ids_with_alert_words=set(),
+        potential_attachment_path_ids=[],
+        thumbnail_spinners=set(),
+    )
+
+
+def make_job(content: str = "**bold**") -> RenderJob:
+    return RenderJob(
+        content=content,
+        linkifiers_key=0,
+        linkifiers=[],
+        email_gateway=False,
+        has_message=False,
+        realm=None,
+        db_data=None,
+        image_preview_enabled=False,
+        url_embed_preview_enabled=False,
+        url_embed_data=None,
+        rendered_tex={},
+        rendering_result=make_rendering_result(),
+    )
+
+
+class RenderPoolTest(ZulipTestCase):
+    @override
+    def setUp(self) -> None:
+        super().setUp()
+        patcher = mock.patch("zerver.lib.render_pool.render_pool", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_message(self) -> Message:
+        hamlet = self.example_user("hamlet")
+        return Message(sender=hamlet, sending_client=get_client("test"), realm=hamlet.realm)
+
+    @mock.patch("zerver.lib.render_pool.RenderWorker", FakeRenderWorker)
+    def test_get_render_pool(self) -> None:
+        self.assertIsNone(get_render_pool())
+
+        with override_settings(MARKDOWN_RENDER_POOL_SIZE=2):
+            pool = get_render_pool()
+            assert pool is not None
+            self.assertEqual(pool.size, 2)
+            # The subprocesses are started ahead of time.
+            self.assert_length(pool.idle_workers, 2)
+            self.assertIs(get_render_pool(), pool)
+
+            # A forked process gets its own pool.
+            with mock.patch("os.getpid", return_value=-1):
+                self.assertIsNot(get_render_pool(), pool)
+
+    def test_render_in_pool(self) -> None:
+        content = "Look at https://example.com, @**King Hamlet** and **this**"
+        expected = render_message_markdown(self.make_message(), content)
+
+        message = self.make_message()
+        with (
+            override_settings(MARKDOWN_RENDER_POOL_SIZE=1),
+            mock.patch("zerver.lib.render_pool.RenderWorker", FakeRenderWorker),
+        ):
+            result = render_message_markdown(message, content)
+            self.assertEqual(result, expected)
+            self.assertTrue(message.has_link)
+
+            # The subprocess, and its engine, are reused.
+            render_message_markdown(self.make_message(), "Another message")
+
+            pool = get_render_pool()
+        assert pool is not None
+        self.assert_length(pool.idle_workers, 1)
+        self.assertEqual(pool.stats.renders, 2)
+        self.assertEqual(pool.stats.busy_workers, 0)
+        self.assertEqual(pool.stats.max_queue_depth, 1)
+
+    def test_run_render_job(self) -> None:
+        result = run_render_job(make_job())
+        self.assertEqual(result.rendered_content, "<p><strong>bold</strong></p>")
+        self.assertFalse(result.has_link)
+
+        # Changed linkifiers replace the engine.
+        job = make_job("#123")
+        job.linkifiers = [
+            {
+                "pattern": r"#(?P<id>[0-9]+)",
+                "url_template": "https://trac.example.com/{id}",
+                "id": 1,
+            }
+        ]
+        job.has_message = True
+        result = run_render_job(job)
+        self.assertIn('href="https://trac.example.com/123"', result.rendered_content)
+        self.assertTrue(result.has_link)
+
+    @override_settings(MARKDOWN_RENDER_POOL_SIZE=1)
+    @mock.patch("zerver.lib.render_pool.RenderWorker", FakeRenderWorker)
+    def test_render_failures(self) -> None:
+        pool = get_render_pool()
+        assert pool is not None
+        worker = get_fake_worker(pool)
+
+        with (
+            mock.patch.object(worker, "render", side_effect=TimeoutExpiredError),
+            self.assertRaises(MarkdownRenderingError),
+            self.assertLogs(level="ERROR"),
+        ):
+            render_message_markdown(self.make_message(), "slow")
+        self.assertTrue(worker.killed)
+        self.assertEqual(pool.stats.timeouts, 1)
+
+        # A replacement subprocess was started right away.
+        self.assert_length(pool.idle_workers, 1)
+        worker = get_fake_worker(pool)
+        with (
+            mock.patch.object(worker, "render", side_effect=EOFError),
+            self.assertRaises(RenderWorkerError),
+        ):
+            pool.render(make_job(), timeout=1)
+        self.assertTrue(worker.killed)
+        self.assertEqual(pool.stats.crashes, 1)
+        self.assert_length(pool.idle_workers, 1)
+
+        # If the engine raised an exception, the subprocess is fine.
+        worker = get_fake_worker(pool)
+        with (
+            mock.patch.object(worker, "render", side_effect=RenderWorkerError("Traceback")),
+            self.assertRaises(RenderWorkerError),
+        ):
+            pool.render(make_job(), timeout=1)
+        self.assertFalse(worker.killed)
+        self.assertEqual(pool.idle_workers, [worker])
+        self.assertEqual(pool.stats.busy_workers, 0)
+
+    @override_settings(MARKDOWN_RENDER_POOL_SIZE=1)
+    @mock.patch("zerver.lib.render_pool.RenderWorker", FakeRenderWorker)
+    def test_render_unready_workers(self) -> None:
+        content = "Some **content**"
+        expected = render_message_markdown(self.make_message(), content)
+        pool = get_render_pool()
+        assert pool is not None
+        worker = get_fake_worker(pool)
+
+        # Rather than waiting for the subprocess to start up, we
+        # render in a thread.
+        with mock.patch.object(worker, "render") as render:
+            with mock.patch.object(worker, "is_ready", return_value=False):
+                self.assertEqual(render_message_markdown(self.make_message(), content), expected)
+            render.assert_not_called()
+        self.assertEqual(pool.stats.unready, 1)
+        self.assertEqual(pool.idle_workers, [worker])
+        self.assertEqual(pool.stats.busy_workers, 0)
+
+        # A subprocess which died while starting up is replaced.
+        with mock.patch.object(worker, "is_ready", side_effect=EOFError):
+            self.assertEqual(render_message_markdown(self.make_message(), content), expected)
+        self.assertTrue(worker.killed)
+        self.assertEqual(pool.stats.crashes, 1)
+        self.assertEqual(pool.stats.unready, 2)
+        self.assert_length(pool.idle_workers, 1)
+        self.assertIsNot(pool.idle_workers[0], worker)
+
+        # Both renders which found a ready subprocess used it.
+        render_message_markdown(self.make_message(), content)
+        self.assertEqual(pool.stats.renders, 2)
+
+    @mock.patch("zerver.lib.render_pool.RenderWorker", FakeRenderWorker)
+    def test_render_queue_timeout(self) -> None:
+        pool = RenderPool(size=1, cpu_limit=5)
+        pool.slots.acquire()
+        with (
+            self.assertRaises(TimeoutExpiredError),
+            self.assertLogs(level="WARNING") as m,
+        ):
+            pool.render(make_job(), timeout=0.01)
+        self.assertEqual(
+            m.output,
+            [
+                "WARNING:root:Timed out waiting for a Markdown render subprocess; queue depth 0",
+            ],
+        )
+        self.assertEqual(pool.stats.timeouts, 1)
+        self.assertEqual(pool.stats.queue_depth, 0)
+        self.assertEqual(pool.stats.max_queue_depth, 1)
+        self.assertGreater(pool.stats.queue_time, 0)
+
+    @mock.patch("zerver.lib.render_pool.RenderWorker", FakeRenderWorker)
+    def test_render_pool_stats_logging(self) -> None:
+        pool = RenderPool(size=2, cpu_limit=5)
+        with self.assertNoLogs("zulip.render_pool"):
+            pool.render(make_job(), timeout=1)
+
+        pool.stats_logged_at -= RENDER_POOL_STATS_INTERVAL
+        with self.assertLogs("zulip.render_pool", level="INFO") as m:
+            pool.render(make_job(), timeout=1)
+        self.assert_length(m.output, 1)
+        self.assertRegex(
+            m.output[0],
+            r"^INFO:zulip.render_pool:Markdown render pool: queue depth 0 \(max 1\), "
+            r"[0-9.]+s queued, 0/2 workers busy, 2 renders, 0 unready, 0 timeouts, 0 crashes$",
+        )
+        self.assertEqual(pool.stats.max_queue_depth, 0)
+
+        # It's logged again only after another interval.
+        with self.assertNoLogs("zulip.render_pool"):
+            pool.render(make_job(), timeout=1)
+
+    def test_render_worker(self) -> None:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        context = mock.Mock()
+        context.Pipe.return_value = (parent_conn, mock.Mock())
+        with mock.patch("zerver.lib.render_pool.get_context", return_value=context):
+            worker = RenderWorker(cpu_limit=5)
+        context.Process.return_value.start.assert_called_once()
+
+        # The subprocess isn't ready until it says so.
+        self.assertFalse(worker.is_ready())
+        child_conn.send("ready")
+        self.assertTrue(worker.is_ready())
+
+        job_result = RenderJobResult(
+            rendered_content="<p>hi</p>",
+            rendering_result=make_rendering_result(),
+            has_link=False,
+            has_image=False,
+        )
+        child_conn.send(job_result)
+        self.assertEqual(worker.render(make_job(), timeout=1), job_result)
+        self.assertEqual(child_conn.recv(), make_job())
+
+        child_conn.send(RenderJobError("Traceback"))
+        with self.assertRaisesRegex(RenderWorkerError, "Traceback"):
+            worker.render(make_job(), timeout=1)
+
+        with self.assertRaises(TimeoutExpiredError):
+            worker.render(make_job(), timeout=0.01)
+
+        # The subprocess died.
+        child_conn.close()
+        with self.assertRaises(OSError):
+            worker.render(make_job(), timeout=1)
+
+        worker.kill()
+        context.Process.return_value.kill.assert_called_once()
+        self.assertTrue(parent_conn.closed)
+
+    def test_limit_cpu_time(self) -> None:
+        usage = mock.Mock(ru_utime=10.2, ru_stime=1.5)
+        with (
+            mock.patch("resource.getrusage", return_value=usage),
+            mock.patch("resource.getrlimit", return_value=(100, resource.RLIM_INFINITY)),
+            mock.patch("resource.setrlimit") as setrlimit,
+        ):
+            limit_cpu_time(5)
+        setrlimit.assert_called_once_with(resource.RLIMIT_CPU, (17, resource.RLIM_INFINITY))
+
+        with (
+            mock.patch("resource.getrusage", return_value=usage),
+            mock.patch("resource.getrlimit", return_value=(10, 15)),
+            mock.patch("resource.setrlimit") as setrlimit,
+        ):
+            limit_cpu_time(5)
+        setrlimit.assert_called_once_with(resource.RLIMIT_CPU, (15, 15))
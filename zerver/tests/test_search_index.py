@@ -0,0 +1,225 @@
+import os
+import tempfile
+from typing import Any
+from unittest import mock
+
+import orjson
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from typing_extensions import override
+
+from zerver.actions.message_delete import do_delete_messages
+from zerver.lib.retention import move_messages_to_archive, restore_all_data_from_archive
+from zerver.lib.search_index import (
+    SearchIndexMatch,
+    build_fts_query,
+    escape_html,
+    mask_html,
+    match_offsets,
+    search_messages,
+    update_search_index,
+)
+from zerver.lib.test_classes import ZulipTestCase
+from zerver.models import Message
+from zerver.worker.search_index import SearchIndexWorker
+
+
+class SearchIndexTest(ZulipTestCase):
+    @override
+    def setUp(self) -> None:
+        super().setUp()
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        self.index_path = os.path.join(index_dir.name, "search.sqlite3")
+        settings_override = override_settings(SEARCH_INDEX_PATH=self.index_path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def search(self, operand: str, negated: bool = False) -> list[dict[str, Any]]:
+        narrow = [dict(operator="search", operand=operand, negated=negated)]
+        result = self.client_get(
+            "/json/messages",
+            dict(
+                narrow=orjson.dumps(narrow).decode(),
+                anchor="newest",
+                num_before=10,
+                num_after=0,
+            ),
+        )
+        return self.assert_json_success(result)["messages"]
+
+    def test_helpers(self) -> None:
+        self.assertEqual(
+            escape_html("""<a href="x">'&'"""), "&lt;a href=&quot;x&quot;&gt;&#39;&amp;&#39;"
+        )
+
+        html = '<p>Fish &amp; chips\x01 <a href="https://example.com">here</a></p>'
+        masked = mask_html(html)
+        self.assert_length(masked, len(html))
+        self.assertEqual(masked.split(), ["Fish", "chips", "here"])
+
+        self.assertEqual(match_offsets("\x01Fish\x02 and \x01chips\x02"), [(0, 4), (9, 5)])
+        self.assertEqual(match_offsets("no matches"), [])
+
+        self.assertEqual(
+            build_fts_query('lunch "after lunch" AND say"hi'),
+            '"lunch" "after lunch" "AND" "say""hi"',
+        )
+
+    def test_search(self) -> None:
+        cordelia = self.example_user("cordelia")
+        self.login_user(cordelia)
+        lunch_id = self.send_stream_message(
+            cordelia, "Verona", "discuss **lunch** after lunch", topic_name="lunch plans"
+        )
+        self.send_stream_message(cordelia, "Verona", "I am hungry!", topic_name="meetings")
+        quoted_id = self.send_stream_message(
+            cordelia, "Verona", "James' burger", topic_name="James' burger"
+        )
+
+        # Searches don't touch PostgreSQL's search columns.
+        with mock.patch("zerver.lib.narrow.NarrowBuilder._by_search_tsearch") as tsearch:
+            messages = self.search("lunch")
+        tsearch.assert_not_called()
+        self.assertEqual([message["id"] for message in messages], [lunch_id])
+        self.assertEqual(
+            messages[0]["match_content"],
+            '<p>discuss <strong><span class="highlight">lunch</span></strong>'
+            ' after <span class="highlight">lunch</span></p>',
+        )
+        self.assertEqual(messages[0]["match_subject"], '<span class="highlight">lunch</span> plans')
+
+        # Words are stemmed, and tags aren't indexed.
+        self.assert_length(self.search("lunches"), 1)
+        self.assertEqual(self.search("strong"), [])
+        self.assertEqual(self.search('"lunch discuss"'), [])
+
+        messages = self.search("burger")
+        self.assertEqual([message["id"] for message in messages], [quoted_id])
+        self.assertEqual(
+            messages[0]["match_subject"], 'James&#39; <span class="highlight">burger</span>'
+        )
+
+        # Edits are reindexed.
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.client_patch(f"/json/messages/{lunch_id}", {"content": "dinner instead"})
+        self.assert_json_success(result)
+        self.assertEqual(self.search("discuss"), [])
+        self.assert_length(self.search("dinner"), 1)
+
+        # And deleted messages are removed from the index.
+        with self.captureOnCommitCallbacks(execute=True):
+            do_delete_messages(cordelia.realm, [Message.objects.get(id=lunch_id)], acting_user=None)
+        self.assertEqual(search_messages(cordelia.realm_id, "dinner"), [])
+
+        # Other realms' messages are never returned.
+        lear_user = self.lear_user("cordelia")
+        self.assertEqual(search_messages(lear_user.realm_id, "burger"), [])
+
+    def test_search_access(self) -> None:
+        # The index has no idea who can see what, but its results are
+        # only ever used to limit the query further.
+        hamlet = self.example_user("hamlet")
+        self.make_stream("secret", invite_only=True)
+        self.subscribe(hamlet, "secret")
+        message_id = self.send_stream_message(hamlet, "secret", "classified plans")
+        self.assertEqual(
+            search_messages(hamlet.realm_id, "classified"),
+            [SearchIndexMatch(message_id, [(3, 10)], [])],
+        )
+        self.assertEqual(
+            search_messages(hamlet.realm_id, "classified", message_ids=[message_id - 1]), []
+        )
+        self.assertEqual(
+            search_messages(
+                hamlet.realm_id, "classified", message_ids=[message_id], highlight=False
+            ),
+            [SearchIndexMatch(message_id, [], [])],
+        )
+
+        self.login("cordelia")
+        self.assertEqual(self.search("classified"), [])
+
+    def test_unbuilt_index(self) -> None:
+        # Until the index is built, searches use PostgreSQL.
+        hamlet = self.example_user("hamlet")
+        self.login_user(hamlet)
+        with override_settings(SEARCH_INDEX_PATH=None):
+            message_id = self.send_stream_message(hamlet, "Denmark", "unindexed walrus")
+        self.assertIsNone(search_messages(hamlet.realm_id, "walrus"))
+        messages = self.search("walrus")
+        self.assertEqual([message["id"] for message in messages], [message_id])
+        self.assertEqual(
+            messages[0]["match_content"], '<p>unindexed <span class="highlight">walrus</span></p>'
+        )
+
+        # Likewise if the file exists, but hasn't been set up.
+        open(self.index_path, "w").close()
+        self.assertIsNone(search_messages(hamlet.realm_id, "walrus"))
+        self.assertEqual([message["id"] for message in self.search("walrus")], [message_id])
+
+    def test_truncated_results(self) -> None:
+        hamlet = self.example_user("hamlet")
+        self.login_user(hamlet)
+        message_ids = [
+            self.send_stream_message(hamlet, "Denmark", f"walrus number {i}") for i in range(3)
+        ]
+        other_id = self.send_stream_message(hamlet, "Denmark", "no tusks here")
+
+        # Only the most recent match comes from the index; PostgreSQL
+        # finds the older ones.
+        with (
+            mock.patch("zerver.lib.search_index.SEARCH_INDEX_MAX_RESULTS", 1),
+            mock.patch("zerver.lib.narrow.SEARCH_INDEX_MAX_RESULTS", 1),
+        ):
+            self.assertEqual(
+                search_messages(hamlet.realm_id, "walrus"),
+                [SearchIndexMatch(message_ids[-1], [(3, 6)], [])],
+            )
+            messages = self.search("walrus")
+            self.assertEqual([message["id"] for message in messages], sorted(message_ids))
+            for message in messages:
+                self.assertIn('<span class="highlight">walrus</span>', message["match_content"])
+
+            # A negated search excludes all of them, too.
+            result_ids = [message["id"] for message in self.search("walrus", negated=True)]
+            self.assertIn(other_id, result_ids)
+            self.assertFalse(set(message_ids) & set(result_ids))
+
+    def test_restored_messages_indexed(self) -> None:
+        hamlet = self.example_user("hamlet")
+        message_id = self.send_stream_message(hamlet, "Denmark", "archived walrus")
+        with mock.patch("zerver.lib.retention.queue_search_index_update") as queue_update:
+            move_messages_to_archive([message_id])
+            restore_all_data_from_archive()
+        queue_update.assert_called_once_with([message_id])
+
+    def test_worker_and_command(self) -> None:
+        hamlet = self.example_user("hamlet")
+        with override_settings(SEARCH_INDEX_PATH=None):
+            first_id = self.send_stream_message(hamlet, "Denmark", "unindexed walrus")
+            second_id = self.send_stream_message(hamlet, "Denmark", "another walrus")
+        update_search_index([])
+        self.assertEqual(search_messages(hamlet.realm_id, "walrus"), [])
+
+        worker = SearchIndexWorker()
+        with mock.patch(
+            "zerver.worker.search_index.update_search_index", wraps=update_search_index
+        ) as update:
+            worker.consume_batch(
+                [{"message_ids": [first_id]}, {"message_ids": [first_id, second_id]}]
+            )
+        update.assert_called_once_with({first_id, second_id})
+        self.assert_length(search_messages(hamlet.realm_id, "walrus"), 2)
+
+        with mock.patch("builtins.print") as print_mock:
+            call_command("build_search_index", "--batch-size=1000000")
+        print_mock.assert_called_once_with(f"Indexed {Message.objects.count()} messages.")
+        self.assert_length(search_messages(hamlet.realm_id, "walrus"), 2)
+
+        with (
+            override_settings(SEARCH_INDEX_PATH=None),
+            self.assertRaisesRegex(CommandError, "SEARCH_INDEX_PATH is not set"),
+        ):
+            call_command("build_search_index")
@@ -24,8 +24,7 @@ from typing_extensions import override
 from version import API_FEATURE_LEVEL, ZULIP_MERGE_BASE, ZULIP_VERSION
 from zerver.lib.exceptions import JsonableError
 from zerver.lib.message_cache import MessageDict
-from zerver.lib.narrow_helpers import narrow_dataclasses_from_tuples
-from zerver.lib.narrow_predicate import build_narrow_predicate
+from zerver.lib.narrow_predicate import get_narrow_predicate
 from zerver.lib.notification_data import UserMessageNotificationsData
 from zerver.lib.queue import queue_json_publish_rollback_unsafe, retry_event
 from zerver.lib.topic import ORIG_TOPIC, TOPIC_NAME
@@ -86,10 +85,6 @@ class ClientDescriptor:
         empty_topic_name: bool,
         simplified_presence_events: bool,
     ) -> None:
-        # TODO: We eventually want to upstream this code to the caller, but
-        # serialization concerns make it a bit difficult.
-        modern_narrow = narrow_dataclasses_from_tuples(narrow)
-
         # These objects are serialized on shutdown and restored on restart.
         # If fields are added or semantics are changed, temporary code must be
         # added to load_event_queues() to update the restored objects.
@@ -109,7 +104,9 @@ class ClientDescriptor:
         self.client_type_name = client_type_name
         self._timeout_handle: Any = None  # TODO: should be return type of ioloop.call_later
         self.narrow = narrow
-        self.narrow_predicate = build_narrow_predicate(modern_narrow)
+        # Queues with the same narrow (e.g. many users' mobile clients)
+        # share a single compiled predicate.
+        self.narrow_predicate = get_narrow_predicate(narrow)
         self.bulk_message_deletion = bulk_message_deletion
         self.stream_typing_notifications = stream_typing_notifications
         self.user_settings_object = user_settings_object
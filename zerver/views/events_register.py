@@ -53,6 +53,7 @@ def events_register_backend(
     queue_lifespan_secs: Annotated[
         Json[int], ApiParamConfig(documentation_status=DocumentationStatus.DOCUMENTATION_PENDING)
     ] = 0,
+    section_versions: Json[dict[str, str]] | None = None,
     slim_presence: Json[bool] = False,
 ) -> HttpResponse:
     if narrow is None:
@@ -132,5 +133,7 @@ def events_register_backend(
         fetch_event_types=fetch_event_types,
         spectator_requested_language=spectator_requested_language,
         pronouns_field_type_supported=pronouns_field_type_supported,
+        section_versions=section_versions,
+        use_realm_users_snapshot=True,
     )
     return json_success(request, data=ret)
@@ -5,7 +5,9 @@ from django.utils.crypto import get_random_string
 from django.utils.translation import gettext as _
 from pika import BlockingConnection
 
+from zerver.decorator import internal_api_view
 from zerver.lib.cache import cache_delete, cache_get, cache_set
+from zerver.lib.cache_stats import get_cache_stats
 from zerver.lib.exceptions import ServerNotReadyError
 from zerver.lib.queue import get_queue_client
 from zerver.lib.redis_utils import get_redis_client
@@ -65,3 +67,8 @@ def health(request: HttpRequest) -> HttpResponse:
     check_memcached()
 
     return json_success(request)
+
+
+@internal_api_view(False)
+def cache_stats(request: HttpRequest) -> HttpResponse:
+    return json_success(request, {"cache_stats": get_cache_stats()})
@@ -6,8 +6,8 @@ from django.contrib.auth.models import AnonymousUser
 from django.db import connection, transaction
 from django.http import HttpRequest, HttpResponse
 from django.utils.translation import gettext as _
-from pydantic import Json, NonNegativeInt
-from sqlalchemy.sql import column, func
+from pydantic import BaseModel, Json, NonNegativeInt
+from sqlalchemy.sql import column, func, select, table
 from sqlalchemy.types import Integer, Text
 
 from zerver.context_processors import get_valid_realm_from_request
@@ -18,25 +18,33 @@ from zerver.lib.exceptions import (
 )
 from zerver.lib.message import get_first_visible_message_id, messages_for_ids
 from zerver.lib.narrow import (
+    FetchedMessages,
+    MutingConditionsCache,
+    NarrowBuilder,
     NarrowParameter,
     add_narrow_conditions,
     clean_narrow_for_message_fetch,
     fetch_messages,
     get_base_query_for_search,
+    get_search_operand,
     is_spectator_compatible,
     is_web_public_narrow,
+    make_narrow_cursor,
     parse_anchor_value,
+    parse_narrow_cursor,
     update_narrow_terms_containing_empty_topic_fallback_name,
 )
 from zerver.lib.request import RequestNotes
 from zerver.lib.response import json_success
+from zerver.lib.search_index import search_messages
 from zerver.lib.sqlalchemy_utils import get_sqlalchemy_connection
 from zerver.lib.topic import MATCH_TOPIC
 from zerver.lib.topic_sqlalchemy import topic_column_sa
 from zerver.lib.typed_endpoint import ApiParamConfig, typed_endpoint
-from zerver.models import UserMessage, UserProfile
+from zerver.models import Realm, UserMessage, UserProfile
 
 MAX_MESSAGES_PER_FETCH = 5000
+MAX_NARROWS_PER_FETCH = 10
 
 
 def highlight_string(text: str, locs: Iterable[tuple[int, int]]) -> str:
@@ -88,6 +96,49 @@ def get_search_fields(
     }
 
 
+def get_search_fields_for_messages(
+    realm: Realm, narrow: list[NarrowParameter], message_ids: list[int]
+) -> dict[int, dict[str, str]]:
+    """Highlights the search matches in messages found by the narrow.
+    This is done in one pass over just the messages being returned,
+    rather than as part of the search query, where it would be done
+    for every message the query considers."""
+    search_operand = get_search_operand(narrow)
+    query = (
+        select(
+            column("id", Integer).label("message_id"),
+            func.escape_html(topic_column_sa(), type_=Text).label("escaped_topic_name"),
+            column("rendered_content", Text),
+        )
+        .select_from(table("zerver_message"))
+        .where(column("realm_id", Integer) == realm.id, column("id", Integer).in_(message_ids))
+    )
+
+    index_matches = None
+    if settings.SEARCH_INDEX_PATH is not None:
+        matches = search_messages(realm.id, search_operand, message_ids=message_ids)
+        if matches is not None:
+            index_matches = {
+                match.message_id: (match.content_matches, match.topic_matches) for match in matches
+            }
+    if index_matches is None:
+        builder = NarrowBuilder(None, column("id", Integer), realm)
+        query = builder.add_term(query, NarrowParameter(operator="search", operand=search_operand))
+
+    search_fields = {}
+    with get_sqlalchemy_connection() as sa_conn:
+        for row in sa_conn.execute(query).mappings():
+            message_id = row["message_id"]
+            if index_matches is not None:
+                content_matches, topic_matches = index_matches.get(message_id, ([], []))
+            else:
+                content_matches, topic_matches = row["content_matches"], row["topic_matches"]
+            search_fields[message_id] = get_search_fields(
+                row["rendered_content"], row["escaped_topic_name"], content_matches, topic_matches
+            )
+    return search_fields
+
+
 def clean_narrow_for_web_public_api(
     narrow: list[NarrowParameter] | None,
 ) -> list[NarrowParameter] | None:
@@ -104,6 +155,47 @@ def clean_narrow_for_web_public_api(
     ]
 
 
+def get_user_message_flags(
+    query_info: FetchedMessages, user_profile: UserProfile | None, is_web_public_query: bool
+) -> tuple[list[int], dict[int, list[str]]]:
+    # The following is a little messy, but ensures that the code paths
+    # are similar regardless of the value of include_history.  The
+    # 'user_message_flags' dictionary maps each message to the user's
+    # flags for that message, which we will attach to the rendered
+    # message dict before returning it.  We attempt to bulk-fetch
+    # rendered message dicts from remote cache using the
+    # 'result_message_ids' list.
+    rows = query_info.rows
+    result_message_ids: list[int] = []
+    user_message_flags: dict[int, list[str]] = {}
+    if is_web_public_query:
+        # For spectators, we treat all historical messages as read.
+        for row in rows:
+            message_id = row[0]
+            result_message_ids.append(message_id)
+            user_message_flags[message_id] = ["read"]
+    elif query_info.include_history:
+        assert user_profile is not None
+        result_message_ids = [row[0] for row in rows]
+
+        # TODO: This could be done with an outer join instead of two queries
+        um_rows = UserMessage.objects.filter(
+            user_profile=user_profile, message_id__in=result_message_ids
+        )
+        user_message_flags = {um.message_id: um.flags_list() for um in um_rows}
+
+        for message_id in result_message_ids:
+            if message_id not in user_message_flags:
+                user_message_flags[message_id] = ["read", "historical"]
+    else:
+        for row in rows:
+            message_id = row[0]
+            flags = row[1]
+            user_message_flags[message_id] = UserMessage.flags_list_for_flags(flags)
+            result_message_ids.append(message_id)
+    return result_message_ids, user_message_flags
+
+
 @typed_endpoint
 def get_messages_backend(
     request: HttpRequest,
@@ -116,7 +208,10 @@ def get_messages_backend(
     client_requested_message_ids: Annotated[
         Json[list[NonNegativeInt] | None], ApiParamConfig("message_ids")
     ] = None,
+    cursor: str | None = None,
     include_anchor: Json[bool] = True,
+    include_cursors: Json[bool] = False,
+    include_search_highlights: Json[bool] = True,
     narrow: Json[list[NarrowParameter] | None] = None,
     num_after: Json[NonNegativeInt] = 0,
     num_before: Json[NonNegativeInt] = 0,
@@ -141,12 +236,35 @@ def get_messages_backend(
     elif client_requested_message_ids is not None:
         include_anchor = False
 
-    anchor = None
-    if client_requested_message_ids is None:
-        anchor = parse_anchor_value(anchor_val, use_first_unread_anchor_val)
-
     realm = get_valid_realm_from_request(request)
-    narrow = clean_narrow_for_message_fetch(narrow, realm, maybe_user_profile)
+    anchor = None
+    if cursor is not None:
+        # A cursor replaces the narrow and anchor of a previous
+        # request, continuing it in one direction.
+        if (
+            anchor_val is not None
+            or use_first_unread_anchor_val
+            or narrow is not None
+            or client_requested_message_ids is not None
+        ):
+            raise IncompatibleParametersError(
+                ["cursor", "anchor", "use_first_unread_anchor", "narrow", "message_ids"]
+            )
+        narrow_cursor = parse_narrow_cursor(
+            cursor,
+            maybe_user_profile if isinstance(maybe_user_profile, UserProfile) else None,
+            realm,
+        )
+        if (num_after if narrow_cursor.older else num_before) > 0:
+            raise JsonableError(_("This cursor can only fetch messages in one direction"))
+        narrow = narrow_cursor.narrow
+        anchor = narrow_cursor.anchor
+        include_anchor = False
+        include_cursors = True
+    else:
+        if client_requested_message_ids is None:
+            anchor = parse_anchor_value(anchor_val, use_first_unread_anchor_val)
+        narrow = clean_narrow_for_message_fetch(narrow, realm, maybe_user_profile)
 
     num_of_messages_requested = num_before + num_after
     if client_requested_message_ids is not None:
@@ -234,8 +352,8 @@ def get_messages_backend(
         # outer transaction for each test.  We thus skip this command
         # in tests, since it would fail.
         if not settings.TEST_SUITE:  # nocoverage
-            cursor = connection.cursor()
-            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            db_cursor = connection.cursor()
+            db_cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
 
         query_info = fetch_messages(
             narrow=narrow,
@@ -247,56 +365,21 @@ def get_messages_backend(
             num_before=num_before,
             num_after=num_after,
             client_requested_message_ids=client_requested_message_ids,
+            use_narrow_query_cache=include_cursors,
         )
 
         anchor = query_info.anchor
-        include_history = query_info.include_history
         is_search = query_info.is_search
         rows = query_info.rows
 
-        # The following is a little messy, but ensures that the code paths
-        # are similar regardless of the value of include_history.  The
-        # 'user_messages' dictionary maps each message to the user's
-        # UserMessage object for that message, which we will attach to the
-        # rendered message dict before returning it.  We attempt to
-        # bulk-fetch rendered message dicts from remote cache using the
-        # 'messages' list.
-        result_message_ids: list[int] = []
-        user_message_flags: dict[int, list[str]] = {}
-        if is_web_public_query:
-            # For spectators, we treat all historical messages as read.
-            for row in rows:
-                message_id = row[0]
-                result_message_ids.append(message_id)
-                user_message_flags[message_id] = ["read"]
-        elif include_history:
-            assert user_profile is not None
-            result_message_ids = [row[0] for row in rows]
-
-            # TODO: This could be done with an outer join instead of two queries
-            um_rows = UserMessage.objects.filter(
-                user_profile=user_profile, message_id__in=result_message_ids
-            )
-            user_message_flags = {um.message_id: um.flags_list() for um in um_rows}
-
-            for message_id in result_message_ids:
-                if message_id not in user_message_flags:
-                    user_message_flags[message_id] = ["read", "historical"]
-        else:
-            for row in rows:
-                message_id = row[0]
-                flags = row[1]
-                user_message_flags[message_id] = UserMessage.flags_list_for_flags(flags)
-                result_message_ids.append(message_id)
+        result_message_ids, user_message_flags = get_user_message_flags(
+            query_info, user_profile, is_web_public_query
+        )
 
         search_fields: dict[int, dict[str, str]] = {}
-        if is_search:
-            for row in rows:
-                message_id = row[0]
-                (escaped_topic_name, rendered_content, content_matches, topic_matches) = row[-4:]
-                search_fields[message_id] = get_search_fields(
-                    rendered_content, escaped_topic_name, content_matches, topic_matches
-                )
+        if is_search and include_search_highlights and result_message_ids:
+            assert narrow is not None
+            search_fields = get_search_fields_for_messages(realm, narrow, result_message_ids)
 
         message_list = messages_for_ids(
             message_ids=result_message_ids,
@@ -308,6 +391,7 @@ def get_messages_backend(
             message_edit_history_visibility_policy=realm.message_edit_history_visibility_policy,
             user_profile=user_profile,
             realm=realm,
+            raw_content=True,
         )
 
     if client_requested_message_ids is not None:
@@ -331,10 +415,137 @@ def get_messages_backend(
             history_limited=query_info.history_limited,
             anchor=anchor,
         )
+        if include_cursors and rows:
+            if num_before > 0 and not query_info.found_oldest:
+                ret["older_cursor"] = make_narrow_cursor(
+                    narrow, user_profile, realm, anchor=rows[0][0], older=True
+                )
+            if num_after > 0 and not query_info.found_newest:
+                ret["newer_cursor"] = make_narrow_cursor(
+                    narrow, user_profile, realm, anchor=rows[-1][0], older=False
+                )
 
     return json_success(request, data=ret)
 
 
+class NarrowFetchParameter(BaseModel):
+    narrow: list[NarrowParameter] = []
+    anchor: str | None = None
+    include_anchor: bool = True
+    num_before: NonNegativeInt = 0
+    num_after: NonNegativeInt = 0
+
+
+@typed_endpoint
+def get_messages_for_narrows_backend(
+    request: HttpRequest,
+    user_profile: UserProfile,
+    *,
+    allow_empty_topic_name: Json[bool] = False,
+    apply_markdown: Json[bool] = True,
+    client_gravatar: Json[bool] = True,
+    include_search_highlights: Json[bool] = True,
+    narrows: Json[list[NarrowFetchParameter]],
+) -> HttpResponse:
+    """Fetches messages from several narrows at once, like a series of
+    GET /messages requests, for clients loading their initial views.
+    The narrows share a single transaction, the user's muting
+    conditions, and the fetching of the message dicts."""
+    if len(narrows) > MAX_NARROWS_PER_FETCH:
+        raise JsonableError(
+            _("Too many narrows requested (maximum {max_narrows}).").format(
+                max_narrows=MAX_NARROWS_PER_FETCH,
+            )
+        )
+    if sum(fetch.num_before + fetch.num_after for fetch in narrows) > MAX_MESSAGES_PER_FETCH:
+        raise JsonableError(
+            _("Too many messages requested (maximum {max_messages}).").format(
+                max_messages=MAX_MESSAGES_PER_FETCH,
+            )
+        )
+    for fetch in narrows:
+        if fetch.num_before > 0 and fetch.num_after > 0 and not fetch.include_anchor:
+            raise JsonableError(_("The anchor can only be excluded at an end of the range"))
+
+    realm = user_profile.realm
+    cleaned_narrows = [
+        clean_narrow_for_message_fetch(fetch.narrow, realm, user_profile) for fetch in narrows
+    ]
+    anchors = [parse_anchor_value(fetch.anchor, use_first_unread_anchor=False) for fetch in narrows]
+
+    muting_conditions_cache: MutingConditionsCache = {}
+    with transaction.atomic(durable=True):
+        # See the comment in get_messages_backend.
+        if not settings.TEST_SUITE:  # nocoverage
+            cursor = connection.cursor()
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+        results = []
+        user_message_flags: dict[int, list[str]] = {}
+        search_fields: dict[int, dict[int, dict[str, str]]] = {}
+        for i, (fetch, narrow, anchor) in enumerate(
+            zip(narrows, cleaned_narrows, anchors, strict=True)
+        ):
+            query_info = fetch_messages(
+                narrow=narrow,
+                user_profile=user_profile,
+                realm=realm,
+                is_web_public_query=False,
+                anchor=anchor,
+                include_anchor=fetch.include_anchor,
+                num_before=fetch.num_before,
+                num_after=fetch.num_after,
+                muting_conditions_cache=muting_conditions_cache,
+            )
+            result_message_ids, flags = get_user_message_flags(
+                query_info, user_profile, is_web_public_query=False
+            )
+            user_message_flags.update(flags)
+            if query_info.is_search and include_search_highlights and result_message_ids:
+                assert narrow is not None
+                search_fields[i] = get_search_fields_for_messages(realm, narrow, result_message_ids)
+            results.append((query_info, result_message_ids))
+
+        # Messages often appear in several of the narrows (e.g. a
+        # recent mention is also in the home view), so each is only
+        # fetched and rendered once.
+        message_ids = sorted(user_message_flags)
+        message_list = messages_for_ids(
+            message_ids=message_ids,
+            user_message_flags=user_message_flags,
+            search_fields={},
+            apply_markdown=apply_markdown,
+            client_gravatar=client_gravatar,
+            allow_empty_topic_name=allow_empty_topic_name,
+            message_edit_history_visibility_policy=realm.message_edit_history_visibility_policy,
+            user_profile=user_profile,
+            realm=realm,
+            raw_content=True,
+        )
+    messages_by_id = dict(zip(message_ids, message_list, strict=True))
+
+    narrow_results = []
+    for i, (query_info, result_message_ids) in enumerate(results):
+        narrow_search_fields = search_fields.get(i, {})
+        narrow_results.append(
+            dict(
+                messages=[
+                    {**messages_by_id[message_id], **narrow_search_fields[message_id]}
+                    if message_id in narrow_search_fields
+                    else messages_by_id[message_id]
+                    for message_id in result_message_ids
+                ],
+                found_anchor=query_info.found_anchor,
+                found_oldest=query_info.found_oldest,
+                found_newest=query_info.found_newest,
+                history_limited=query_info.history_limited,
+                anchor=query_info.anchor,
+            )
+        )
+
+    return json_success(request, data={"results": narrow_results})
+
+
 @typed_endpoint
 def messages_in_narrow_backend(
     request: HttpRequest,
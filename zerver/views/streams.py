@@ -60,6 +60,7 @@ from zerver.lib.exceptions import (
     JsonableError,
     OrganizationOwnerRequiredError,
 )
+from zerver.lib.markdown import prefetch_mention_data
 from zerver.lib.mention import MentionBackend, silent_mention_syntax_for_user
 from zerver.lib.message import bulk_access_stream_messages_query
 from zerver.lib.response import json_success
@@ -1061,7 +1062,7 @@ def send_user_subscribed_and_new_channel_notifications(
         newly_created_stream_names = {s.name for s in created_streams}
 
         realm = user_profile.realm
-        mention_backend = MentionBackend(realm.id)
+        notification_messages: list[tuple[UserProfile, UserProfile, str]] = []
         for id, subscribed_stream_names in new_subscriptions.items():
             if id == str(user_profile.id):
                 # Don't send a notification DM if you subscribed yourself.
@@ -1085,8 +1086,19 @@ def send_user_subscribed_and_new_channel_notifications(
                 recipient_user=recipient_user,
                 stream_names=notify_stream_names,
             )
-
-            notifications.append(
+            notification_messages.append((sender, recipient_user, msg))
+
+        if notification_messages:
+            # All of these messages are sent by the notification bot,
+            # so we can resolve the channels they link to in bulk.
+            mention_backend = MentionBackend(realm.id)
+            prefetch_mention_data(
+                mention_backend,
+                [msg for sender, recipient_user, msg in notification_messages],
+                message_sender=notification_messages[0][0],
+                acting_user=user_profile,
+            )
+            notifications.extend(
                 internal_prep_private_message(
                     sender=sender,
                     recipient_user=recipient_user,
@@ -1094,6 +1106,7 @@ def send_user_subscribed_and_new_channel_notifications(
                     mention_backend=mention_backend,
                     acting_user=user_profile,
                 )
+                for sender, recipient_user, msg in notification_messages
             )
 
     # Send notification if a new channel was created with the "announce" option.
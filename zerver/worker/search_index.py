@@ -0,0 +1,19 @@
+# Documented in https://zulip.readthedocs.io/en/latest/subsystems/queuing.html
+from typing import Any
+
+from typing_extensions import override
+
+from zerver.lib.search_index import update_search_index
+from zerver.worker.base import LoopQueueProcessingWorker, assign_queue
+
+
+@assign_queue("search_index")
+class SearchIndexWorker(LoopQueueProcessingWorker):
+    """Keeps the local search index (see zerver/lib/search_index.py)
+    up to date.  Since each event just names messages to reindex,
+    a backlog of events is deduplicated into a single update."""
+
+    @override
+    def consume_batch(self, events: list[dict[str, Any]]) -> None:
+        message_ids = {message_id for event in events for message_id in event["message_ids"]}
+        update_search_index(message_ids)
@@ -0,0 +1,94 @@
+from typing import Any
+
+import orjson
+from django.core.management.base import CommandError, CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.markdown.benchmark import (
+    Baseline,
+    build_benchmark_corpus,
+    find_regressions,
+    result_to_baseline,
+    run_markdown_benchmark,
+)
+from zerver.models import Stream, UserProfile
+
+
+class Command(ZulipBaseCommand):
+    help = """
+    Benchmark Markdown rendering against a fixed corpus of rendering-heavy
+    messages, reporting per-processor timings and allocations.
+
+    Usage: ./manage.py benchmark_markdown -r zulip --save-baseline=var/markdown-baseline.json
+           ./manage.py benchmark_markdown -r zulip --baseline=var/markdown-baseline.json
+    """
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument(
+            "--iterations", type=int, default=5, help="Number of times to render each message"
+        )
+        parser.add_argument("--baseline", help="Compare against the baseline in this file")
+        parser.add_argument("--save-baseline", help="Save the results as a baseline to this file")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Fractional slowdown compared to the baseline that counts as a regression",
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None  # Should be ensured by parser
+
+        users = UserProfile.objects.filter(realm=realm, is_active=True, is_bot=False).order_by(
+            "id"
+        )[:20]
+        if not users:
+            raise CommandError("The realm has no active users to render messages as.")
+        sender = users[0]
+        stream_names = list(
+            Stream.objects.filter(realm=realm, deactivated=False)
+            .order_by("id")
+            .values_list("name", flat=True)[:20]
+        )
+        corpus = build_benchmark_corpus([user.full_name for user in users], stream_names)
+
+        result = run_markdown_benchmark(realm, sender, corpus, iterations=options["iterations"])
+        current = result_to_baseline(result)
+
+        self.stdout.write(f"{'case':<40} {'length':>8} {'median ms':>10} {'peak KiB':>10}")
+        for name, case in result.cases.items():
+            self.stdout.write(
+                f"{name:<40} {case.content_length:>8} {case.median_time * 1000:>10.2f}"
+                f" {case.peak_bytes / 1024:>10.1f}"
+            )
+        self.stdout.write("")
+        self.stdout.write(f"{'processor':<40} {'calls':>8} {'ms/iter':>10} {'alloc KiB':>10}")
+        for name, stats in sorted(
+            result.processors.items(), key=lambda item: item[1].time, reverse=True
+        ):
+            self.stdout.write(
+                f"{name:<40} {stats.calls // result.iterations:>8}"
+                f" {current['processors'][name]['time_ms']:>10.2f}"
+                f" {stats.allocated_bytes / 1024:>10.1f}"
+            )
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "wb") as f:
+                f.write(orjson.dumps(current, option=orjson.OPT_INDENT_2))
+            self.stdout.write(f"Baseline saved to {options['save_baseline']}")
+
+        if options["baseline"]:
+            with open(options["baseline"], "rb") as f:
+                baseline: Baseline = orjson.loads(f.read())
+            regressions = find_regressions(current, baseline, threshold=options["threshold"])
+            if regressions:
+                raise CommandError(
+                    "Markdown rendering regressions compared to the baseline:\n"
+                    + "\n".join(regressions)
+                )
+            self.stdout.write("No regressions compared to the baseline.")
@@ -48,7 +48,10 @@ from .configured_settings import (
     PUSH_NOTIFICATION_BOUNCER_URL,
     RATE_LIMITING_RULES,
     REALM_HOSTS,
+    REDIS_CACHE_CLIENT_CACHE_SIZE,
+    REDIS_CACHE_LOCATION,
     REGISTER_LINK_DISABLED,
+    REMOTE_CACHE_BACKEND,
     REMOTE_POSTGRES_HOST,
     REMOTE_POSTGRES_PORT,
     REMOTE_POSTGRES_SSLMODE,
@@ -437,6 +440,16 @@ CACHES: dict[str, dict[str, object]] = {
     },
 }
 
+if REMOTE_CACHE_BACKEND == "redis":
+    CACHES["default"] = {
+        "BACKEND": "zerver.lib.redis_cache.SingletonRedisCache",
+        "LOCATION": REDIS_CACHE_LOCATION,
+        "OPTIONS": {
+            "password": get_secret("redis_cache_password"),
+            "client_cache_size": REDIS_CACHE_CLIENT_CACHE_SIZE,
+        },
+    }
+
 ########################################################################
 # REDIS-BASED RATE LIMITING CONFIGURATION
 ########################################################################
@@ -198,6 +198,24 @@ KATEX_SERVER = get_config("application_server", "katex_server", True)
 KATEX_SERVER_PORT = get_config("application_server", "katex_server_port", "9700")
 MEMCACHED_LOCATION = "127.0.0.1:11211"
 MEMCACHED_USERNAME = None if get_secret("memcached_password") is None else "zulip@localhost"
+# Cache key families (e.g. "user_profile_by_api_key") to also cache in
+# each server process's memory, mapped to the number of seconds an
+# entry may be reused for.  Changes are seen by other processes within
+# about a second; this is only worth it for rarely-changing objects.
+# Display recipients are needed for nearly every message fetched.
+LOCAL_CACHE_TTLS: dict[str, int] = {
+    "display_recipient_dict": 3600,
+    "single_user_display_recipient": 3600,
+}
+# Set to "redis" to use Redis, rather than memcached, for the remote
+# cache.  REDIS_CACHE_LOCATION should be a separate Redis server from
+# the one used for rate limiting, with a maxmemory-policy of
+# allkeys-lru, so that it evicts cached values as memcached does.
+REMOTE_CACHE_BACKEND = "memcached"
+REDIS_CACHE_LOCATION = "redis://127.0.0.1:6380/0"
+# With the Redis cache, how many values each process keeps in memory,
+# invalidated by the Redis server when they change; 0 to disable.
+REDIS_CACHE_CLIENT_CACHE_SIZE = 0
 RABBITMQ_HOST = "127.0.0.1"
 RABBITMQ_PORT = 5672
 RABBITMQ_VHOST = "/"
@@ -441,6 +459,11 @@ REALM_MOBILE_REMAP_URIS: dict[str, str] = {}
 # testing.
 USING_PGROONGA = False
 
+# If set, full-text search uses a local search index stored at this
+# path, maintained by the search_index queue worker, rather than
+# PostgreSQL; see zerver/lib/search_index.py.
+SEARCH_INDEX_PATH: str | None = None
+
 # How Django should send emails.  Set for most contexts in settings.py, but
 # available for sysadmin override in unusual cases.
 EMAIL_BACKEND: str | None = None
@@ -653,6 +676,14 @@ OUTGOING_WEBHOOK_TIMEOUT_SECONDS = 10
 # See: `_internal_prep_message` function in zerver/actions/message_send.py.
 MAX_MESSAGE_LENGTH = 10000
 
+# Number of subprocesses each server process may use to render
+# Markdown, killing any render that takes too long; see
+# zerver/lib/render_pool.py.  With 0, renders run in a thread of the
+# server process instead.
+MARKDOWN_RENDER_POOL_SIZE = 0
+# Seconds of CPU time a single render in such a subprocess may use.
+MARKDOWN_RENDER_CPU_LIMIT_SECONDS = 5
+
 # Maximum length of note text for a reminder.
 # NOTE: Keep it significantly smaller than MAX_MESSAGE_LENGTH
 # to avoid message being completely truncated when reminder is sent.
@@ -652,6 +652,16 @@ SOCIAL_AUTH_SAML_SUPPORT_CONTACT = {
 ## To authenticate to memcached, set memcached_password in zulip-secrets.conf,
 ## and optionally change the default username "zulip@localhost" here.
 # MEMCACHED_USERNAME = "zulip@localhost"
+##
+## Alternatively, Zulip can use Redis as its cache, by setting
+## REMOTE_CACHE_BACKEND to "redis".  Use a separate Redis server from
+## the one above, configured with "maxmemory-policy allkeys-lru"; if it
+## requires a password, set redis_cache_password in zulip-secrets.conf.
+# REMOTE_CACHE_BACKEND = "redis"
+# REDIS_CACHE_LOCATION = "redis://127.0.0.1:6380/0"
+## To keep frequently-used values in each server process's memory as
+## well, invalidated by Redis when they change, set a size here.
+# REDIS_CACHE_CLIENT_CACHE_SIZE = 10000
 
 
 ################
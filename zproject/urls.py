@@ -65,7 +65,7 @@ from zerver.views.digest import digest_page
 from zerver.views.documentation import IntegrationView, MarkdownDirectoryView, integration_doc
 from zerver.views.drafts import create_drafts, delete_draft, edit_draft, fetch_drafts
 from zerver.views.events_register import events_register_backend
-from zerver.views.health import health
+from zerver.views.health import cache_stats, health
 from zerver.views.home import accounts_accept_terms, desktop_home, doc_permalinks_view, home
 from zerver.views.invite import (
     generate_multiuse_invite_backend,
@@ -81,7 +81,11 @@ from zerver.views.message_edit import (
     json_fetch_raw_message,
     update_message_backend,
 )
-from zerver.views.message_fetch import get_messages_backend, messages_in_narrow_backend
+from zerver.views.message_fetch import (
+    get_messages_backend,
+    get_messages_for_narrows_backend,
+    messages_in_narrow_backend,
+)
 from zerver.views.message_flags import (
     mark_all_as_read,
     mark_stream_as_read,
@@ -423,6 +427,7 @@ v1_api_and_json_patterns = [
             {"intentionally_undocumented"},
         ),
     ),
+    rest_path("messages/narrows", GET=get_messages_for_narrows_backend),
     rest_path("messages/render", POST=render_message_backend),
     rest_path("messages/flags", POST=update_message_flags),
     rest_path("messages/flags/narrow", POST=update_message_flags_for_narrow),
@@ -855,6 +860,7 @@ urls += [
     path("api/internal/notify_tornado", notify),
     path("api/internal/tusd", handle_tusd_hook),
     path("api/internal/web_reload_clients", web_reload_clients),
+    path("api/internal/cache_stats", cache_stats),
     path("api/v1/events/internal", get_events_internal),
 ]
 